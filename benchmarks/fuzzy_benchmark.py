@@ -0,0 +1,83 @@
+"""
+Compare the DP-row and bit-parallel fuzzy search engines.
+
+Builds a synthetic vocabulary around the demo keywords and scans a text made
+of post6_defect.txt-style OCR damage with suggest_for_text, whose top-k
+lookups go through the selected engine, checking that both agree. The
+bit-parallel engine only handles unit costs, so both engines run with the
+single-character confusables.
+Usage: python -m benchmarks.fuzzy_benchmark [--words 50000] [--repeat 20]
+"""
+import argparse
+import random
+import time
+
+from helpers.file_io import FileIO
+from processors.trie_processor import TrieProcessor
+from processors.fuzzy_search import TrieFuzzySearcher, default_confusables
+from benchmarks.workload import add_ocr_damage
+
+def build_vocabulary(trie_processor, keywords, n_words, seed=0):
+  # Demo keywords plus random pronounceable words up to n_words entries
+  FileIO.load_keywords(keywords, trie_processor)
+  rng = random.Random(seed)
+  syllables = ['ba', 'ri', 'to', 'ne', 'sh', 'ar', 'el', 'mo', 'un', 'st', 'le', 'in', 'ow', 'er']
+  while trie_processor.trie.total_words < n_words:
+    word = ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 5)))
+    trie_processor.add_word(word, rng.randint(1, 50))
+
+def build_text(trie_processor, repeat, seed=0):
+  # Lines of known words with roughly one damaged token in five
+  rng = random.Random(seed)
+  words = [w for w, _ in trie_processor.get_all_words()]
+  lines = []
+  for _ in range(repeat * 16):
+    line = []
+    for _ in range(12):
+      w = rng.choice(words)
+      if rng.random() < 0.2:
+        w = add_ocr_damage(w, rng)
+      line.append(w)
+    lines.append(' '.join(line) + '.')
+  return '\n'.join(lines)
+
+def run(keywords='data/demo/my_keywords_demo.txt', n_words=50000, repeat=20, max_dists=(1, 2)):
+  tp = TrieProcessor()
+  build_vocabulary(tp, keywords, n_words)
+  text = build_text(tp, repeat)
+  single_char = {a: [b for b in targets if len(b) == 1]
+                 for a, targets in default_confusables().items() if len(a) == 1}
+  rows = []
+  for max_dist in max_dists:
+    outputs = {}
+    for engine in ('dp', 'bitparallel'):
+      searcher = TrieFuzzySearcher(tp, confusables=single_char, engine=engine)
+      start = time.perf_counter()
+      outputs[engine] = searcher.suggest_for_text(text, max_dist=max_dist)
+      elapsed = time.perf_counter() - start
+      rows.append({'engine': engine, 'max_dist': max_dist, 'seconds': elapsed,
+                   'tokens': len(outputs[engine])})
+    if outputs['dp'] != outputs['bitparallel']:
+      raise AssertionError(f"Engines disagree at max_dist={max_dist}")
+  return rows
+
+def print_report(rows):
+  print(f"{'Engine':12} | {'MaxDist':7} | {'Suggested':9} | {'Seconds':9} | {'Speedup':7}")
+  print("-" * 56)
+  baseline = {}
+  for r in rows:
+    if r['engine'] == 'dp':
+      baseline[r['max_dist']] = r['seconds']
+    speedup = baseline[r['max_dist']] / r['seconds'] if r['seconds'] else float('inf')
+    print(f"{r['engine']:12} | {r['max_dist']:7} | {r['tokens']:9} | {r['seconds']:9.3f} | {speedup:6.2f}x")
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--keywords', default='data/demo/my_keywords_demo.txt')
+  parser.add_argument('--words', type=int, default=50000)
+  parser.add_argument('--repeat', type=int, default=20)
+  args = parser.parse_args(argv)
+  print_report(run(args.keywords, args.words, args.repeat))
+
+if __name__ == '__main__':
+  main()
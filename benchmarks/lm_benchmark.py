@@ -0,0 +1,86 @@
+"""
+Compare the bigram model with the higher-order backoff model.
+
+Reports model size on disk, load time and choose_best throughput.
+Usage: python -m benchmarks.lm_benchmark CORPUS [--order 3] [--max-bytes N]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from models.language_model import NGramLanguageModel, BackoffNGramModel
+
+def _scoring_workload(tokens, n_queries, n_candidates, context, seed=0):
+  # (candidates, left, right) triples drawn from the corpus itself
+  rng = random.Random(seed)
+  vocab = sorted(set(tokens))
+  queries = []
+  for _ in range(n_queries):
+    i = rng.randrange(context, len(tokens) - context)
+    cands = [tokens[i]] + rng.sample(vocab, min(n_candidates - 1, len(vocab)))
+    left = tuple(tokens[i - context:i])
+    right = tuple(tokens[i + 1:i + 1 + context])
+    queries.append((cands, left, right))
+  return queries
+
+def _time_scoring(lm, queries, multi_word):
+  start = time.perf_counter()
+  for cands, left, right in queries:
+    if multi_word:
+      lm.choose_best(cands, left, right)
+    else:
+      lm.choose_best(cands, left[-1], right[0])
+  elapsed = time.perf_counter() - start
+  return len(queries) / elapsed if elapsed > 0 else float('inf')
+
+def run(corpus, order=3, max_bytes=None, min_count=1, n_queries=2000, n_candidates=5):
+  with open(corpus, 'r', encoding='utf-8') as f:
+    tokens = NGramLanguageModel()._tokenize(f.read())
+  queries = _scoring_workload(tokens, n_queries, n_candidates, order - 1)
+  rows = []
+  with tempfile.TemporaryDirectory() as tmp:
+    for name, build, loader, multi_word in (
+      ('bigram', lambda: NGramLanguageModel(), NGramLanguageModel.load, False),
+      (f'backoff-{order}', lambda: BackoffNGramModel(order=order, min_count=min_count, max_bytes=max_bytes),
+       BackoffNGramModel.load, True),
+    ):
+      start = time.perf_counter()
+      lm = build()
+      lm.fit_from_file(corpus)
+      fit_time = time.perf_counter() - start
+
+      path = os.path.join(tmp, f"{name}.bin")
+      lm.save(path)
+      start = time.perf_counter()
+      loaded = loader(path)
+      load_time = time.perf_counter() - start
+
+      rows.append({
+        'model': name,
+        'fit_s': fit_time,
+        'size_bytes': os.path.getsize(path),
+        'load_s': load_time,
+        'queries_per_s': _time_scoring(loaded, queries, multi_word),
+      })
+  return rows
+
+def print_report(rows):
+  print(f"{'Model':14} | {'Fit (s)':9} | {'Size (bytes)':13} | {'Load (ms)':9} | {'Queries/s':10}")
+  print("-" * 68)
+  for r in rows:
+    print(f"{r['model']:14} | {r['fit_s']:9.3f} | {r['size_bytes']:13} | {r['load_s'] * 1000:9.3f} | {r['queries_per_s']:10.0f}")
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('corpus')
+  parser.add_argument('--order', type=int, default=3)
+  parser.add_argument('--max-bytes', type=int, default=None)
+  parser.add_argument('--min-count', type=int, default=1)
+  parser.add_argument('--queries', type=int, default=2000)
+  args = parser.parse_args(argv)
+  print_report(run(args.corpus, args.order, args.max_bytes, args.min_count, args.queries))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,205 @@
+"""
+End-to-end benchmark suite on synthetic Zipf vocabularies.
+
+For each vocabulary size, times load_keywords, find_matches, restore_text in
+'best' and 'all' modes, restore_text_with_context, fuzzy search_word and
+BatchRestorer.restore_folder, and writes the timings to JSON together with
+each trie's TrieProcessor.stats() shape and memory report. Each metric is
+the best of --repeat runs after --warmup untimed ones, the statistic least
+disturbed by other load on the machine; baselines store the same. With
+--baseline, every metric is compared against a saved run and the exit code
+is 1 if any got slower than its regression threshold allows.
+Usage: python -m benchmarks.suite [--sizes 10000 100000] [--out results.json]
+                                  [--baseline baseline.json] [--save-baseline]
+                                  [--repeat 5] [--warmup 1]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from benchmarks import workload
+from helpers.file_io import FileIO
+from processors.batch_restorer import BatchRestorer
+from processors.text_processor import TextProcessor
+from processors.trie_processor import TrieProcessor
+
+# Allowed slowdown against the baseline before a metric counts as a regression
+DEFAULT_THRESHOLD = 0.25
+# Slowdowns smaller than this many seconds are timer noise, never regressions
+MIN_DELTA = 0.005
+DEFAULT_REPEAT = 5
+DEFAULT_WARMUP = 1
+
+def _timed(fn, *args, repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP, **kwargs):
+  # Best of repeat timed calls after warmup untimed ones; returns (seconds, last result)
+  for _ in range(warmup):
+    fn(*args, **kwargs)
+  best = float('inf')
+  for _ in range(max(1, repeat)):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    best = min(best, time.perf_counter() - start)
+  return best, result
+
+def run_size(n_words, tmp, n_docs=5, wildcard_density=0.1, ocr_noise=0.05, n_patterns=2000, seed=0,
+             repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP):
+  """Time every operation on one vocabulary size; returns ({operation: seconds}, trie stats)."""
+  from models.language_model import NGramLanguageModel
+  from processors.fuzzy_search import TrieFuzzySearcher
+
+  vocabulary = workload.zipf_vocabulary(n_words, seed=seed)
+  keywords = workload.write_keywords(os.path.join(tmp, f"keywords_{n_words}.csv"), vocabulary)
+  folder = os.path.join(tmp, f"docs_{n_words}")
+  workload.write_defect_folder(folder, vocabulary, n_docs=n_docs, seed=seed,
+                               wildcard_density=wildcard_density, ocr_noise=ocr_noise)
+  document = workload.defect_document(vocabulary, seed=seed, wildcard_density=wildcard_density,
+                                      ocr_noise=ocr_noise)
+  rng = random.Random(seed)
+  sample = [w for w, _ in rng.choices(vocabulary, k=n_patterns)]
+  patterns = [workload.add_wildcards(w, rng) for w in sample]
+  damaged = [workload.add_ocr_damage(w, rng) for w in sample[:n_patterns // 10]]
+
+  def timed(fn, *args):
+    return _timed(fn, *args, repeat=repeat, warmup=warmup)
+
+  results = {}
+  trie_proc = TrieProcessor()
+  results['load_keywords'], _ = timed(FileIO.load_keywords, keywords, trie_proc)
+  results['find_matches'], _ = timed(lambda: [trie_proc.find_matches(p) for p in patterns])
+
+  text_proc = TextProcessor(trie_proc)
+  results['restore_text_best'], _ = timed(text_proc.restore_text, document, 'best')
+  results['restore_text_all'], _ = timed(text_proc.restore_text, document, 'all')
+
+  lm = NGramLanguageModel(k=1.0)
+  lm.update(workload.corpus_text(vocabulary, n_lines=2000, seed=seed + 1))
+  lm = lm.compile()
+  results['restore_text_with_context'], _ = timed(text_proc.restore_text_with_context, document, lm)
+
+  searcher = TrieFuzzySearcher(trie_proc)
+  results['search_word'], _ = timed(lambda: [searcher.search_word(w, max_dist=1) for w in damaged])
+
+  restorer = BatchRestorer(text_proc, FileIO())
+  out_dir = os.path.join(tmp, f"restored_{n_words}")
+  results['restore_folder'], _ = timed(restorer.restore_folder, folder, 'best', out_dir)
+  return results, trie_proc.stats()
+
+def run(sizes=(10000, 100000), **kwargs):
+  metrics = {}
+  memory = {}
+  with tempfile.TemporaryDirectory() as tmp:
+    for n_words in sizes:
+      timings, stats = run_size(n_words, tmp, **kwargs)
+      for op, seconds in timings.items():
+        metrics[f"{op}@{n_words}"] = seconds
+      memory[str(n_words)] = stats
+  return {
+    'meta': {
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'sizes': list(sizes),
+      'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'options': kwargs,
+      'statistic': 'min',
+    },
+    'metrics': metrics,
+    'memory': memory,
+  }
+
+def compare(results, baseline, default_threshold=DEFAULT_THRESHOLD, min_delta=MIN_DELTA):
+  """
+  Rows of (metric, baseline s, current s, ratio, threshold, regressed) for
+  every metric present in both runs. The baseline may carry per-metric
+  'thresholds' (fractions, e.g. 0.5 for +50%); a metric only regresses when
+  it is also at least min_delta seconds slower.
+  """
+  thresholds = baseline.get('thresholds', {})
+  rows = []
+  for name, current in results['metrics'].items():
+    before = baseline['metrics'].get(name)
+    if before is None:
+      continue
+    threshold = thresholds.get(name, thresholds.get(name.split('@')[0], default_threshold))
+    ratio = current / before if before > 0 else float('inf')
+    regressed = ratio > 1 + threshold and current - before >= min_delta
+    rows.append((name, before, current, ratio, threshold, regressed))
+  return rows
+
+def print_memory(results):
+  print(f"\n{'Words':>9} | {'Nodes':>10} | {'Max depth':>9} | {'Chain nodes':>11} | {'Est. MB':>8} | {'Bytes/word':>10}")
+  print("-" * 73)
+  for n_words, s in results.get('memory', {}).items():
+    print(f"{n_words:>9} | {s['nodes']:>10} | {s['max_depth']:>9} | {s['chain_nodes']:>11} | "
+          f"{s['bytes']['total'] / 1e6:>8.1f} | {s['bytes_per_word']:>10.1f}")
+
+def print_report(results, rows=None):
+  if rows is None:
+    print(f"{'Metric':36} | {'Seconds':10}")
+    print("-" * 49)
+    for name, seconds in results['metrics'].items():
+      print(f"{name:36} | {seconds:10.4f}")
+    print_memory(results)
+    return
+  print(f"{'Metric':36} | {'Baseline':10} | {'Current':10} | {'Ratio':6} | {'Status':10}")
+  print("-" * 84)
+  for name, before, current, ratio, threshold, regressed in rows:
+    status = f"SLOWER>{threshold:.0%}" if regressed else 'ok'
+    print(f"{name:36} | {before:10.4f} | {current:10.4f} | {ratio:6.2f} | {status:10}")
+  print_memory(results)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                      help="vocabulary sizes (10k up to 5M words)")
+  parser.add_argument('--docs', type=int, default=5)
+  parser.add_argument('--wildcard-density', type=float, default=0.1)
+  parser.add_argument('--ocr-noise', type=float, default=0.05)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--out', default='benchmark_results.json')
+  parser.add_argument('--baseline', help="baseline JSON to compare against")
+  parser.add_argument('--save-baseline', action='store_true', help="write the results to --baseline")
+  parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+  parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="timed runs per metric (best is kept)")
+  parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help="untimed runs before timing")
+  args = parser.parse_args(argv)
+
+  # The restore calls print progress and summaries; keep the report readable
+  with redirect_stdout(io.StringIO()):
+    results = run(args.sizes, n_docs=args.docs, wildcard_density=args.wildcard_density,
+                  ocr_noise=args.ocr_noise, seed=args.seed, repeat=args.repeat, warmup=args.warmup)
+  with open(args.out, 'w', encoding='utf-8') as f:
+    json.dump(results, f, indent=2)
+
+  if args.baseline and args.save_baseline:
+    # Keep thresholds already tuned in an existing baseline
+    if os.path.exists(args.baseline):
+      with open(args.baseline, 'r', encoding='utf-8') as f:
+        results['thresholds'] = json.load(f).get('thresholds', {})
+    with open(args.baseline, 'w', encoding='utf-8') as f:
+      json.dump(results, f, indent=2)
+    print_report(results)
+    print(f"\nBaseline saved to {args.baseline}")
+    return 0
+  if args.baseline:
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+      baseline = json.load(f)
+    rows = compare(results, baseline, args.threshold)
+    print_report(results, rows)
+    regressions = [r[0] for r in rows if r[5]]
+    if regressions:
+      print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+      return 1
+    return 0
+  print_report(results)
+  print(f"\nResults written to {args.out}")
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
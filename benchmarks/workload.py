@@ -0,0 +1,128 @@
+"""
+Synthetic newspaper workloads for the benchmarks.
+
+Vocabularies follow a Zipf distribution (the demo keywords take the top
+ranks, generated pronounceable words fill the tail) and defect documents mix
+wildcard tokens like data/demo/post5_defect.txt with OCR damage like
+data/demo/post6_defect.txt, each at a tunable rate. Everything is seeded.
+"""
+import itertools
+import os
+import random
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEMO_KEYWORDS = os.path.join(_REPO_ROOT, 'data', 'demo', 'my_keywords_demo.txt')
+
+_SYLLABLES = ['ba', 'ri', 'to', 'ne', 'sh', 'ar', 'el', 'mo', 'un', 'st', 'le', 'in', 'ow', 'er',
+              'ca', 'di', 'fu', 'go', 'ha', 'ki', 'lu', 'ma', 'po', 'sa', 've', 'wi']
+
+# OCR-style damage seen in data/demo/post6_defect.txt
+DAMAGE = [
+  lambda w: w.replace('l', 'I', 1),
+  lambda w: w.replace('o', '0', 1),
+  lambda w: w.replace('m', 'rn', 1),
+  lambda w: w[:1] + w[1] + w[1:] if len(w) > 2 else w,          # doubled letter
+  lambda w: w[:-2] + w[-1] + w[-2] if len(w) > 3 else w,        # transposition
+  lambda w: w[:-1] + 'h' + w[-1] if len(w) > 3 else w,          # inserted letter
+]
+
+def _demo_words(keywords):
+  words = []
+  with open(keywords, 'r', encoding='utf-8') as f:
+    for line in f:
+      word, _, freq = line.strip().partition(',')
+      if word:
+        words.append((word.lower(), int(freq) if freq.strip().isdigit() else 1))
+  words.sort(key=lambda x: -x[1])
+  return [w for w, _ in words]
+
+def _generated_words(rng):
+  # Endless stream of distinct pronounceable words, shortest first per round
+  for n in itertools.count(2):
+    seen = set()
+    for _ in range(len(_SYLLABLES) ** min(n, 4)):
+      word = ''.join(rng.choice(_SYLLABLES) for _ in range(n))
+      if word not in seen:
+        seen.add(word)
+        yield word
+
+def zipf_vocabulary(n_words, s=1.07, top_freq=1000000, keywords=DEMO_KEYWORDS, seed=0):
+  """
+  Return n_words distinct (word, frequency) pairs, most frequent first, with
+  frequency(rank) = top_freq / rank**s (at least 1).
+  """
+  rng = random.Random(seed)
+  words = []
+  seen = set()
+  for word in itertools.chain(_demo_words(keywords) if keywords else [], _generated_words(rng)):
+    if len(words) >= n_words:
+      break
+    if word not in seen:
+      seen.add(word)
+      words.append(word)
+  return [(w, max(1, int(top_freq / (rank ** s)))) for rank, w in enumerate(words, 1)]
+
+def write_keywords(path, vocabulary):
+  with open(path, 'w', encoding='utf-8') as f:
+    for word, freq in vocabulary:
+      f.write(f"{word},{freq}\n")
+  return path
+
+def _sampler(vocabulary, rng):
+  # Frequency-weighted word sampler
+  words = [w for w, _ in vocabulary]
+  cum = list(itertools.accumulate(f for _, f in vocabulary))
+  return lambda k: rng.choices(words, cum_weights=cum, k=k)
+
+def add_wildcards(word, rng, max_stars=2):
+  # Replace one or two letters with '*', as in post5_defect.txt ('*as', 's**n')
+  if len(word) < 2:
+    return '*'
+  positions = rng.sample(range(len(word)), min(len(word) - 1, rng.randint(1, max_stars)))
+  chars = list(word)
+  for p in positions:
+    chars[p] = '*'
+  return ''.join(chars)
+
+def add_ocr_damage(word, rng, tries=4):
+  # Retry a few times so most picks actually change the word
+  for _ in range(tries):
+    damaged = rng.choice(DAMAGE)(word)
+    if damaged != word:
+      return damaged
+  return word
+
+def defect_document(vocabulary, n_lines=40, words_per_line=12, wildcard_density=0.1, ocr_noise=0.05, seed=0):
+  """
+  Lines of Zipf-sampled words where each word gets wildcards with probability
+  wildcard_density, otherwise OCR damage with probability ocr_noise.
+  """
+  rng = random.Random(seed)
+  sample = _sampler(vocabulary, rng)
+  lines = []
+  for _ in range(n_lines):
+    tokens = []
+    for word in sample(words_per_line):
+      r = rng.random()
+      if r < wildcard_density:
+        word = add_wildcards(word, rng)
+      elif r < wildcard_density + ocr_noise:
+        word = add_ocr_damage(word, rng)
+      tokens.append(word)
+    tokens[0] = tokens[0].capitalize()
+    lines.append(' '.join(tokens) + rng.choice('..,;!?'))
+  return '\n'.join(lines) + '\n'
+
+def corpus_text(vocabulary, n_lines=2000, words_per_line=12, seed=0):
+  # Clean Zipf-sampled text for fitting a language model
+  return defect_document(vocabulary, n_lines, words_per_line, 0.0, 0.0, seed)
+
+def write_defect_folder(folder, vocabulary, n_docs=10, seed=0, **document_args):
+  os.makedirs(folder, exist_ok=True)
+  paths = []
+  for i in range(n_docs):
+    path = os.path.join(folder, f"post{i + 1}_defect.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+      f.write(defect_document(vocabulary, seed=seed + i, **document_args))
+    paths.append(path)
+  return paths
@@ -0,0 +1,320 @@
+"""
+Non-interactive command line for scripted jobs (the menus live in main.py).
+
+  python cli.py build    KEYWORDS -o trie.snap
+  python cli.py restore  INPUT -o OUTPUT --trie trie.snap [--mode best|all|fuzzy]
+  python cli.py batch    FOLDER --trie trie.snap [--mode best] [--output-dir DIR]
+  python cli.py context  INPUT -o OUTPUT --review review.csv --trie trie.snap --lm model.bin
+  python cli.py fuzzy    INPUT -o REPORT --trie trie.snap [--max-dist 1] [--workers 4]
+  python cli.py export   -o keywords.csv.gz --trie trie.snap [--order frequency|alpha|trie]
+  python cli.py bench    {lm,fuzzy,suite} [benchmark args...]
+  python cli.py serve    --trie trie.snap [--lm model.bin] [--port 8765]
+
+--trie accepts either a keyword list or a snapshot written by 'build'; --lm
+accepts a saved model file or a corpus. Submodules are imported inside each
+command so startup only pays for what the command uses.
+
+--base PATH (before the subcommand) loads a shared base vocabulary and
+layers the --trie keyword list over it as a per-title overlay.
+
+--metrics PATH (before the subcommand) turns on hot-path instrumentation and
+writes it on exit: a JSON snapshot for .json, Prometheus text otherwise.
+
+Exit codes: 0 success, 1 failure, 2 usage error, 3 batch finished with
+per-file errors.
+"""
+import argparse
+import sys
+
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+
+class CommandError(Exception):
+  """A command failed in a way worth reporting without a traceback."""
+
+def _log(message):
+  # Progress and status go to stderr so stdout stays clean for piping
+  print(message, file=sys.stderr)
+
+def _check(message):
+  # FileIO and the processors report failures as 'Error ...' strings
+  if message.startswith('Error'):
+    raise CommandError(message)
+  _log(message)
+
+def _keyword_layout(args):
+  # Row layout options for keyword lists, passed on to FileIO.load_keywords
+  return {'delimiter': args.delimiter, 'word_column': args.word_column, 'freq_column': args.freq_column}
+
+def _load_trie(path, base=None, layout=None):
+  # With base, the --trie keywords become a title layer over the shared base
+  from processors.trie_processor import TrieProcessor, is_snapshot_file
+  if base:
+    from processors.overlay_processor import OverlayTrieProcessor
+    trie_processor = OverlayTrieProcessor(base)
+    if path is None:
+      return trie_processor
+    if is_snapshot_file(path):
+      raise CommandError(f"--trie must be a keyword list when --base is given, not a snapshot: {path}")
+  else:
+    trie_processor = TrieProcessor()
+  if is_snapshot_file(path):
+    _log(trie_processor.load_snapshot(path))
+  else:
+    from helpers.file_io import FileIO
+    _check(FileIO.load_keywords(path, trie_processor, **(layout or {})))
+  return trie_processor
+
+def _load_lm(path, order):
+  from models.language_model import NGramLanguageModel, BackoffNGramModel, is_model_file, load_model_file
+  if is_model_file(path):
+    return load_model_file(path)
+  if order > 2:
+    lm = BackoffNGramModel(order=order)
+    lm.fit_from_file(path)
+    return lm
+  lm = NGramLanguageModel(k=1.0)
+  lm.fit_from_file(path)
+  return lm.compile()
+
+def _text_processor(args, trie_processor):
+  from processors.text_processor import TextProcessor
+  cache = None
+  if getattr(args, 'cache', None):
+    from processors.suggestion_cache import SuggestionCache
+    cache = SuggestionCache(args.cache)
+  return TextProcessor(trie_processor, cache, seed=getattr(args, 'seed', 0))
+
+# ----- commands -----
+def cmd_build(args):
+  trie_processor = _load_trie(args.keywords, layout=_keyword_layout(args))
+  _check(trie_processor.save_snapshot(args.output))
+  return EXIT_OK
+
+def cmd_restore(args):
+  trie_processor = _load_trie(args.trie, args.base, _keyword_layout(args))
+  text_processor = _text_processor(args, trie_processor)
+  from helpers.file_io import FileIO
+  pieces = text_processor.restore_chunks(FileIO.iter_text_chunks(args.input), args.mode)
+  _check(FileIO.restore_text_chunks(args.output, pieces))
+  if text_processor.suggestion_cache is not None:
+    text_processor.suggestion_cache.close()
+  return EXIT_OK
+
+def cmd_batch(args):
+  from helpers.file_io import FileIO
+  from processors.batch_restorer import BatchRestorer
+  trie_processor = _load_trie(args.trie, args.base, _keyword_layout(args))
+  text_processor = _text_processor(args, trie_processor)
+  limits = {'max_nodes': args.max_nodes, 'timeout': args.timeout, 'max_cost': args.max_cost}
+  restorer = BatchRestorer(text_processor, FileIO(), {k: v for k, v in limits.items() if v is not None})
+  try:
+    summary, total_restored, total_matches, total_unmatched, unmatched = restorer.restore_folder(
+      args.folder, args.mode, args.output_dir)
+  except ValueError as e:
+    raise CommandError(str(e))
+  restorer.print_summary(summary, total_restored, total_matches, total_unmatched, unmatched,
+                         restorer.limited_queries_per_file)
+  if text_processor.suggestion_cache is not None:
+    text_processor.suggestion_cache.close()
+  failed = [row[0] for row in summary if row[1] == 'ERROR']
+  if failed:
+    _log(f"{len(failed)} file(s) failed: {', '.join(failed)}")
+    return EXIT_PARTIAL
+  return EXIT_OK
+
+def cmd_context(args):
+  trie_processor = _load_trie(args.trie, args.base, _keyword_layout(args))
+  text_processor = _text_processor(args, trie_processor)
+  lm = _load_lm(args.lm, args.order)
+  import contextlib
+  from helpers.file_io import FileIO, replacing_output
+  pieces = text_processor.restore_chunks_with_context(
+    FileIO.iter_text_chunks(args.input), lm, threshold=args.threshold, decoder=args.decoder,
+    beam_width=args.beam_width
+  )
+  with contextlib.ExitStack() as outputs:
+    review = outputs.enter_context(replacing_output(args.review, encoding='utf-8')) if args.review else None
+    f = outputs.enter_context(replacing_output(args.output, encoding='utf-8'))
+    if review:
+      review.write('original,choice,confidence,left,right,candidates\n')
+    for restored, review_rows in pieces:
+      f.write(restored)
+      if review:
+        for orig, choice, conf, left, right, cands in review_rows:
+          review.write(f"{orig},{choice},{conf},{left},{right},{cands}\n")
+  _log(f"Context restore complete: {args.output}")
+  return EXIT_OK
+
+def cmd_fuzzy(args):
+  import os
+  from processors.fuzzy_search import default_confusables
+  trie_processor = _load_trie(args.trie, args.base, _keyword_layout(args))
+  cache = _text_processor(args, trie_processor).suggestion_cache
+  conf_map = {} if args.no_confusables else default_confusables()
+  if os.path.isdir(args.input) or args.input.lower().endswith('.zip'):
+    from processors.fuzzy_scan import FolderFuzzyScanner
+    scanner = FolderFuzzyScanner(trie_processor, confusables=conf_map, cache=cache)
+    stats = scanner.scan(args.input, args.output, max_dist=args.max_dist, k=args.k, workers=args.workers)
+    scanner.print_summary(stats)
+  else:
+    from processors.fuzzy_search import TrieFuzzySearcher
+    searcher = TrieFuzzySearcher(trie_processor, confusables=conf_map, cache=cache)
+    from helpers.file_io import FileIO, replacing_output
+    chunks = FileIO.iter_text_chunks(args.input)
+    with replacing_output(args.output, encoding='utf-8') as f:
+      for chunk in chunks:
+        for tok, suggs in searcher.suggest_for_text(chunk, max_dist=args.max_dist):
+          f.write(f"{tok} -> {suggs}\n")
+    _log(f"Fuzzy suggestions written to {args.output}")
+  if cache is not None:
+    _log(cache.report())
+    cache.close()
+  return EXIT_OK
+
+def cmd_export(args):
+  from helpers.file_io import FileIO
+  trie_processor = _load_trie(args.trie, args.base, _keyword_layout(args))
+  if args.order == 'trie':
+    _check(FileIO.export_keywords(args.output, trie_processor.get_all_words()))
+  else:
+    _check(FileIO.export_keywords_sorted(args.output, trie_processor, order=args.order,
+                                         progress=args.progress))
+  return EXIT_OK
+
+def cmd_serve(args):
+  from processors.restore_service import RestoreService
+  trie_processor = _load_trie(args.trie, args.base, _keyword_layout(args)) if args.trie or args.base else None
+  lm = _load_lm(args.lm, args.order) if args.lm else None
+  limits = {'max_nodes': args.max_nodes, 'timeout': args.timeout, 'max_cost': args.max_cost}
+  service = RestoreService(trie_processor, lm, window=args.batch_window / 1000.0, query_limits=limits)
+  service.vocab.source = args.trie
+  service.serve_forever(args.host, args.port)
+  return EXIT_OK
+
+def cmd_bench(args):
+  if args.suite == 'lm':
+    from benchmarks.lm_benchmark import main as bench_main
+  elif args.suite == 'fuzzy':
+    from benchmarks.fuzzy_benchmark import main as bench_main
+  else:
+    from benchmarks.suite import main as bench_main
+  # The suite returns non-zero when it finds regressions against a baseline
+  return bench_main(args.bench_args) or EXIT_OK
+
+# ----- argument parsing -----
+def build_parser():
+  from processors.batch_restorer import DEFAULT_QUERY_LIMITS
+  parser = argparse.ArgumentParser(prog='cli.py', description="Predictive text restorer (non-interactive)")
+  parser.add_argument('--metrics', help="write instrumentation to this file (.json or Prometheus text)")
+  parser.add_argument('--base', help="shared base vocabulary (snapshot or keyword list); --trie is layered on top")
+  parser.add_argument('--delimiter', help="--trie/build keyword list column delimiter (default ',' or tab for .tsv)")
+  parser.add_argument('--word-column', help="keyword list column (or JSON key) holding the word")
+  parser.add_argument('--freq-column', help="keyword list column (or JSON key) holding the frequency")
+  sub = parser.add_subparsers(dest='command', required=True)
+
+  p = sub.add_parser('build', help="build a trie snapshot from a keyword list")
+  p.add_argument('keywords')
+  p.add_argument('-o', '--output', required=True)
+  p.set_defaults(func=cmd_build)
+
+  p = sub.add_parser('restore', help="restore wildcards in one text file")
+  p.add_argument('input')
+  p.add_argument('-o', '--output', required=True)
+  p.add_argument('--trie', required=True)
+  p.add_argument('--mode', choices=('best', 'all', 'fuzzy'), default='best')
+  p.add_argument('--cache', help="SQLite suggestion cache file (fuzzy mode)")
+  p.add_argument('--seed', type=int, default=0, help="tie-break seed for equally frequent matches")
+  p.set_defaults(func=cmd_restore)
+
+  p = sub.add_parser('batch', help="restore every .txt file in a folder")
+  p.add_argument('folder')
+  p.add_argument('--trie', required=True)
+  p.add_argument('--mode', choices=('best', 'all', 'fuzzy'), default='best')
+  p.add_argument('--output-dir')
+  p.add_argument('--cache', help="SQLite suggestion cache file (fuzzy mode)")
+  p.add_argument('--seed', type=int, default=0, help="tie-break seed for equally frequent matches")
+  p.add_argument('--max-nodes', type=int, default=DEFAULT_QUERY_LIMITS['max_nodes'],
+                 help="trie nodes visited per wildcard before stopping")
+  p.add_argument('--timeout', type=float, default=DEFAULT_QUERY_LIMITS['timeout'],
+                 help="seconds per wildcard before stopping")
+  p.add_argument('--max-cost', type=float, default=DEFAULT_QUERY_LIMITS['max_cost'],
+                 help="skip wildcards whose estimated cost (nodes) is higher")
+  p.set_defaults(func=cmd_batch)
+
+  p = sub.add_parser('context', help="context-aware restore with a language model")
+  p.add_argument('input')
+  p.add_argument('-o', '--output', required=True)
+  p.add_argument('--review', help="review CSV output")
+  p.add_argument('--trie', required=True)
+  p.add_argument('--lm', required=True, help="saved model file or corpus")
+  p.add_argument('--order', type=int, default=2, help="n-gram order when building from a corpus")
+  p.add_argument('--threshold', type=float, default=0.6)
+  p.add_argument('--decoder', choices=('independent', 'beam'), default='independent')
+  p.add_argument('--beam-width', type=int, default=8)
+  p.set_defaults(func=cmd_context)
+
+  p = sub.add_parser('fuzzy', help="fuzzy suggestions for a file, folder or .zip archive")
+  p.add_argument('input')
+  p.add_argument('-o', '--output', required=True)
+  p.add_argument('--trie', required=True)
+  p.add_argument('--max-dist', type=int, default=1)
+  p.add_argument('-k', type=int, default=5, help="suggestions per token (folder scans)")
+  p.add_argument('--workers', type=int, default=1)
+  p.add_argument('--no-confusables', action='store_true')
+  p.add_argument('--cache', help="SQLite suggestion cache file")
+  p.set_defaults(func=cmd_fuzzy)
+
+  p = sub.add_parser('export', help="export keywords, optionally sorted and gzipped")
+  p.add_argument('-o', '--output', required=True)
+  p.add_argument('--trie', required=True)
+  p.add_argument('--order', choices=('frequency', 'alpha', 'trie'), default='frequency')
+  p.add_argument('--progress', action='store_true')
+  p.set_defaults(func=cmd_export)
+
+  p = sub.add_parser('serve', help="run the local HTTP/JSON restore service")
+  p.add_argument('--trie')
+  p.add_argument('--lm', help="saved model file or corpus")
+  p.add_argument('--order', type=int, default=2, help="n-gram order when building from a corpus")
+  p.add_argument('--host', default='127.0.0.1')
+  p.add_argument('--port', type=int, default=8765)
+  p.add_argument('--batch-window', type=float, default=5.0, help="micro-batch window in ms")
+  p.add_argument('--max-nodes', type=int, default=DEFAULT_QUERY_LIMITS['max_nodes'],
+                 help="trie nodes visited per wildcard before stopping")
+  p.add_argument('--timeout', type=float, default=DEFAULT_QUERY_LIMITS['timeout'],
+                 help="seconds per wildcard before stopping")
+  p.add_argument('--max-cost', type=float, default=DEFAULT_QUERY_LIMITS['max_cost'],
+                 help="skip wildcards whose estimated cost (nodes) is higher")
+  p.set_defaults(func=cmd_serve)
+
+  p = sub.add_parser('bench', help="run a benchmark suite")
+  p.add_argument('suite', choices=('lm', 'fuzzy', 'suite'))
+  p.add_argument('bench_args', nargs=argparse.REMAINDER)
+  p.set_defaults(func=cmd_bench)
+  return parser
+
+def main(argv=None):
+  parser = build_parser()
+  try:
+    args = parser.parse_args(argv)
+  except SystemExit as e:
+    return EXIT_OK if e.code == 0 else EXIT_USAGE
+  if args.metrics:
+    from helpers.metrics import METRICS
+    METRICS.enable()
+  try:
+    return args.func(args)
+  except (CommandError, OSError, ValueError) as e:
+    _log(f"{args.command}: {e}")
+    return EXIT_FAILURE
+  except KeyboardInterrupt:
+    _log("Interrupted.")
+    return EXIT_FAILURE
+  finally:
+    if args.metrics:
+      _log(METRICS.write(args.metrics))
+
+if __name__ == '__main__':
+  sys.exit(main())
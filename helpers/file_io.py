@@ -1,17 +1,121 @@
+import bz2
+import contextlib
+import csv
+import gzip
+import heapq
+import io
+import json
+import lzma
+import mmap
+import os
+import stat
+import tempfile
+import time
+
+# Magic bytes of the compressed keyword formats we can stream
+_COMPRESSION_MAGIC = [
+  (b'\x1f\x8b', 'gzip'),
+  (b'BZh', 'bz2'),
+  (b'\xfd7zXZ\x00', 'xz'),
+]
+_COMPRESSION_EXT = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+_OPENERS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open, None: open}
+# Bytes of input decoded and restored at a time by iter_text_chunks
+CHUNK_SIZE = 1 << 20
+
+def _text_mode_newlines(text):
+  # Same newline translation as reading the file in text mode
+  if '\r' in text:
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+  return text
+
+def _mapped_chunks(f, mm, chunk_size):
+  # Line-aligned pieces of a mapped file (mm is None for an empty file)
+  try:
+    if mm is None:
+      return
+    size = len(mm)
+    start = 0
+    while start < size:
+      end = min(start + chunk_size, size)
+      if end < size:
+        cut = mm.rfind(b'\n', start, end)
+        if cut == -1:
+          cut = mm.find(b'\n', end)
+        end = size if cut == -1 else cut + 1
+      yield _text_mode_newlines(mm[start:end].decode('utf-8'))
+      start = end
+  finally:
+    if mm is not None:
+      mm.close()
+    f.close()
+
+def _buffered_chunks(f, chunk_size):
+  with io.TextIOWrapper(f, encoding='utf-8') as text:
+    for lines in iter(lambda: text.readlines(chunk_size), []):
+      yield ''.join(lines)
+
+@contextlib.contextmanager
+def replacing_output(filename, encoding=None):
+  """
+  Open a text file for writing that replaces filename only when the block
+  finishes without error: the data goes to a temporary file in the same
+  directory, moved over filename at the end. An input that is also the
+  output is therefore read intact, and a failed run leaves no partial file.
+  """
+  directory = os.path.dirname(os.path.abspath(filename))
+  fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filename) + '.', suffix='.tmp')
+  try:
+    # mkstemp creates the file private; give it the permissions open() would
+    mask = os.umask(0)
+    os.umask(mask)
+    os.chmod(tmp, 0o666 & ~mask)
+    with open(fd, 'w', encoding=encoding) as f:
+      yield f
+    os.replace(tmp, filename)
+  except BaseException:
+    try:
+      os.unlink(tmp)
+    except OSError:
+      pass
+    raise
+
 class FileIO:
   @staticmethod
   def prompt_load_keywords(trie_processor):
     """Prompt user for file and load keywords into trie."""
     filename = input("Please enter input file: ").strip()
-    result = FileIO.load_keywords(filename, trie_processor)
+    layout = input("Delimiter, word column, frequency column, e.g. '; 0 2' or 'tab 1 0' "
+                   "(Enter for defaults): ").split()
+    if len(layout) > 3:
+      print("Error: expected at most a delimiter and two columns")
+      return
+    delimiter, word_column, freq_column = (layout + [None] * 3)[:3]
+    if delimiter == 'tab':
+      delimiter = '\t'
+    result = FileIO.load_keywords(filename, trie_processor, delimiter=delimiter,
+                                  word_column=word_column, freq_column=freq_column)
+    print(result)
+
+  @staticmethod
+  def prompt_apply_keyword_delta(trie_processor):
+    """Prompt user for a delta file and merge it into the live trie."""
+    filename = input("Please enter delta file: ").strip()
+    result = FileIO.apply_keyword_delta(filename, trie_processor)
     print(result)
 
   @staticmethod
   def prompt_export_keywords(trie_processor):
     """Prompt user for file and export trie keywords to file."""
     filename = input("Please enter output file: ").strip()
-    words = trie_processor.get_all_words()
-    result = FileIO.export_keywords(filename, words)
+    order = input("Order - (T)rie, (F)requency or (A)lphabetical [default: T]: ").strip().lower()
+    if order.startswith('f'):
+      result = FileIO.export_keywords_sorted(filename, trie_processor, order='frequency', progress=True)
+    elif order.startswith('a'):
+      result = FileIO.export_keywords_sorted(filename, trie_processor, order='alpha', progress=True)
+    else:
+      words = trie_processor.get_all_words()
+      result = FileIO.export_keywords(filename, words)
     print(result)
 
   @staticmethod
@@ -36,59 +140,218 @@ class FileIO:
     input_file = input("Please enter input file: ").strip()
     output_file = input("Please enter output file: ").strip()
     try:
-      with open(input_file, 'r') as f:
-        content = f.read()
-      restored = text_processor.restore_text(content, mode)
-      result = file_io.restore_text_file(output_file, restored)
+      chunks = FileIO.iter_text_chunks(input_file)
+      result = file_io.restore_text_chunks(output_file, text_processor.restore_chunks(chunks, mode))
       print(result)
     except Exception as e:
       print(f"Error processing files: {e}")
   @staticmethod
-  def load_keywords(filename, trie_processor):
+  def detect_keyword_source(filename):
+    """
+    Work out (compression, format) for a keyword file. Compression comes from
+    magic bytes (falling back to the extension); format from the extension
+    under any compression suffix: 'tsv', 'jsonl' or 'csv' (also used for .txt).
+    """
+    with open(filename, 'rb') as f:
+      head = f.read(8)
+    compression = next((name for magic, name in _COMPRESSION_MAGIC if head.startswith(magic)), None)
+    base, ext = os.path.splitext(filename.lower())
+    if ext in _COMPRESSION_EXT:
+      compression = compression or _COMPRESSION_EXT[ext]
+      ext = os.path.splitext(base)[1]
+    fmt = {'.tsv': 'tsv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(ext, 'csv')
+    return compression, fmt
+
+  @staticmethod
+  def ingest_keywords(filename, trie_processor, fmt=None, delimiter=None, word_column=None,
+                      freq_column=None, clear=True, max_reported=20):
+    """
+    Streams keywords from a plain, gzip, bz2 or xz file in CSV/TSV (one word
+    per row, optional frequency column) or JSON Lines format, without
+    decompressing to disk. Malformed rows are skipped and their line numbers
+    reported rather than inserted as words.
+
+    Args:
+      filename (str): Path to the keyword file.
+      trie_processor: An object with add_word(word, count) and clear_trie() methods.
+      fmt (str): 'csv', 'tsv' or 'jsonl'; detected from the name if None.
+      delimiter (str): Column delimiter for csv/tsv (default ',' or tab).
+      word_column, freq_column: Column index (csv/tsv) or key (jsonl) holding
+        the word and its frequency. Defaults are 0/1 and 'word'/'frequency';
+        rows without a frequency count once.
+      clear (bool): Clear the trie first.
+      max_reported (int): How many malformed line numbers to list.
+
+    Returns:
+      str: Status message with counts and malformed line numbers, or an error.
+    """
+    try:
+      compression, detected = FileIO.detect_keyword_source(filename)
+      fmt = fmt or detected
+      if fmt == 'jsonl':
+        word_column = 'word' if word_column is None else word_column
+        freq_column = 'frequency' if freq_column is None else freq_column
+      else:
+        delimiter = delimiter or ('\t' if fmt == 'tsv' else ',')
+        word_column = 0 if word_column is None else int(word_column)
+        freq_column = 1 if freq_column is None else int(freq_column)
+
+      if clear:
+        trie_processor.clear_trie()
+      loaded = 0
+      malformed = []
+      with _OPENERS[compression](filename, 'rt', encoding='utf-8', newline='') as f:
+        rows = FileIO._iter_jsonl_rows(f) if fmt == 'jsonl' else FileIO._iter_delimited_rows(f, delimiter)
+        for line_no, row in rows:
+          parsed = FileIO._parse_keyword_row(row, word_column, freq_column)
+          if parsed is None:
+            malformed.append(line_no)
+            continue
+          trie_processor.add_word(*parsed)
+          loaded += 1
+
+      compression_note = f" ({compression})" if compression else ""
+      message = f"Loaded {loaded} keywords from {filename}{compression_note}"
+      if malformed:
+        shown = ", ".join(str(n) for n in malformed[:max_reported])
+        more = f" and {len(malformed) - max_reported} more" if len(malformed) > max_reported else ""
+        message += f"\nSkipped {len(malformed)} malformed rows at lines: {shown}{more}"
+      return message
+    except Exception as e:
+      return f"Error loading file: {e}"
+
+  @staticmethod
+  def _iter_delimited_rows(f, delimiter):
+    # (line number, list of fields) for each non-blank row
+    reader = csv.reader(f, delimiter=delimiter)
+    for row in reader:
+      if row and any(field.strip() for field in row):
+        yield reader.line_num, row
+
+  @staticmethod
+  def _iter_jsonl_rows(f):
+    # (line number, decoded object or None if the JSON is invalid)
+    for line_no, line in enumerate(f, 1):
+      if not line.strip():
+        continue
+      try:
+        yield line_no, json.loads(line)
+      except ValueError:
+        yield line_no, None
+
+  @staticmethod
+  def _parse_keyword_row(row, word_column, freq_column):
+    # (word, frequency) from a row, or None when it is malformed
+    try:
+      word = row[word_column]
+    except (KeyError, IndexError, TypeError):
+      return None
+    if not isinstance(word, str) or not word.strip() or len(word.split()) != 1:
+      return None
+    try:
+      freq = row[freq_column]
+    except (KeyError, IndexError):
+      return word.strip(), 1
+    try:
+      freq = int(str(freq).strip())
+    except ValueError:
+      return None
+    if freq < 1:
+      return None
+    return word.strip(), freq
+
+  @staticmethod
+  def load_keywords(filename, trie_processor, delimiter=None, word_column=None, freq_column=None):
     """
     Loads keywords from a file and adds them to the provided trie_processor.
     Clears the trie before loading new keywords.
-    Supports both plain text format (one word per line) and CSV format (word,frequency).
+    Plain text (one word per line), CSV (word,frequency), TSV and JSON Lines
+    lists, compressed or not, all go through ingest_keywords, so malformed
+    rows are skipped and reported instead of being inserted as words.
 
     Args:
       filename (str): Path to the file containing keywords.
       trie_processor: An object with add_word(word) and clear_trie() methods.
+      delimiter, word_column, freq_column: Layout of the rows (see ingest_keywords).
 
     Returns:
       str: Status message indicating success or error.
     """
-    try:
-        # Clear the existing trie before loading new keywords
-        trie_processor.clear_trie()
+    return FileIO.ingest_keywords(filename, trie_processor, delimiter=delimiter,
+                                  word_column=word_column, freq_column=freq_column)
 
-        with open(filename, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-
-                # Check if line contains CSV format (word,frequency)
-                if ',' in line:
-                    parts = line.split(',')
-                    if len(parts) == 2:
-                        word = parts[0].strip()
-                        try:
-                            frequency = int(parts[1].strip())
-                            # Add the word once with its frequency value
-                            trie_processor.add_word(word, frequency)
-                        except ValueError:
-                            # If frequency is invalid, treat the whole line as a word
-                            trie_processor.add_word(line)
-                    else:
-                        # If not valid CSV format, treat whole line as word
-                        trie_processor.add_word(line)
-                else:
-                    # Plain text format, just add the word
-                    trie_processor.add_word(line)
-
-        return f"Loaded keywords from {filename}"
+  @staticmethod
+  def apply_keyword_delta(filename, trie_processor, max_reported=20):
+    """
+    Applies a keyword delta file to the live trie in one pass, without clearing it.
+    Each line is one of:
+      +word,freq   add freq to the word (inserting it; freq defaults to 1)
+      -word        delete the word
+      =word,freq   set the word's frequency (0 deletes it)
+    Blank lines and lines starting with '#' are ignored. The file may be compressed.
+
+    Args:
+      filename (str): Path to the delta file.
+      trie_processor: An object with add_word, delete_word, set_frequency and find_word methods.
+      max_reported (int): How many malformed line numbers to list.
+
+    Returns:
+      str: Summary of changes and elapsed time, or an error message.
+    """
+    try:
+      start = time.perf_counter()
+      compression, _ = FileIO.detect_keyword_source(filename)
+      counts = {'added': 0, 'incremented': 0, 'deleted': 0, 'missing': 0, 'set': 0}
+      malformed = []
+      with _OPENERS[compression](filename, 'rt', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+          line = line.strip()
+          if not line or line.startswith('#'):
+            continue
+          op, body = line[0], line[1:]
+          word, _, freq = body.partition(',')
+          word = word.strip()
+          if op not in '+-=' or not word or len(word.split()) != 1:
+            malformed.append(line_no)
+            continue
+          try:
+            freq = int(freq) if freq.strip() else (1 if op == '+' else None)
+          except ValueError:
+            malformed.append(line_no)
+            continue
+          if op == '+':
+            if freq is None or freq < 1:
+              malformed.append(line_no)
+              continue
+            counts['incremented' if trie_processor.find_word(word) else 'added'] += 1
+            trie_processor.add_word(word, freq)
+          elif op == '-':
+            if freq is not None:
+              malformed.append(line_no)
+              continue
+            if trie_processor.find_word(word):
+              trie_processor.delete_word(word)
+              counts['deleted'] += 1
+            else:
+              counts['missing'] += 1
+          else:
+            if freq is None or freq < 0:
+              malformed.append(line_no)
+              continue
+            trie_processor.set_frequency(word, freq)
+            counts['set'] += 1
+      elapsed = time.perf_counter() - start
+      message = (f"Applied delta from {filename} in {elapsed:.3f}s: "
+                 f"{counts['added']} added, {counts['incremented']} incremented, "
+                 f"{counts['set']} set, {counts['deleted']} deleted, "
+                 f"{counts['missing']} delete(s) of missing words")
+      if malformed:
+        shown = ", ".join(str(n) for n in malformed[:max_reported])
+        more = f" and {len(malformed) - max_reported} more" if len(malformed) > max_reported else ""
+        message += f"\nSkipped {len(malformed)} malformed lines: {shown}{more}"
+      return message
     except Exception as e:
-        return f"Error loading file: {e}"
+      return f"Error applying delta: {e}"
 
   @staticmethod
   def export_keywords(filename, words):
@@ -110,6 +373,134 @@ class FileIO:
     except Exception as e:
       return f"Error exporting file: {e}"
 
+  @staticmethod
+  def export_keywords_sorted(filename, trie_processor, order='frequency', run_size=500000,
+                             compress=None, progress=False, progress_every=1000000):
+    """
+    Streams the trie's keywords to a CSV file in frequency-descending (ties
+    alphabetical) or alphabetical order. Alphabetical order comes straight
+    from a sorted trie walk; frequency order uses an external merge sort that
+    spills sorted runs of at most run_size words to temporary files, so memory
+    stays bounded for very large vocabularies.
+
+    Args:
+      filename (str): Path to the output file.
+      trie_processor: An object with an iter_words(sort) method.
+      order (str): 'frequency' or 'alpha'.
+      run_size (int): Maximum words held in memory per sorted run.
+      compress (bool): Write gzip output; defaults to True for a .gz filename.
+      progress (bool): Print progress and throughput while writing.
+      progress_every (int): Words between progress lines.
+
+    Returns:
+      str: Status message with word count and throughput, or an error message.
+    """
+    if order not in ('frequency', 'alpha'):
+      return f"Error exporting file: unknown order '{order}'"
+    if compress is None:
+      compress = filename.lower().endswith('.gz')
+    opener = gzip.open if compress else open
+    start = time.perf_counter()
+    runs = []
+    try:
+      if order == 'alpha':
+        rows = trie_processor.iter_words(sort=True)
+      else:
+        rows = FileIO._frequency_sorted(trie_processor.iter_words(), run_size, runs)
+      count = 0
+      with opener(filename, 'wt', encoding='utf-8', newline='') as f:
+        for word, freq in rows:
+          f.write(f"{word},{freq}\n")
+          count += 1
+          if progress and count % progress_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"  {count} keywords written ({count / elapsed:,.0f}/s)")
+      elapsed = time.perf_counter() - start
+      rate = count / elapsed if elapsed > 0 else 0
+      spilled = f", {len(runs)} spill runs" if len(runs) > 1 else ""
+      return f"Exported {count} keywords to {filename} in {elapsed:.2f}s ({rate:,.0f}/s{spilled})"
+    except Exception as e:
+      return f"Error exporting file: {e}"
+    finally:
+      for run in runs:
+        run.close()
+
+  @staticmethod
+  def _frequency_sorted(words, run_size, runs):
+    # External sort by (-frequency, word). A single run is sorted in memory;
+    # otherwise every run is spilled to a temp file (appended to runs so the
+    # caller can close them) and the files are merged lazily.
+    key = lambda x: (-x[1], x[0])
+    buffer = []
+    for pair in words:
+      buffer.append(pair)
+      if len(buffer) >= run_size:
+        runs.append(FileIO._spill_run(sorted(buffer, key=key)))
+        buffer = []
+    if not runs:
+      return iter(sorted(buffer, key=key))
+    if buffer:
+      runs.append(FileIO._spill_run(sorted(buffer, key=key)))
+    return heapq.merge(*(FileIO._read_run(run) for run in runs), key=key)
+
+  @staticmethod
+  def _spill_run(pairs):
+    run = tempfile.TemporaryFile('w+', encoding='utf-8', newline='')
+    for word, freq in pairs:
+      run.write(f"{freq}\t{word}\n")
+    run.seek(0)
+    return run
+
+  @staticmethod
+  def _read_run(run):
+    for line in run:
+      freq, _, word = line.rstrip('\n').partition('\t')
+      yield word, int(freq)
+
+  @staticmethod
+  def iter_text_chunks(filename, chunk_size=CHUNK_SIZE):
+    """
+    Returns an iterator over the text of a UTF-8 file in pieces of about
+    chunk_size bytes, read through mmap so only the current piece is ever
+    decoded. Each piece ends just after a newline byte, which never falls
+    inside a UTF-8 sequence or a token and keeps every line (and so every
+    wildcard's context) whole; a single line longer than chunk_size becomes
+    one piece. Newlines are translated as in text mode, so the pieces join to
+    exactly what f.read() returns. The file is opened and mapped before this
+    returns, so a missing input fails here, before any output is opened.
+    """
+    f = open(filename, 'rb')
+    try:
+      info = os.fstat(f.fileno())
+      if not stat.S_ISREG(info.st_mode):
+        # Pipes and devices cannot be mapped: same pieces from buffered reads
+        return _buffered_chunks(f, chunk_size)
+      mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if info.st_size else None
+    except BaseException:
+      f.close()
+      raise
+    return _mapped_chunks(f, mm, chunk_size)
+
+  @staticmethod
+  def restore_text_chunks(filename, pieces):
+    """
+    Writes restored text piece by piece (see TextProcessor.restore_chunks),
+    producing the same file as restore_text_file with the joined pieces. The
+    output replaces filename only once complete, so it may be the input file.
+
+    Returns:
+      str: Status message indicating success or error.
+    """
+    try:
+      with replacing_output(filename) as f:
+        for piece in pieces:
+          f.write(piece)
+      return f"Text saved to {filename}"
+    except UnicodeDecodeError as e:
+      return f"Error reading input: {e}"
+    except Exception as e:
+      return f"Error saving file: {e}"
+
   @staticmethod
   def restore_text_file(filename, content):
     """
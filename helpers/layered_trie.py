@@ -0,0 +1,153 @@
+import sys
+from helpers.trie import PrefixTrie, TrieNode
+
+class _LayeredNode:
+  """
+  Read-only view of a base node merged with its overlay delta node. Exposes
+  the TrieNode attributes (children, is_end, frequency, prefix_count), so
+  every PrefixTrie walk and the fuzzy engines run on it unchanged.
+  """
+  __slots__ = ('base', 'delta', '_children')
+
+  def __init__(self, base, delta):
+    self.base = base
+    self.delta = delta
+    self._children = None
+
+  @property
+  def frequency(self):
+    base_freq = self.base.frequency if self.base is not None and self.base.is_end else 0
+    return base_freq + self.delta.frequency
+
+  @property
+  def is_end(self):
+    return self.frequency > 0
+
+  @property
+  def prefix_count(self):
+    return (self.base.prefix_count if self.base is not None else 0) + self.delta.prefix_count
+
+  @property
+  def children(self):
+    if self._children is None:
+      self._children = _merge_children(self.base, self.delta)
+    return self._children
+
+def _merge_children(base, delta):
+  # Base children without a delta counterpart are untouched and returned as-is;
+  # subtrees whose words were all deleted are left out
+  merged = dict(base.children) if base is not None else {}
+  for char, delta_child in delta.children.items():
+    base_child = merged.get(char)
+    if base_child is None:
+      if delta_child.prefix_count > 0:
+        merged[char] = delta_child
+      continue
+    view = _LayeredNode(base_child, delta_child)
+    if view.prefix_count > 0:
+      merged[char] = view
+    else:
+      del merged[char]
+  return merged
+
+class LayeredTrie(PrefixTrie):
+  """
+  A PrefixTrie made of a shared, read-only base trie and a small mutable
+  overlay. The overlay stores deltas: a node's prefix_count and frequency are
+  added to the base node's, so a deletion is a negative delta that masks the
+  base word and re-adding it just adds frequency back. The base is never
+  written to, so any number of layers can stack on one base.
+  """
+  def __init__(self, base):
+    self.base = base
+    self.delta = TrieNode()
+    self.total_words = base.total_words
+
+  @property
+  def root(self):
+    return _LayeredNode(self.base.root, self.delta)
+
+  # Cost estimates use the base shape; the overlay is small by design
+  @property
+  def level_nodes(self):
+    return self.base.level_nodes
+
+  @property
+  def level_chars(self):
+    return self.base.level_chars
+
+  def _paths(self, word, create):
+    # [(delta parent, char, delta child, base child)] along word; None if a
+    # delta node is missing and create is False
+    steps = []
+    delta, base = self.delta, self.base.root
+    for char in word:
+      child = delta.children.get(char)
+      if child is None:
+        if not create:
+          return None
+        child = delta.children[char] = TrieNode()
+      base = base.children.get(char) if base is not None else None
+      steps.append((delta, char, child, base))
+      delta = child
+    return steps
+
+  def _frequency(self, word):
+    node = self._get_node(word)
+    return node.frequency if node is not None and node.is_end else 0
+
+  def _adjust(self, word, amount):
+    # Add amount (possibly negative) to word's merged frequency
+    steps = self._paths(word, create=True)
+    for _, _, child, _ in steps:
+      child.prefix_count += amount
+    end = steps[-1][2]
+    end.frequency += amount
+    end.is_end = end.frequency + (steps[-1][3].frequency if steps[-1][3] is not None and steps[-1][3].is_end else 0) > 0
+    self.total_words += amount
+    # Overlay-only nodes left with nothing under them are removed
+    for parent, char, child, base in reversed(steps):
+      if base is None and child.prefix_count == 0 and not child.children:
+        del parent.children[char]
+      else:
+        break
+
+  def insert(self, word, count=1):
+    if word:
+      self._adjust(word, count)
+
+  def delete(self, word):
+    frequency = self._frequency(word)
+    if not word or frequency <= 0:
+      return False
+    self._adjust(word, -frequency)
+    return True
+
+  def set_frequency(self, word, frequency):
+    if frequency <= 0:
+      return self.delete(word)
+    if word:
+      self._adjust(word, frequency - self._frequency(word))
+    return True
+
+  def overlay_size(self):
+    # (delta nodes, estimated bytes) held by this layer alone
+    nodes, size = 0, 0
+    stack = [self.delta]
+    while stack:
+      node = stack.pop()
+      nodes += 1
+      size += sys.getsizeof(node) + sys.getsizeof(node.children)
+      stack.extend(node.children.values())
+    return nodes, size
+
+  def stats(self):
+    # Shape of the merged trie; memory split into the shared base and this layer
+    report = super().stats()
+    base_bytes = self.base.stats()['bytes']['total']
+    overlay_nodes, overlay_bytes = self.overlay_size()
+    report['bytes'] = {'base (shared)': base_bytes, 'overlay': overlay_bytes, 'total': base_bytes + overlay_bytes}
+    report['overlay_nodes'] = overlay_nodes
+    report['bytes_per_word'] = overlay_bytes / report['words'] if report['words'] else 0.0
+    report.pop('traced_bytes', None)
+    return report
@@ -0,0 +1,144 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Histogram upper bounds: latencies in seconds, sizes in nodes or candidates
+LATENCY_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 5000, 10000, 100000, 1000000)
+
+class Histogram:
+  def __init__(self, buckets):
+    self.buckets = buckets
+    self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self, value):
+    self.counts[bisect_left(self.buckets, value)] += 1
+    self.sum += value
+    self.count += 1
+
+class MetricsRegistry:
+  """
+  Process-wide call counts and histograms for the hot paths. Disabled by
+  default (set TRIE_METRICS=1 or call enable()); while disabled, instrumented
+  functions only pay one attribute check. Exported as a Prometheus text file
+  or a JSON snapshot.
+  """
+  def __init__(self, enabled=False, prefix='restorer_'):
+    self.enabled = enabled
+    self.prefix = prefix
+    self._histograms = {}
+    self._counters = {}
+    self._lock = threading.Lock()
+
+  def enable(self):
+    self.enabled = True
+
+  def disable(self):
+    self.enabled = False
+
+  def reset(self):
+    with self._lock:
+      self._histograms = {}
+      self._counters = {}
+
+  def inc(self, name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with self._lock:
+      self._counters[key] = self._counters.get(key, 0) + amount
+
+  def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with self._lock:
+      hist = self._histograms.get(key)
+      if hist is None:
+        hist = self._histograms[key] = Histogram(buckets)
+      hist.observe(value)
+
+  def timed(self, name, candidates=None, label_args=(), **labels):
+    """
+    Decorator recording {name}_seconds for every call while enabled, plus
+    {name}_candidates when candidates(result) gives a result size. label_args
+    names function arguments to use as labels (e.g. 'mode').
+    """
+    def decorate(fn):
+      signature = inspect.signature(fn) if label_args else None
+
+      @functools.wraps(fn)
+      def wrapper(*args, **kwargs):
+        if not self.enabled:
+          return fn(*args, **kwargs)
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        tags = dict(labels)
+        if signature is not None:
+          bound = signature.bind(*args, **kwargs)
+          bound.apply_defaults()
+          tags.update((arg, str(bound.arguments[arg])) for arg in label_args)
+        self.observe(f"{name}_seconds", elapsed, **tags)
+        if candidates is not None:
+          self.observe(f"{name}_candidates", candidates(result), buckets=COUNT_BUCKETS, **tags)
+        return result
+      return wrapper
+    return decorate
+
+  # ----- export -----
+  def snapshot(self):
+    # JSON-friendly view: counters, and histograms with count/sum/mean/buckets
+    with self._lock:
+      counters = [{'name': n, 'labels': dict(l), 'value': v} for (n, l), v in sorted(self._counters.items())]
+      histograms = []
+      for (name, labels), h in sorted(self._histograms.items()):
+        histograms.append({
+          'name': name, 'labels': dict(labels), 'count': h.count, 'sum': h.sum,
+          'mean': h.sum / h.count if h.count else 0.0,
+          'buckets': {str(b): c for b, c in zip(list(h.buckets) + ['+Inf'], h.counts)},
+        })
+    return {'enabled': self.enabled, 'created': time.time(), 'counters': counters, 'histograms': histograms}
+
+  @staticmethod
+  def _labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+      return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+  def to_prometheus(self):
+    lines = []
+    with self._lock:
+      typed = set()
+      for (name, labels), value in sorted(self._counters.items()):
+        full = self.prefix + name
+        if full not in typed:
+          lines.append(f"# TYPE {full} counter")
+          typed.add(full)
+        lines.append(f"{full}{self._labels(labels)} {value}")
+      for (name, labels), h in sorted(self._histograms.items()):
+        full = self.prefix + name
+        if full not in typed:
+          lines.append(f"# TYPE {full} histogram")
+          typed.add(full)
+        cumulative = 0
+        for bound, count in zip(list(h.buckets) + ['+Inf'], h.counts):
+          cumulative += count
+          lines.append(f"{full}_bucket{self._labels(labels, ('le', bound))} {cumulative}")
+        lines.append(f"{full}_sum{self._labels(labels)} {h.sum}")
+        lines.append(f"{full}_count{self._labels(labels)} {h.count}")
+    return '\n'.join(lines) + '\n'
+
+  def write(self, path):
+    # JSON snapshot for a .json path, Prometheus text format otherwise
+    with open(path, 'w', encoding='utf-8') as f:
+      if path.lower().endswith('.json'):
+        json.dump(self.snapshot(), f, indent=2)
+      else:
+        f.write(self.to_prometheus())
+    return f"Metrics written to {path}"
+
+METRICS = MetricsRegistry(enabled=os.environ.get('TRIE_METRICS') == '1')
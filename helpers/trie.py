@@ -1,4 +1,8 @@
-import random
+import heapq
+import sys
+import time
+import tracemalloc
+from helpers.metrics import METRICS, COUNT_BUCKETS
 
 class TrieNode:
   def __init__(self):
@@ -9,24 +13,101 @@ class TrieNode:
     self.frequency = 0
     self.prefix_count = 0  # For advanced features
 
+class SearchBudget:
+  """
+  Node-visit and wall-clock limits for one trie query. spend() is called per
+  node visited and returns False once a limit is hit, with reason set to
+  'node_budget' or 'deadline'. The clock is only read every CLOCK_EVERY visits.
+  """
+  CLOCK_EVERY = 256
+
+  def __init__(self, max_nodes=None, timeout=None):
+    self.max_nodes = max_nodes
+    self.deadline = time.perf_counter() + timeout if timeout is not None else None
+    self.visited = 0
+    self.reason = None
+
+  def spend(self):
+    self.visited += 1
+    if self.max_nodes is not None and self.visited > self.max_nodes:
+      self.reason = 'node_budget'
+      return False
+    if (self.deadline is not None and self.visited % self.CLOCK_EVERY == 0
+        and time.perf_counter() > self.deadline):
+      self.reason = 'deadline'
+      return False
+    return True
+
+class LimitedMatches(list):
+  """
+  Result list of a query run with limits. When truncated, reason is
+  'too_broad' (the cost estimate exceeded max_cost, nothing was searched),
+  'node_budget' or 'deadline' (the list holds what was found before stopping).
+  """
+  def __init__(self, matches=(), reason=None, visited=0, estimate=None):
+    super().__init__(matches)
+    self.reason = reason
+    self.visited = visited
+    self.estimate = estimate
+
+  @property
+  def truncated(self):
+    return self.reason is not None
+
 class PrefixTrie:
   def __init__(self):
     # The trie starts with a root node and tracks total words inserted
     self.root = TrieNode()
     self.total_words = 0
+    # Per-depth fan-out statistics for estimate_cost: node count per depth and,
+    # per depth, how many of those nodes carry each character
+    self.level_nodes = [1]
+    self.level_chars = [{}]
 
   def insert(self, word, count=1):
     # Insert a word into the trie, updating prefix counts and frequency
     node = self.root
-    for char in word:
+    for depth, char in enumerate(word, 1):
       if char not in node.children:
         node.children[char] = TrieNode()
+        self._count_node(depth, char, 1)
       node = node.children[char]
       node.prefix_count += count
     node.is_end = True
     node.frequency += count
     self.total_words += count
 
+  def _count_node(self, depth, char, delta):
+    # Keep the per-depth statistics in step with node creation and removal
+    if depth == len(self.level_nodes):
+      self.level_nodes.append(0)
+      self.level_chars.append({})
+    self.level_nodes[depth] += delta
+    chars = self.level_chars[depth]
+    chars[char] = chars.get(char, 0) + delta
+
+  def estimate_cost(self, pattern):
+    """
+    Expected number of nodes find_matches visits for pattern, from the
+    per-depth statistics: a '*' multiplies the frontier by the average
+    fan-out at that depth, a letter by how often nodes one level up have a
+    child with that letter.
+    """
+    frontier = 1.0
+    cost = 1.0
+    for depth, char in enumerate(pattern, 1):
+      if depth >= len(self.level_nodes) or not self.level_nodes[depth - 1]:
+        break
+      parents = self.level_nodes[depth - 1]
+      if char == '*':
+        frontier *= self.level_nodes[depth] / parents
+      else:
+        frontier *= self.level_chars[depth].get(char, 0) / parents
+      if frontier == 0:
+        break
+      cost += frontier
+    return cost
+
   def search(self, word):
     # Check if a word exists in the trie
     node = self._get_node(word)
@@ -54,8 +135,13 @@ class PrefixTrie:
     if not node.is_end:
       return False
       
+    # Take the word's whole count back out of the totals along its path
+    count = node.frequency
+    for parent, char in nodes:
+      parent.children[char].prefix_count -= count
     node.is_end = False
-    self.total_words -= 1
+    node.frequency = 0
+    self.total_words -= count
     
     # Clean up nodes that are no longer needed
     for i in range(len(nodes)-1, -1, -1):
@@ -63,16 +149,124 @@ class PrefixTrie:
       child = parent.children[char]
       if not child.is_end and len(child.children) == 0:
         del parent.children[char]
+        self._count_node(i + 1, char, -1)
       else:
         break
     return True
 
+  def set_frequency(self, word, frequency):
+    # Set a word's frequency (inserting it if needed), keeping prefix counts
+    # and total_words consistent; a frequency of 0 deletes the word
+    if frequency <= 0:
+      return self.delete(word)
+    node = self._get_node(word)
+    if node is None or not node.is_end:
+      self.insert(word, frequency)
+      return True
+    delta = frequency - node.frequency
+    node = self.root
+    for char in word:
+      node = node.children[char]
+      node.prefix_count += delta
+    node.frequency = frequency
+    self.total_words += delta
+    return True
+
+  def stats(self):
+    """
+    Shape and memory report for capacity planning, from one iterative pass:
+    node/word counts, nodes per depth, children-per-node distribution,
+    lengths of single-child chains (non-word nodes with one child, which a
+    radix trie would merge) and sys.getsizeof estimates per structure. If
+    tracemalloc is tracing, also the bytes it attributes to this module.
+    """
+    depth_hist = {}
+    branching = {}
+    chains = {}
+    sizes = {'nodes': 0, 'children_dicts': 0, 'keys': 0, 'counters': 0}
+    nodes = words = max_depth = 0
+    stack = [(self.root, 0, 0)]
+    while stack:
+      node, depth, run = stack.pop()
+      nodes += 1
+      words += node.is_end
+      max_depth = max(max_depth, depth)
+      depth_hist[depth] = depth_hist.get(depth, 0) + 1
+      fanout = len(node.children)
+      branching[fanout] = branching.get(fanout, 0) + 1
+      # Not node.__dict__: touching it would materialise a dict per node
+      sizes['nodes'] += sys.getsizeof(node)
+      sizes['children_dicts'] += sys.getsizeof(node.children)
+      # Small ints and one-character Latin-1 strings are shared singletons
+      for value in (node.frequency, node.prefix_count):
+        if value > 256:
+          sizes['counters'] += sys.getsizeof(value)
+      # A chain continues through non-word nodes with exactly one child
+      single = fanout == 1 and not node.is_end and depth > 0
+      if single:
+        run += 1
+      elif run:
+        chains[run] = chains.get(run, 0) + 1
+        run = 0
+      for char, child in node.children.items():
+        if ord(char) > 255:
+          sizes['keys'] += sys.getsizeof(char)
+        stack.append((child, depth + 1, run))
+    sizes['level_stats'] = (sys.getsizeof(self.level_nodes)
+                            + sum(sys.getsizeof(d) for d in self.level_chars))
+    sizes['total'] = sum(sizes.values())
+    internal = nodes - branching.get(0, 0)
+    report = {
+      'nodes': nodes,
+      'words': words,
+      'total_frequency': self.total_words,
+      'max_depth': max_depth,
+      'depth_histogram': dict(sorted(depth_hist.items())),
+      'branching_histogram': dict(sorted(branching.items())),
+      'mean_branching': (nodes - 1) / internal if internal else 0.0,
+      'chain_histogram': dict(sorted(chains.items())),
+      'chain_nodes': sum(length * count for length, count in chains.items()),
+      'bytes': sizes,
+      'bytes_per_word': sizes['total'] / words if words else 0.0,
+    }
+    if tracemalloc.is_tracing():
+      snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, __file__)])
+      report['traced_bytes'] = sum(stat.size for stat in snapshot.statistics('filename'))
+    return report
+
   def get_all_words(self):
     # Return all words stored in the trie with their frequencies
     words = []
     self._dfs_collect(self.root, "", words)
     return words
 
+  def iter_words(self, sort=False):
+    # Yield (word, frequency) pairs lazily with an explicit stack;
+    # sort=True visits children alphabetically, so words come out in order
+    stack = [("", self.root)]
+    while stack:
+      prefix, node = stack.pop()
+      if node.is_end:
+        yield prefix, node.frequency
+      children = sorted(node.children.items()) if sort else list(node.children.items())
+      for char, child in reversed(children):
+        stack.append((prefix + char, child))
+
+  def complete(self, prefix, limit=10):
+    # Most frequent words starting with prefix, frequency descending then alphabetical
+    start = self._get_node(prefix)
+    if start is None:
+      return []
+    words = []
+    stack = [(prefix, start)]
+    while stack:
+      current, node = stack.pop()
+      if node.is_end:
+        words.append((current, node.frequency))
+      for char, child in node.children.items():
+        stack.append((current + char, child))
+    return heapq.nsmallest(limit, words, key=lambda x: (-x[1], x[0]))
+
   def _dfs_collect(self, node, prefix, words):
     # Helper for DFS traversal to collect words and their frequencies
     if node.is_end:
@@ -80,45 +274,72 @@ class PrefixTrie:
     for char, child in node.children.items():
       self._dfs_collect(child, prefix + char, words)
 
-  def find_matches(self, pattern):
-    # Find all words matching a pattern (supports '*' as wildcard)
+  @METRICS.timed('trie_find_matches', candidates=len)
+  def find_matches(self, pattern, max_nodes=None, timeout=None, max_cost=None):
+    # Find all words matching a pattern (supports '*' as wildcard).
+    # With any limit set, returns LimitedMatches (see _find_matches_limited)
+    if max_nodes is not None or timeout is not None or max_cost is not None:
+      return self._find_matches_limited(pattern, max_nodes, timeout, max_cost)
     matches = []
-    self._dfs_pattern_search(self.root, pattern, 0, "", matches)
+    visited = self._dfs_pattern_search(self.root, pattern, 0, "", matches)
+    if METRICS.enabled:
+      METRICS.observe('trie_find_matches_nodes_visited', visited, buckets=COUNT_BUCKETS)
+    return self._rank_matches(matches)
 
-    if not matches:
-        return []
+  def _find_matches_limited(self, pattern, max_nodes, timeout, max_cost):
+    # Refuse patterns whose estimated cost is over max_cost, and stop the walk
+    # after max_nodes visits or timeout seconds, keeping what was found
+    estimate = self.estimate_cost(pattern)
+    if max_cost is not None and estimate > max_cost:
+      if METRICS.enabled:
+        METRICS.inc('trie_find_matches_limited_total', reason='too_broad')
+      return LimitedMatches(reason='too_broad', estimate=estimate)
+    budget = SearchBudget(max_nodes, timeout)
+    matches = []
+    stack = [(self.root, 0, "")]
+    while stack:
+      if not budget.spend():
+        break
+      node, index, current = stack.pop()
+      if index == len(pattern):
+        if node.is_end:
+          matches.append((current, node.frequency))
+        continue
+      char = pattern[index]
+      if char == '*':
+        for child_char, child_node in node.children.items():
+          stack.append((child_node, index + 1, current + child_char))
+      elif char in node.children:
+        stack.append((node.children[char], index + 1, current + char))
+    if METRICS.enabled:
+      METRICS.observe('trie_find_matches_nodes_visited', budget.visited, buckets=COUNT_BUCKETS)
+      if budget.reason:
+        METRICS.inc('trie_find_matches_limited_total', reason=budget.reason)
+    return LimitedMatches(self._rank_matches(matches), budget.reason, budget.visited, estimate)
 
-    # Sort all matches by frequency descending, then alphabetically
+  def _rank_matches(self, matches):
+    # Order matches by frequency descending, then alphabetically, so equal
+    # inputs always give equal output (callers pick among ties themselves)
     matches.sort(key=lambda x: (-x[1], x[0]))
-
-    # Get max frequency *after sorting*
-    max_freq = matches[0][1]
-
-    # Split into top matches (same freq) and others
-    top_matches = [pair for pair in matches if pair[1] == max_freq]
-    other_matches = [pair for pair in matches if pair[1] < max_freq]
-
-    # Shuffle only top matches to vary order
-    random.shuffle(top_matches)
-
-    # Return combined list
-    return top_matches + other_matches
+    return matches
 
   def _dfs_pattern_search(self, node, pattern, index, current, matches):
-    # Helper for DFS pattern search with wildcard support
+    # Helper for DFS pattern search with wildcard support; returns nodes visited
     if index == len(pattern):
       if node.is_end:
         matches.append((current, node.frequency))
-      return
+      return 1
     
+    visited = 1
     char = pattern[index]
     if char == '*':
       # Wildcard: try all children
       for child_char, child_node in node.children.items():
-        self._dfs_pattern_search(child_node, pattern, index+1, current+child_char, matches)
+        visited += self._dfs_pattern_search(child_node, pattern, index+1, current+child_char, matches)
     elif char in node.children:
       # Match specific character
-      self._dfs_pattern_search(node.children[char], pattern, index+1, current+char, matches)
+      visited += self._dfs_pattern_search(node.children[char], pattern, index+1, current+char, matches)
+    return visited
 
   def visualize(self, node=None, prefix=""):
     # Print a visual representation of the trie structure in bracket format
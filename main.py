@@ -1,13 +1,16 @@
 from processors.trie_processor import TrieProcessor
 from processors.text_processor import TextProcessor
 from processors.batch_restorer import BatchRestorer
-from helpers.file_io import FileIO
+from helpers.file_io import FileIO, replacing_output
+from processors.suggestion_cache import SuggestionCache
 
 class Application:
   def __init__(self):
     """Initialize application components"""
     self.trie_processor = TrieProcessor()
-    self.text_processor = TextProcessor(self.trie_processor)
+    # Fuzzy results memo shared by Option 6 and fuzzy-mode restores
+    self.suggestion_cache = SuggestionCache()
+    self.text_processor = TextProcessor(self.trie_processor, self.suggestion_cache)
     self.file_io = FileIO()
     self.batch_restorer = BatchRestorer(self.text_processor, self.file_io)
     self.running = True
@@ -15,8 +18,11 @@ class Application:
     # state for Option 5 (context) and Option 6 (fuzzy)
     self._lm = None                 # language model for Option 5
     self._ctx_threshold = 0.6       # confidence threshold for Option 5
+    self._ctx_decoder = 'independent'  # 'independent' or 'beam' decoding for Option 5
     self._fuzzy_conf_on = True      # confusables toggle for Option 6
     self._fuzzy_max_dist = 1        # edit distance for Option 6
+    self._fuzzy_index_on = False    # deletion-index toggle for Option 6
+    self._fuzzy_index = None        # (confusables ON/OFF, DeletionIndex) kept across runs
   
   def display_header(self):
     """Display application header"""
@@ -66,15 +72,17 @@ class Application:
     """Print trie edit command instructions"""
     print("\n---------------------------------------------------------------")
     print("Construct/Edit Trie Commands:")
-    print("    '+', '-', '?', '#', '@', '~', '=', '!', '\\'")
+    print("    '+', '-', '?', '#', '$', '@', '~', '^', '=', '!', '\\'")
     print("---------------------------------------------------------------")
     print("    +sunshine        (Add a keyword)")
     print("    -moonlight       (Delete a keyword)")
     print("    ?rainbow         (Find a keyword)")
     print("    #                (Display Trie)")
+    print("    $                (Show Trie statistics and memory footprint)")
     print("    @                (Write Trie to file)")
     print("    ~                (Read keywords from file to make Trie)")
-    print("    =                (Write keywords from Trie to file)")
+    print("    ^                (Apply +word,freq / -word / =word,freq delta file)")
+    print("    =                (Write keywords from Trie to file, sorted or gzipped)")
     print("    !                (Print instructions)")
     print("    \\                (Exit)")
     print("---------------------------------------------------------------")
@@ -93,8 +101,10 @@ class Application:
         else f"Keyword '{arg}' is not present in the trie"
       ),
       '#': lambda: self.trie_processor.display_trie(),
+      '$': lambda: self.trie_processor.display_stats(),
       '@': lambda: FileIO.prompt_save_trie(self.trie_processor),
       '~': lambda: FileIO.prompt_load_keywords(self.trie_processor),
+      '^': lambda: FileIO.prompt_apply_keyword_delta(self.trie_processor),
       '=': lambda: FileIO.prompt_export_keywords(self.trie_processor),
       '!': self._print_trie_edit_instructions,
       '\\': lambda: self._exit_trie_edit_menu()
@@ -132,7 +142,7 @@ class Application:
     """Print text restore command instructions"""
     print("\n---------------------------------------------------------------")
     print("Predict/Restore Text Commands:")
-    print("    '~', '#', '$', '?', '&', '@', '!', '\\'")
+    print("    '~', '#', '$', '?', '&', '@', '%', '!', '\\'")
     print("---------------------------------------------------------------")
     print("  ~          (Read keywords from file to make Trie)")
     print("  #          (Display Trie)")
@@ -140,6 +150,7 @@ class Application:
     print("  ?ra*nb*w   (Restore a word using best keyword match)")
     print("  &          (Restore a text using all matching keywords)")
     print("  @          (Restore a text using best keyword matches)")
+    print("  %          (Restore a text allowing OCR typos around wildcards)")
     print("  !          (Print instructions)")
     print("  \\          (Exit)")
     print("---------------------------------------------------------------")
@@ -157,6 +168,7 @@ class Application:
       '?': lambda: print(f"Restored keyword: '{self.text_processor.restore_word(arg, 'best')}'"),
       '&': lambda: FileIO.prompt_process_text_file(self.text_processor, self.file_io, 'all'),
       '@': lambda: FileIO.prompt_process_text_file(self.text_processor, self.file_io, 'best'),
+      '%': lambda: FileIO.prompt_process_text_file(self.text_processor, self.file_io, 'fuzzy'),
       '!': self._print_text_restore_instructions,
       '\\': lambda: self._exit_restore_menu()
     }
@@ -177,11 +189,12 @@ class Application:
     """Print batch restore command instructions"""
     print("\n---------------------------------------------------------------")
     print("Batch Restore with Summary Commands:")
-    print("    '~', '#', 'r', '!', '\\'")
+    print("    '~', '#', 'r', 'u', '!', '\\'")
     print("---------------------------------------------------------------")
     print("     ~      (Read keywords from file to make Trie)")
     print("     #      (Display Trie)")
     print("     r      (Run batch restore on all .txt files in a folder)")
+    print("     u      (Update the last run's outputs after keyword changes)")
     print("     !      (Print instructions)")
     print("     \\      (Exit)")
     print("---------------------------------------------------------------")
@@ -209,8 +222,11 @@ class Application:
         elif command.lower() == 'r':
           from processors.batch_restorer import BatchRestorer
           BatchRestorer.prompt_run_batch_restore(self.batch_restorer)
+        elif command.lower() == 'u':
+          from processors.batch_restorer import BatchRestorer
+          BatchRestorer.prompt_refresh_outputs(self.batch_restorer)
         else:
-          print("Invalid command. Type '!', '~', '#', or 'r' to run batch restore.")
+          print("Invalid command. Type '!', '~', '#', 'u', or 'r' to run batch restore.")
       except KeyboardInterrupt:
         print("\nOperation cancelled.")
         return
@@ -287,20 +303,22 @@ class Application:
     """Print instructions for Context-Aware Restore"""
     print("\n---------------------------------------------------------------")
     print("Context-Aware Restore Commands:")
-    print("    '~', '#', 'C', 'T', '@', '!', '\\'")
+    print("    '~', '#', 'C', 'S', 'T', 'B', '@', '!', '\\'")
     print("---------------------------------------------------------------")
     print("  ~          (Read keywords from file to make Trie)")
     print("  #          (Display Trie)")
-    print("  C          (Load/Build corpus language model)")
+    print("  C          (Load saved model or build from corpus file)")
+    print("  S          (Save language model to binary file)")
     print("  T          (Set confidence threshold)")
+    print("  B          (Toggle joint beam-search decoding of each line)")
     print("  @          (Restore a text with context)")
     print("  !          (Print instructions)")
     print("  \\          (Exit)")
     print("---------------------------------------------------------------")
     if self._lm is None:
-      print("LM status: NOT LOADED | Threshold:", self._ctx_threshold)
+      print("LM status: NOT LOADED | Threshold:", self._ctx_threshold, "| Decoder:", self._ctx_decoder)
     else:
-      print("LM status: LOADED      | Threshold:", self._ctx_threshold)
+      print("LM status: LOADED      | Threshold:", self._ctx_threshold, "| Decoder:", self._ctx_decoder)
 
   def _handle_context_restore_command(self, command):
     """Process commands in Context-Aware Restore"""
@@ -311,7 +329,9 @@ class Application:
     '~': lambda: FileIO.prompt_load_keywords(self.trie_processor),
       '#': lambda: self.trie_processor.display_trie(),
       'C': self._load_corpus_language_model,
+      'S': self._save_language_model,
       'T': lambda: self._set_context_threshold(arg),
+      'B': self._toggle_context_decoder,
       '@': self._run_context_restore,
       '!': self._print_context_restore_instructions,
       '\\': lambda: self._exit_context_menu()
@@ -325,17 +345,45 @@ class Application:
     return True
 
   def _load_corpus_language_model(self):
-    """Load/build the bigram language model from a corpus file"""
+    """Load a saved bigram language model, or build one from a corpus file"""
     try:
-      from models.language_model import NGramLanguageModel
-      corpus_file = input("Please enter corpus file: ").strip()
-      self._lm = NGramLanguageModel(k=1.0)
+      from models.language_model import NGramLanguageModel, BackoffNGramModel, is_model_file, load_model_file
+      corpus_file = input("Please enter corpus or model file: ").strip()
+      if is_model_file(corpus_file):
+        self._lm = load_model_file(corpus_file)
+        print("Language model loaded.")
+        return
+      order = input("N-gram order (2 = bigram, 3+ = backoff) [default: 2]: ").strip()
+      order = int(order) if order else 2
       print("Building language model...")
-      self._lm.fit_from_file(corpus_file)
+      if order > 2:
+        self._lm = BackoffNGramModel(order=order)
+        self._lm.fit_from_file(corpus_file)
+      else:
+        lm = NGramLanguageModel(k=1.0)
+        lm.fit_from_file(corpus_file)
+        # Score with the array-backed compiled form of the fitted counts
+        self._lm = lm.compile()
       print("Language model loaded.")
     except Exception as e:
       print(f"Error loading language model: {e}")
 
+  def _save_language_model(self):
+    """Save the loaded language model in the binary format"""
+    if self._lm is None:
+      print("No language model loaded. Use 'C' to load/build one first.")
+      return
+    try:
+      model_file = input("Please enter output model file: ").strip()
+      print(self._lm.save(model_file))
+    except Exception as e:
+      print(f"Error saving language model: {e}")
+
+  def _toggle_context_decoder(self):
+    """Switch between per-wildcard and joint beam-search decoding"""
+    self._ctx_decoder = 'beam' if self._ctx_decoder == 'independent' else 'independent'
+    print(f"Decoder now {self._ctx_decoder}.")
+
   def _set_context_threshold(self, arg):
     """Set the confidence threshold (e.g., T0.75)"""
     try:
@@ -362,20 +410,16 @@ class Application:
       out_text  = input("Please enter output restored file: ").strip()
       out_csv   = input("Please enter output review CSV filename: ").strip()
 
-      with open(input_file, 'r', encoding='utf-8') as f:
-        raw = f.read()
-
-      restored, review_rows = self.text_processor.restore_text_with_context(
-        raw, self._lm, threshold=self._ctx_threshold
+      # Decode and restore the input a piece at a time, writing as we go
+      pieces = self.text_processor.restore_chunks_with_context(
+        FileIO.iter_text_chunks(input_file), self._lm, threshold=self._ctx_threshold, decoder=self._ctx_decoder
       )
-
-      with open(out_text, 'w', encoding='utf-8') as f:
-        f.write(restored)
-
-      with open(out_csv, 'w', encoding='utf-8') as f:
-        f.write('original,choice,confidence,left,right,candidates\n')
-        for orig, choice, conf, left, right, cands in review_rows:
-          f.write(f"{orig},{choice},{conf},{left},{right},{cands}\n")
+      with replacing_output(out_text, encoding='utf-8') as f_text, replacing_output(out_csv, encoding='utf-8') as f_csv:
+        f_csv.write('original,choice,confidence,left,right,candidates\n')
+        for restored, review_rows in pieces:
+          f_text.write(restored)
+          for orig, choice, conf, left, right, cands in review_rows:
+            f_csv.write(f"{orig},{choice},{conf},{left},{right},{cands}\n")
 
       print(f"Context restore complete.\n- Text: {out_text}\n- Review: {out_csv}")
     except Exception as e:
@@ -404,17 +448,21 @@ class Application:
     """Print instructions for Fuzzy Scan panel"""
     print("\n---------------------------------------------------------------")
     print("Fuzzy Scan & OCR Confusables Commands:")
-    print("    '~', '#', 'C', 'D', '@', '!', '\\'")
+    print("    '~', '#', 'C', 'D', 'X', 'M', '@', 'F', '!', '\\'")
     print("---------------------------------------------------------------")
     print("  ~          (Read keywords from file to make Trie)")
     print("  #          (Display Trie)")
     print("  C          (Toggle confusables on/off)")
     print("  D2         (Set max edit distance to 2; D1 for 1)")
+    print("  X          (Toggle deletion index for fuzzy lookup)")
+    print("  M          (Keep suggestion cache in a file; blank for memory only)")
     print("  @          (Suggest fuzzy fixes for a text)")
+    print("  F          (Fuzzy-scan a folder or .zip archive to a JSONL/CSV report)")
     print("  !          (Print instructions)")
     print("  \\          (Exit)")
     print("---------------------------------------------------------------")
-    print(f"Confusables: {'ON' if self._fuzzy_conf_on else 'OFF'} | MaxDist: {self._fuzzy_max_dist}")
+    print(f"Confusables: {'ON' if self._fuzzy_conf_on else 'OFF'} | MaxDist: {self._fuzzy_max_dist}"
+          f" | Index: {'ON' if self._fuzzy_index_on else 'OFF'}")
 
   def _handle_fuzzy_command(self, command):
     """Process commands in Fuzzy Scan panel"""
@@ -426,7 +474,10 @@ class Application:
       '#': lambda: self.trie_processor.display_trie(),
       'C': self._toggle_confusables,
       'D': lambda: self._set_fuzzy_maxdist(arg),
+      'X': self._toggle_fuzzy_index,
+      'M': self._set_suggestion_cache_file,
       '@': self._run_fuzzy_on_file,
+      'F': self._run_fuzzy_on_folder,
       '!': self._print_fuzzy_instructions,
       '\\': lambda: self._exit_fuzzy_menu()
     }
@@ -443,6 +494,40 @@ class Application:
     self._fuzzy_conf_on = not self._fuzzy_conf_on
     print(f"Confusables now {'ON' if self._fuzzy_conf_on else 'OFF'}.")
 
+  def _toggle_fuzzy_index(self):
+    """Toggle the deletion-neighbourhood index on/off"""
+    self._fuzzy_index_on = not self._fuzzy_index_on
+    if not self._fuzzy_index_on and self._fuzzy_index is not None:
+      self._fuzzy_index[1].close()
+      self._fuzzy_index = None
+    print(f"Deletion index now {'ON' if self._fuzzy_index_on else 'OFF'}.")
+
+  def _set_suggestion_cache_file(self):
+    """Back the shared suggestion cache with an on-disk store (or memory only)"""
+    try:
+      path = input("Please enter suggestion cache file (blank for memory only): ").strip()
+      self.suggestion_cache.close()
+      self.suggestion_cache = SuggestionCache(path or None)
+      # Share the new cache with fuzzy restores and batch runs; the processors
+      # themselves (seed, limits, the last batch run's pattern index) are kept
+      self.text_processor.set_suggestion_cache(self.suggestion_cache)
+      self.batch_restorer.suggestion_cache = self.suggestion_cache
+      print(f"Suggestion cache now {'stored in ' + path if path else 'in memory'}.")
+    except Exception as e:
+      print(f"Error opening suggestion cache: {e}")
+
+  def _attach_fuzzy_index(self, searcher):
+    """Reuse the deletion index across runs, rebuilding it when confusables change"""
+    from processors.deletion_index import DeletionIndex
+    if self._fuzzy_index is not None and self._fuzzy_index[0] != self._fuzzy_conf_on:
+      self._fuzzy_index[1].close()
+      self._fuzzy_index = None
+    if self._fuzzy_index is None:
+      index = DeletionIndex(self.trie_processor, max_dist=2, confusables=searcher.conf)
+      index.build()
+      self._fuzzy_index = (self._fuzzy_conf_on, index)
+    searcher.index = self._fuzzy_index[1]
+
   def _set_fuzzy_maxdist(self, arg):
     """Set max edit distance: D1 or D2 (or prompt)"""
     try:
@@ -456,6 +541,16 @@ class Application:
     except Exception as e:
       print(f"Invalid value: {e}")
 
+  def _run_fuzzy_on_folder(self):
+    """Run a deduplicated, optionally parallel fuzzy scan over a folder or archive"""
+    from processors.fuzzy_scan import FolderFuzzyScanner
+    from processors.fuzzy_search import default_confusables
+    conf_map = default_confusables() if self._fuzzy_conf_on else {}
+    scanner = FolderFuzzyScanner(self.trie_processor, confusables=conf_map, cache=self.suggestion_cache)
+    self.suggestion_cache.reset_stats()
+    FolderFuzzyScanner.prompt_run_fuzzy_scan(scanner, max_dist=self._fuzzy_max_dist)
+    print(self.suggestion_cache.report())
+
   def _run_fuzzy_on_file(self):
     """Run fuzzy suggestions over a text file"""
     try:
@@ -463,18 +558,21 @@ class Application:
       input_file = input("Please enter input file: ").strip()
       out_suggestions = input("Please enter output suggestions file: ").strip()
 
-      with open(input_file, 'r', encoding='utf-8') as f:
-        raw = f.read()
-
       conf_map = default_confusables() if self._fuzzy_conf_on else {}
-      searcher = TrieFuzzySearcher(self.trie_processor, confusables=conf_map)
-      suggestions = searcher.suggest_for_text(raw, max_dist=self._fuzzy_max_dist)
-
-      with open(out_suggestions, 'w', encoding='utf-8') as f:
-        for tok, suggs in suggestions:
-          f.write(f"{tok} -> {suggs}\n")
-
+      searcher = TrieFuzzySearcher(self.trie_processor, confusables=conf_map, cache=self.suggestion_cache)
+      self.suggestion_cache.reset_stats()
+      if self._fuzzy_index_on:
+        self._attach_fuzzy_index(searcher)
+      # Suggestions are per token, so the input can be scanned a piece at a time
+      chunks = FileIO.iter_text_chunks(input_file)
+      with replacing_output(out_suggestions, encoding='utf-8') as f:
+        for chunk in chunks:
+          for tok, suggs in searcher.suggest_for_text(chunk, max_dist=self._fuzzy_max_dist):
+            f.write(f"{tok} -> {suggs}\n")
+
+      self.suggestion_cache.flush()
       print(f"Fuzzy suggestions complete.")
+      print(self.suggestion_cache.report())
     except Exception as e:
       print(f"Error running fuzzy repair: {e}")
 
@@ -516,6 +614,11 @@ class Application:
 # Main application entry point
 # ===============================
 if __name__ == "__main__":
+  import sys
+  if len(sys.argv) > 1:
+    # Arguments given: run the scriptable command line instead of the menus
+    from cli import main as cli_main
+    sys.exit(cli_main(sys.argv[1:]))
   # Start the application
   app = Application()
   app.run()
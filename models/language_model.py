@@ -1,28 +1,67 @@
 import re
-from collections import defaultdict, Counter
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 import math
+import mmap
+import struct
+import sys
+
+from helpers.metrics import METRICS
+
+try:
+  import numpy as np
+except ImportError:  # NumPy is optional; the compiled model falls back to bisect
+  np = None
+
+def _tokenize_lines(text):
+  # Simple tokenizer: words + sentence boundaries
+  seq = []
+  for line in text.split('\n'):
+    if not line.strip():
+      continue
+    tokens = re.findall(r"[A-Za-z0-9']+", line.lower())
+    if tokens:
+      seq.append('<s>')
+      seq.extend(tokens)
+      seq.append('</s>')
+  return seq
+
+def _count_chunk(text):
+  # Count unigrams and (prev, word) bigrams for one line-aligned chunk.
+  # Runs in worker processes, so it must stay a picklable module-level function.
+  tokens = _tokenize_lines(text)
+  unigrams = Counter(tokens)
+  bigrams = Counter(zip(tokens, tokens[1:]))
+  return unigrams, bigrams, bool(tokens)
+
+def _iter_line_chunks(path, chunk_size):
+  # Stream a corpus file as chunks of whole lines of roughly chunk_size chars
+  with open(path, 'r', encoding='utf-8') as f:
+    while True:
+      lines = f.readlines(chunk_size)
+      if not lines:
+        return
+      yield ''.join(lines)
 
 class NGramLanguageModel:
+  order = 2
+
   def __init__(self, k=1.0):
     # Add-k smoothing constant
     self.k = k
     self.unigrams = Counter()
     self.bigrams = defaultdict(Counter)
+    # Per-context totals so a probability never re-sums the successor counts
+    self.context_totals = Counter()
     self.V = 0
+    # True once update() has counted tokens, so the next call's first
+    # sentence is joined to the last one by a '</s>' -> '<s>' bigram
+    self._updated = False
 
   def _tokenize(self, text):
-    # Simple tokenizer: words + sentence boundaries
-    lines = text.split('\n')
-    seq = []
-    for line in lines:
-      if not line.strip():
-        continue
-      tokens = re.findall(r"[A-Za-z0-9']+", line.lower())
-      if tokens:
-        seq.append('<s>')
-        seq.extend(tokens)
-        seq.append('</s>')
-    return seq
+    return _tokenize_lines(text)
 
   def fit_from_file(self, corpus_filename):
     with open(corpus_filename, 'r', encoding='utf-8') as f:
@@ -33,11 +72,74 @@ class NGramLanguageModel:
       if i > 0:
         prev = tokens[i-1]
         self.bigrams[prev][w] += 1
+        self.context_totals[prev] += 1
+    self.V = len(self.unigrams)
+
+  def _merge_counts(self, unigrams, bigrams):
+    # Fold partial counts into the model
+    self.unigrams.update(unigrams)
+    for (prev, w), c in bigrams.items():
+      self.bigrams[prev][w] += c
+      self.context_totals[prev] += c
+
+  def update(self, text):
+    """
+    Incrementally add new corpus text to the model, continuing the token
+    stream of earlier update() calls: updating with whole lines piece by
+    piece gives the same counts as one update() with all of them.
+    """
+    unigrams, bigrams, has_tokens = _count_chunk(text)
+    if has_tokens and self._updated:
+      bigrams[('</s>', '<s>')] += 1
+    self._merge_counts(unigrams, bigrams)
+    self._updated = self._updated or has_tokens
+    self.V = len(self.unigrams)
+
+  def fit_from_files(self, paths, workers=1, chunk_size=1 << 22):
+    """
+    Stream one or more corpus files in line-aligned chunks and count them,
+    in a process pool when workers > 1. The result matches calling
+    fit_from_file on each path in turn, without loading any file whole.
+    """
+    if isinstance(paths, str):
+      paths = [paths]
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+      for path in paths:
+        # Chunks are merged in order so the '</s>' -> '<s>' bigram that joins
+        # the last sentence of one chunk to the first of the next is kept
+        prev_had_tokens = False
+        pending = deque()
+
+        def merge_next():
+          nonlocal prev_had_tokens
+          unigrams, bigrams, has_tokens = pending.popleft().result()
+          if has_tokens and prev_had_tokens:
+            bigrams[('</s>', '<s>')] += 1
+          self._merge_counts(unigrams, bigrams)
+          prev_had_tokens = prev_had_tokens or has_tokens
+
+        for chunk in _iter_line_chunks(path, chunk_size):
+          if executor is None:
+            pending.append(_ImmediateResult(_count_chunk(chunk)))
+          else:
+            pending.append(executor.submit(_count_chunk, chunk))
+          # Bound the number of chunks held in memory at once
+          while len(pending) > max(1, workers) * 2:
+            merge_next()
+        while pending:
+          merge_next()
+    finally:
+      if executor is not None:
+        executor.shutdown()
     self.V = len(self.unigrams)
 
   def prob_bigram(self, prev, word):
-    num = self.bigrams[prev][word] + self.k
-    den = sum(self.bigrams[prev].values()) + self.k * max(1, self.V)
+    # Use .get so querying an unseen context does not insert an empty Counter
+    successors = self.bigrams.get(prev)
+    count = successors.get(word, 0) if successors else 0
+    num = count + self.k
+    den = self.context_totals.get(prev, 0) + self.k * max(1, self.V)
     return num / den
 
   def logprob_context(self, left_word, word, right_word=None):
@@ -47,6 +149,7 @@ class NGramLanguageModel:
       lp += math.log(self.prob_bigram(word, right_word))
     return lp
 
+  @METRICS.timed('lm_choose_best', candidates=lambda r: len(r[2]), model='bigram_counts')
   def choose_best(self, candidates, left_word, right_word=None):
     if not candidates:
       return None, 0.0, {}
@@ -62,4 +165,541 @@ class NGramLanguageModel:
     probs = {w: exps[w] / Z for w in exps}
     best = max(scores.items(), key=lambda kv: kv[1])[0]
     confidence = probs[best]
-    return best, confidence, scores
\ No newline at end of file
+    return best, confidence, scores
+
+  def compile(self):
+    # Freeze the current counts into an integer-ID, array-backed model
+    return CompiledBigramModel.from_model(self)
+
+  def save(self, path):
+    # Write the model in the compact binary format
+    return self.compile().save(path)
+
+  @staticmethod
+  def load(path, use_mmap=True):
+    """
+    Load a model written by save(). Returns a CompiledBigramModel whose
+    arrays are views over an mmap of the file (or a plain read if
+    use_mmap is False); call to_model() on it for a mutable model.
+    """
+    return CompiledBigramModel.load(path, use_mmap=use_mmap)
+
+# Binary model layout (little-endian):
+#   header: magic, version, k, V, nnz, vocab byte length
+#   vocab:  '\n'-joined UTF-8 tokens, zero-padded to 8 bytes
+#   int64 arrays: unigram counts[V], totals[V], row_ptr[V+1], cols[nnz], counts[nnz]
+_MODEL_MAGIC = b'NGLM'
+_MODEL_VERSION = 1
+_MODEL_HEADER = struct.Struct('<4sIdQQQ')
+
+def is_model_file(path):
+  # True when the file starts with one of the binary model magic bytes
+  try:
+    with open(path, 'rb') as f:
+      return f.read(len(_MODEL_MAGIC)) in (_MODEL_MAGIC, _BACKOFF_MAGIC)
+  except OSError:
+    return False
+
+def load_model_file(path, use_mmap=True):
+  # Load a saved bigram or backoff model, whichever the file holds
+  with open(path, 'rb') as f:
+    magic = f.read(len(_MODEL_MAGIC))
+  if magic == _BACKOFF_MAGIC:
+    return BackoffNGramModel.load(path, use_mmap=use_mmap)
+  return CompiledBigramModel.load(path, use_mmap=use_mmap)
+
+class _ImmediateResult:
+  # Future-like wrapper for chunks counted in-process (workers=1)
+  def __init__(self, value):
+    self._value = value
+
+  def result(self):
+    return self._value
+
+class CompiledBigramModel:
+  """
+  Read-only bigram model with the same scoring interface as NGramLanguageModel.
+  Tokens are interned to integer IDs and the bigram counts are stored CSR-style:
+  row_ptr[c]..row_ptr[c+1] slices the sorted successor IDs (cols) and their
+  counts for context c. Per-context totals are precomputed.
+  """
+  order = 2
+
+  def __init__(self, id_to_token, row_ptr, cols, counts, totals, k=1.0, unigram_counts=None):
+    self.k = k
+    self.id_to_token = list(id_to_token)
+    self.vocab = {w: i for i, w in enumerate(self.id_to_token)}
+    self.V = len(self.id_to_token)
+    self.row_ptr = row_ptr
+    self.cols = cols
+    self.counts = counts
+    self.totals = totals
+    self.unigram_counts = unigram_counts
+    self._mmap = None  # keeps an mmap-backed file open while views are alive
+    self._keys = None  # flat (context * V + word) keys for vectorized lookups
+
+  @classmethod
+  def from_model(cls, model):
+    # Intern tokens in sorted order so the layout is deterministic
+    id_to_token = sorted(model.unigrams)
+    vocab = {w: i for i, w in enumerate(id_to_token)}
+    row_ptr = array('q', [0])
+    cols = array('q')
+    counts = array('q')
+    totals = array('q')
+    unigram_counts = array('q', (model.unigrams[w] for w in id_to_token))
+    for w in id_to_token:
+      successors = model.bigrams.get(w)
+      if successors:
+        for succ_id, c in sorted((vocab[s], c) for s, c in successors.items()):
+          cols.append(succ_id)
+          counts.append(c)
+      row_ptr.append(len(cols))
+      totals.append(model.context_totals.get(w, 0))
+    return cls(id_to_token, row_ptr, cols, counts, totals, k=model.k, unigram_counts=unigram_counts)
+
+  def to_model(self):
+    # Thaw back into a mutable NGramLanguageModel (e.g. to update() it)
+    model = NGramLanguageModel(k=self.k)
+    for i, w in enumerate(self.id_to_token):
+      model.unigrams[w] = self.unigram_counts[i] if self.unigram_counts is not None else 0
+      lo, hi = self.row_ptr[i], self.row_ptr[i + 1]
+      if hi > lo:
+        successors = model.bigrams[w]
+        for j in range(lo, hi):
+          successors[self.id_to_token[self.cols[j]]] = self.counts[j]
+      if self.totals[i]:
+        model.context_totals[w] = self.totals[i]
+    model.V = len(model.unigrams)
+    return model
+
+  def save(self, path):
+    """Write the vocabulary, count arrays, totals and k to a binary file."""
+    vocab = '\n'.join(self.id_to_token).encode('utf-8')
+    padding = -len(vocab) % 8
+    unigram_counts = self.unigram_counts if self.unigram_counts is not None else [0] * self.V
+    with open(path, 'wb') as f:
+      f.write(_MODEL_HEADER.pack(_MODEL_MAGIC, _MODEL_VERSION, self.k, self.V, len(self.cols), len(vocab)))
+      f.write(vocab + b'\0' * padding)
+      for values in (unigram_counts, self.totals, self.row_ptr, self.cols, self.counts):
+        f.write(_le_bytes(values))
+    return f"Language model saved to {path}"
+
+  @classmethod
+  def load(cls, path, use_mmap=True):
+    with open(path, 'rb') as f:
+      if use_mmap:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      else:
+        buf = f.read()
+    magic, version, k, V, nnz, vocab_len = _MODEL_HEADER.unpack_from(buf, 0)
+    if magic != _MODEL_MAGIC or version != _MODEL_VERSION:
+      raise ValueError(f"{path} is not a language model file")
+    offset = _MODEL_HEADER.size
+    vocab = bytes(buf[offset:offset + vocab_len]).decode('utf-8')
+    id_to_token = vocab.split('\n') if V else []
+    offset += vocab_len + (-vocab_len % 8)
+
+    view = memoryview(buf)
+    arrays = []
+    for length in (V, V, V + 1, nnz, nnz):
+      nbytes = length * 8
+      chunk = view[offset:offset + nbytes]
+      if sys.byteorder == 'big':
+        # Byte-swapped copy; the zero-copy mmap path needs a little-endian host
+        arr = array('q', bytes(chunk))
+        arr.byteswap()
+        arrays.append(arr)
+      else:
+        arrays.append(chunk.cast('q'))
+      offset += nbytes
+    unigram_counts, totals, row_ptr, cols, counts = arrays
+    model = cls(id_to_token, row_ptr, cols, counts, totals, k=k, unigram_counts=unigram_counts)
+    if use_mmap:
+      model._mmap = buf
+    return model
+
+  def token_id(self, word):
+    # Integer ID of a token, or -1 when out of vocabulary
+    return self.vocab.get(word, -1)
+
+  def _count(self, prev_id, word_id):
+    # Binary search the successor slice of prev_id for word_id
+    if prev_id < 0 or word_id < 0:
+      return 0
+    lo, hi = self.row_ptr[prev_id], self.row_ptr[prev_id + 1]
+    pos = bisect_left(self.cols, word_id, lo, hi)
+    if pos < hi and self.cols[pos] == word_id:
+      return self.counts[pos]
+    return 0
+
+  def _total(self, prev_id):
+    return self.totals[prev_id] if prev_id >= 0 else 0
+
+  def prob_bigram(self, prev, word):
+    prev_id = self.token_id(prev)
+    num = self._count(prev_id, self.token_id(word)) + self.k
+    den = self._total(prev_id) + self.k * max(1, self.V)
+    return num / den
+
+  def logprob_context(self, left_word, word, right_word=None):
+    lp = 0.0
+    lp += math.log(self.prob_bigram(left_word, word))
+    if right_word is not None:
+      lp += math.log(self.prob_bigram(word, right_word))
+    return lp
+
+  def _flat_keys(self):
+    # Expand the CSR rows into one sorted key array (built once, on demand)
+    if self._keys is None:
+      row_ptr = np.asarray(self.row_ptr, dtype=np.int64)
+      cols = np.asarray(self.cols, dtype=np.int64)
+      rows = np.repeat(np.arange(self.V, dtype=np.int64), np.diff(row_ptr))
+      self._keys = rows * max(1, self.V) + cols
+      self._np_counts = np.asarray(self.counts, dtype=np.int64)
+      self._np_totals = np.asarray(self.totals, dtype=np.int64)
+    return self._keys
+
+  def _lookup_counts(self, prev_ids, word_ids):
+    # Vectorized bigram counts for parallel arrays of context and word IDs
+    keys = self._flat_keys()
+    valid = (prev_ids >= 0) & (word_ids >= 0)
+    query = np.where(valid, prev_ids * max(1, self.V) + word_ids, 0)
+    if not len(keys):
+      return np.zeros(len(query), dtype=np.int64)
+    pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    found = valid & (keys[pos] == query)
+    return np.where(found, self._np_counts[pos], 0)
+
+  def score_candidates(self, candidates, left_word, right_word=None):
+    # Log-probabilities for every candidate in one vectorized pass
+    if np is None:
+      return [self.logprob_context(left_word, c, right_word) for c in candidates]
+    self._flat_keys()
+    smooth = self.k * max(1, self.V)
+    cand_ids = np.fromiter((self.token_id(c) for c in candidates), dtype=np.int64, count=len(candidates))
+    left_id = self.token_id(left_word)
+    left_ids = np.full(len(candidates), left_id, dtype=np.int64)
+    num = self._lookup_counts(left_ids, cand_ids) + self.k
+    lp = np.log(num / (self._total(left_id) + smooth))
+    if right_word is not None:
+      right_ids = np.full(len(candidates), self.token_id(right_word), dtype=np.int64)
+      num = self._lookup_counts(cand_ids, right_ids) + self.k
+      cand_totals = np.where(cand_ids >= 0, self._np_totals[np.maximum(cand_ids, 0)], 0)
+      lp = lp + np.log(num / (cand_totals + smooth))
+    return lp.tolist()
+
+  @METRICS.timed('lm_choose_best', candidates=lambda r: len(r[2]), model='bigram_compiled')
+  def choose_best(self, candidates, left_word, right_word=None):
+    if not candidates:
+      return None, 0.0, {}
+    scores = {}
+    for c, s in zip(candidates, self.score_candidates(candidates, left_word, right_word)):
+      scores[c] = s
+    max_score = max(scores.values())
+    exps = {w: math.exp(s - max_score) for w, s in scores.items()}
+    Z = sum(exps.values())
+    best = max(scores.items(), key=lambda kv: kv[1])[0]
+    confidence = exps[best] / Z
+    return best, confidence, scores
+
+# Backoff model layout (little-endian):
+#   header: magic, version, order, alpha, k, V, N, vocab byte length
+#   vocab:  '\n'-joined UTF-8 tokens, zero-padded to an 8-byte file offset
+#   int64 arrays: array lengths, unigram counts, then (keys, counts) per table
+# Version 1 files padded the vocab by its own length, leaving the arrays 4
+# bytes off alignment; they still load.
+_BACKOFF_MAGIC = b'NGBO'
+_BACKOFF_VERSION = 2
+_BACKOFF_HEADER = struct.Struct('<4sIIddQQQ')
+
+class BackoffNGramModel:
+  """
+  General n-gram model (order >= 2) scored with stupid backoff:
+  S(w | ctx) = c(ctx, w) / c(ctx) when the n-gram was seen, otherwise
+  alpha * S(w | shorter ctx), bottoming out at an add-k unigram estimate.
+
+  Counts are frozen into sorted int64 arrays of bit-packed token IDs per
+  order. min_count prunes rare higher-order n-grams and max_bytes raises the
+  pruning threshold (highest order first) until the arrays fit the budget.
+  Freezing drops the raw counts, so max_bytes bounds the whole model; pass
+  keep_counts=True to keep them for update() after freezing.
+  """
+  def __init__(self, order=3, alpha=0.4, k=1.0, min_count=1, max_bytes=None, keep_counts=False):
+    if order < 2:
+      raise ValueError("order must be at least 2")
+    self.order = order
+    self.alpha = alpha
+    self.k = k
+    self.min_count = min_count
+    self.max_bytes = max_bytes
+    self.keep_counts = keep_counts
+    # Raw counts while fitting: n-gram tuples per order and context totals
+    self._ngrams = [None] + [Counter() for _ in range(order)]
+    self._ctx_totals = [None] + [Counter() for _ in range(order - 1)]
+    self._tail = []  # last order-1 tokens of the stream, for chunked fitting
+    self._frozen = False
+    self._mmap = None
+    # Set by load() and by freeze() without keep_counts: only the (possibly
+    # pruned) tables exist, no raw counts
+    self._read_only = False
+
+  # ----- fitting -----
+  def _count_tokens(self, tokens):
+    n = self.order
+    seq = self._tail + tokens
+    start = len(self._tail)
+    for i in range(start, len(seq)):
+      for m in range(1, n + 1):
+        if i - m + 1 < 0:
+          break
+        gram = tuple(seq[i - m + 1:i + 1])
+        self._ngrams[m][gram] += 1
+        if m > 1:
+          self._ctx_totals[m - 1][gram[:-1]] += 1
+    self._tail = seq[-(n - 1):] if seq else []
+    self._frozen = False
+    self._maybe_prune_while_fitting()
+
+  def _maybe_prune_while_fitting(self):
+    # Keep fitting memory bounded: once the highest-order table is far past
+    # the budget, drop its singletons (context totals are kept exact)
+    if not self.max_bytes:
+      return
+    top = self._ngrams[self.order]
+    if len(top) * 200 > 4 * self.max_bytes:
+      for gram in [g for g, c in top.items() if c <= 1]:
+        del top[gram]
+
+  def update(self, text):
+    # Count more corpus text, continuing the token stream seen so far
+    if self._read_only:
+      raise ValueError("This backoff model has no raw counts (it was loaded, or frozen without "
+                       "keep_counts=True); refit from the corpus to add text")
+    self._count_tokens(_tokenize_lines(text))
+
+  def fit_from_file(self, corpus_filename):
+    self.fit_from_files([corpus_filename])
+
+  def fit_from_files(self, paths, chunk_size=1 << 22):
+    # Stream each corpus in line-aligned chunks, then freeze the counts
+    if isinstance(paths, str):
+      paths = [paths]
+    for path in paths:
+      for chunk in _iter_line_chunks(path, chunk_size):
+        self.update(chunk)
+      self._tail = []
+    self.freeze()
+
+  # ----- compact storage -----
+  def freeze(self):
+    """Intern tokens, prune and pack the counts into sorted int64 arrays."""
+    if self._read_only:
+      return self
+    unigrams = self._ngrams[1]
+    self.id_to_token = sorted(w for (w,) in unigrams)
+    self.vocab = {w: i for i, w in enumerate(self.id_to_token)}
+    self.V = len(self.id_to_token)
+    self.N = sum(unigrams.values())
+    self.bits = max(1, self.V.bit_length())
+    if self.bits * self.order > 63:
+      raise ValueError("Vocabulary too large to pack this order into 64-bit keys")
+    self.unigram_counts = array('q', (unigrams[(w,)] for w in self.id_to_token))
+
+    thresholds = [0, 0] + [self.min_count] * (self.order - 1)
+    while True:
+      tables = [None, None]
+      ctx_tables = [None]
+      for m in range(2, self.order + 1):
+        kept = {g: c for g, c in self._ngrams[m].items() if c >= thresholds[m]}
+        tables.append(self._pack(kept))
+        # Only contexts of surviving n-grams need their totals stored
+        contexts = {g[:-1] for g in kept}
+        ctx_tables.append(self._pack({g: c for g, c in self._ctx_totals[m - 1].items() if g in contexts}))
+      size = self._table_bytes(tables, ctx_tables)
+      if not self.max_bytes or size <= self.max_bytes or not self._raise_threshold(thresholds):
+        break
+    self._tables = tables
+    self._ctx_tables = ctx_tables
+    self._frozen = True
+    if not self.keep_counts:
+      self._ngrams = self._ctx_totals = None
+      self._tail = []
+      self._read_only = True
+    return self
+
+  def _raise_threshold(self, thresholds):
+    # Prune the highest order that still has entries above its threshold
+    for m in range(self.order, 1, -1):
+      if any(c > thresholds[m] for c in self._ngrams[m].values()):
+        thresholds[m] = max(thresholds[m] + 1, thresholds[m] * 2)
+        return True
+    return False
+
+  def _pack_key(self, ids):
+    key = 0
+    for i in ids:
+      key = (key << self.bits) | i
+    return key
+
+  def _pack(self, counter):
+    # Sorted (keys, counts) arrays for a table of token tuples
+    items = sorted((self._pack_key(self.vocab[w] for w in gram), c) for gram, c in counter.items())
+    return array('q', (k for k, _ in items)), array('q', (c for _, c in items))
+
+  def _table_bytes(self, tables=None, ctx_tables=None):
+    tables = tables if tables is not None else self._tables
+    ctx_tables = ctx_tables if ctx_tables is not None else self._ctx_tables
+    size = len(self.unigram_counts) * 8
+    for keys, counts in tables[2:] + ctx_tables[1:]:
+      size += (len(keys) + len(counts)) * 8
+    return size
+
+  def model_bytes(self):
+    # Bytes used by the packed count arrays (what save() writes, minus vocab)
+    self._ensure_frozen()
+    return self._table_bytes()
+
+  def num_ngrams(self):
+    self._ensure_frozen()
+    return [self.V] + [len(keys) for keys, _ in self._tables[2:]]
+
+  def _ensure_frozen(self):
+    if not self._frozen:
+      self.freeze()
+
+  # ----- scoring -----
+  @staticmethod
+  def _lookup(table, key):
+    keys, counts = table
+    pos = bisect_left(keys, key)
+    if pos < len(keys) and keys[pos] == key:
+      return counts[pos]
+    return 0
+
+  def _score(self, ids, word_id):
+    # Stupid backoff log-score of word_id after the context ids
+    penalty = 0.0
+    log_alpha = math.log(self.alpha)
+    if word_id >= 0:
+      for m in range(min(len(ids), self.order - 1), 0, -1):
+        ctx = ids[-m:]
+        if min(ctx) < 0:
+          penalty += log_alpha
+          continue
+        ctx_key = self._pack_key(ctx)
+        count = self._lookup(self._tables[m + 1], (ctx_key << self.bits) | word_id)
+        if count:
+          total = self._lookup(self._ctx_tables[m], ctx_key)
+          return penalty + math.log(count / total)
+        penalty += log_alpha
+      count = self.unigram_counts[word_id]
+    else:
+      penalty += log_alpha * min(len(ids), self.order - 1)
+      count = 0
+    return penalty + math.log((count + self.k) / (self.N + self.k * max(1, self.V)))
+
+  def _ids(self, words):
+    return [self.vocab.get(w, -1) for w in words]
+
+  @staticmethod
+  def _as_words(context):
+    if context is None:
+      return []
+    if isinstance(context, str):
+      return [context]
+    return list(context)
+
+  def logprob_context(self, left_word, word, right_word=None):
+    """
+    Score word between its contexts. left_word and right_word may be a single
+    word or a sequence (left: oldest first, right: nearest first); up to
+    order-1 words on each side are used.
+    """
+    self._ensure_frozen()
+    n = self.order
+    left = self._ids(self._as_words(left_word)[-(n - 1):])
+    right = self._ids(self._as_words(right_word)[:n - 1])
+    word_id = self.vocab.get(word, -1)
+    lp = self._score(left, word_id)
+    seq = left + [word_id]
+    for r in right:
+      lp += self._score(seq[-(n - 1):], r)
+      seq.append(r)
+    return lp
+
+  @METRICS.timed('lm_choose_best', candidates=lambda r: len(r[2]), model='backoff')
+  def choose_best(self, candidates, left_word, right_word=None):
+    if not candidates:
+      return None, 0.0, {}
+    scores = {c: self.logprob_context(left_word, c, right_word) for c in candidates}
+    max_score = max(scores.values())
+    exps = {w: math.exp(s - max_score) for w, s in scores.items()}
+    Z = sum(exps.values())
+    best = max(scores.items(), key=lambda kv: kv[1])[0]
+    return best, exps[best] / Z, scores
+
+  # ----- persistence -----
+  def save(self, path):
+    """Write vocabulary, packed count arrays and parameters to a binary file."""
+    self._ensure_frozen()
+    vocab = '\n'.join(self.id_to_token).encode('utf-8')
+    arrays = [self.unigram_counts]
+    for keys, counts in self._tables[2:] + self._ctx_tables[1:]:
+      arrays.extend([keys, counts])
+    with open(path, 'wb') as f:
+      f.write(_BACKOFF_HEADER.pack(_BACKOFF_MAGIC, _BACKOFF_VERSION, self.order, self.alpha, self.k,
+                                   self.V, self.N, len(vocab)))
+      f.write(vocab + b'\0' * (-(_BACKOFF_HEADER.size + len(vocab)) % 8))
+      f.write(_le_bytes([len(a) for a in arrays]))
+      for arr in arrays:
+        f.write(_le_bytes(arr))
+    return f"Language model saved to {path}"
+
+  @classmethod
+  def load(cls, path, use_mmap=True):
+    with open(path, 'rb') as f:
+      buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else f.read()
+    magic, version, order, alpha, k, V, N, vocab_len = _BACKOFF_HEADER.unpack_from(buf, 0)
+    if magic != _BACKOFF_MAGIC or version not in (1, _BACKOFF_VERSION):
+      raise ValueError(f"{path} is not a backoff language model file")
+    model = cls(order=order, alpha=alpha, k=k)
+    offset = _BACKOFF_HEADER.size
+    model.id_to_token = bytes(buf[offset:offset + vocab_len]).decode('utf-8').split('\n') if V else []
+    model.vocab = {w: i for i, w in enumerate(model.id_to_token)}
+    model.V, model.N = V, N
+    model.bits = max(1, V.bit_length())
+    offset += vocab_len
+    offset += -(vocab_len if version == 1 else offset) % 8
+
+    view = memoryview(buf)
+    def take(length):
+      nonlocal offset
+      chunk = view[offset:offset + length * 8]
+      offset += length * 8
+      if sys.byteorder == 'big':
+        arr = array('q', bytes(chunk))
+        arr.byteswap()
+        return arr
+      return chunk.cast('q')
+
+    # unigram counts, then (keys, counts) for n-gram orders 2..n and contexts 1..n-1
+    num_arrays = 1 + 4 * (order - 1)
+    lengths = list(take(num_arrays))
+    arrays = [take(n) for n in lengths]
+    model.unigram_counts = arrays[0]
+    pairs = [(arrays[i], arrays[i + 1]) for i in range(1, num_arrays, 2)]
+    model._tables = [None, None] + pairs[:order - 1]
+    model._ctx_tables = [None] + pairs[order - 1:]
+    model._frozen = True
+    model._read_only = True
+    if use_mmap:
+      model._mmap = buf
+    return model
+
+def _le_bytes(values):
+  # Little-endian bytes of an int64 sequence
+  arr = array('q', values)
+  if sys.byteorder == 'big':
+    arr.byteswap()
+  return arr.tobytes()
@@ -1,9 +1,13 @@
 from abc import ABC
+from collections import deque
+
+# Most recent history entries kept per processor, so long inputs do not grow it without bound
+HISTORY_LIMIT = 10000
 
 class BaseProcessor(ABC):
   def __init__(self):
     # Keep a simple protected history store for processors that want it
-    self._history = []
+    self._history = deque(maxlen=HISTORY_LIMIT)
 
   def record(self, entry):
     # Record an event into the processor's history
@@ -1,18 +1,42 @@
+import hashlib
 import os
 
+# Per-wildcard limits used by batch runs so one pathological token cannot stall
+# a whole folder: nodes visited, seconds, and the estimated cost above which
+# a pattern is reported as too broad without being searched
+DEFAULT_QUERY_LIMITS = {'max_nodes': 500000, 'timeout': 2.0, 'max_cost': 5000000}
+
+def _digest(text):
+  return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
 class BatchRestorer:
   @staticmethod
   def prompt_run_batch_restore(batch_restorer):
     folder = input("Enter folder path containing .txt files: ").strip()
-    mode = input("Restore mode ('best' or 'all') [default: best]: ").strip() or 'best'
+    mode = input("Restore mode ('best', 'all' or 'fuzzy') [default: best]: ").strip() or 'best'
     output_dir = input("Enter output folder for restored files (leave blank to use input folder): ").strip()
     try:
       summary, total_restored, total_matches, total_unmatched, unmatched_tokens_per_file = batch_restorer.restore_folder(folder, mode, output_dir)
-      batch_restorer.print_summary(summary, total_restored, total_matches, total_unmatched, unmatched_tokens_per_file)
+      batch_restorer.print_summary(summary, total_restored, total_matches, total_unmatched, unmatched_tokens_per_file,
+                                   batch_restorer.limited_queries_per_file)
+      cache = batch_restorer.suggestion_cache
+      if mode == 'fuzzy' and cache is not None:
+        print(cache.report())
     except Exception as e:
       print(f"Batch restore failed: {e}")
     input("\nPress Enter to continue...")
 
+  @staticmethod
+  def prompt_refresh_outputs(batch_restorer):
+    if not batch_restorer.pattern_index:
+      print("No batch outputs to update; run a batch restore first.")
+      return
+    rewritten = batch_restorer.refresh_outputs()
+    if not rewritten:
+      print("No outputs affected by the keyword changes.")
+    for fname, count in rewritten.items():
+      print(f"  {fname}: {count} wildcard(s) re-restored")
+
   @staticmethod
   def prompt_load_keywords(trie_processor):
     from helpers.file_io import FileIO
@@ -21,9 +45,27 @@ class BatchRestorer:
   @staticmethod
   def prompt_display_trie(trie_processor):
     trie_processor.display_trie()
-  def __init__(self, text_processor, file_io):
+  def __init__(self, text_processor, file_io, query_limits=DEFAULT_QUERY_LIMITS, seed=None):
     self.text_processor = text_processor
     self.file_io = file_io
+    # find_matches limits applied during restore_folder (None for unlimited),
+    # and the (token, reason) pairs they cut short in the last run, per file
+    self.query_limits = query_limits
+    self.limited_queries_per_file = {}
+    # Tie-break seed used during runs (None keeps the TextProcessor's own)
+    self.seed = seed
+    # Fuzzy results are memoized across files and across runs of this restorer
+    self.suggestion_cache = getattr(text_processor, 'suggestion_cache', None)
+    # Inverted index from normalized wildcard pattern to {file: [span index]}
+    # (spans are (start, end, token, position) in the output text),
+    # the outputs written by the last run (see _index_output), and vocabulary
+    # changes seen since then (None after a clear: everything is stale)
+    self.pattern_index = {}
+    self._outputs = {}
+    self._changed_words = set()
+    subscribe = getattr(text_processor.trie, 'subscribe', None)
+    if subscribe is not None:
+      subscribe(self._on_vocabulary_change)
 
   def restore_folder(self, folder, mode='best', output_dir=None):
     if not output_dir:
@@ -41,36 +83,185 @@ class BatchRestorer:
     # Ensure output directory exists
     if not os.path.exists(output_dir):
       os.makedirs(output_dir)
+    if self.suggestion_cache is not None:
+      self.suggestion_cache.reset_stats()
+    self.limited_queries_per_file = {}
+    self.pattern_index = {}
+    self._outputs = {}
+    self._changed_words = set()
+    previous = self._apply_run_settings()
+    try:
+      self._restore_files(folder, files, mode, output_dir, summary, unmatched_tokens_per_file)
+    finally:
+      self._restore_run_settings(previous)
+    for _, nres, nmat, nunm in summary:
+      if isinstance(nres, int):
+        total_restored += nres
+        total_matches += nmat
+        total_unmatched += nunm
+    if self.suggestion_cache is not None:
+      self.suggestion_cache.flush()
+    return summary, total_restored, total_matches, total_unmatched, unmatched_tokens_per_file
+
+  def _apply_run_settings(self):
+    # Apply this restorer's query limits and seed to the TextProcessor for a
+    # run; returns the previous settings for _restore_run_settings
+    previous = (self.text_processor.query_limits, self.text_processor.seed)
+    if self.query_limits:
+      self.text_processor.set_query_limits(**self.query_limits)
+    if self.seed is not None:
+      self.text_processor.seed = self.seed
+    return previous
+
+  def _restore_run_settings(self, previous):
+    self.text_processor.query_limits, self.text_processor.seed = previous
+
+  def _restore_files(self, folder, files, mode, output_dir, summary, unmatched_tokens_per_file):
     for fname in files:
       in_path = os.path.join(folder, fname)
       out_path = os.path.join(output_dir, f"restored_{fname}")
       try:
         with open(in_path, 'r', encoding='utf-8') as f:
           content = f.read()
-        restored = self.text_processor.restore_text(content, mode)
+        spans = []
+        restored = self.text_processor.restore_text(content, mode, spans=spans)
+        if self.text_processor.limited_queries:
+          self.limited_queries_per_file[fname] = [(tok, m.reason) for tok, m in self.text_processor.limited_queries]
         import re
         # Count wildcards in original
         wildcards = re.findall(r"[a-zA-Z0-9*']*\*[a-zA-Z0-9*']*", content)
         num_wildcards = len(wildcards)
-        # Count restored tokens in output (for 'best', wrapped in < >)
-        restored_tokens = re.findall(r"<([^>]+)>", restored) if mode == 'best' else []
-        num_restored = len(restored_tokens) if mode == 'best' else restored.count('[')
+        # Count restored tokens in output (for 'best'/'fuzzy', wrapped in < >)
+        wrapped = mode in ('best', 'fuzzy')
+        restored_tokens = re.findall(r"<([^>]+)>", restored) if wrapped else []
+        num_restored = len(restored_tokens) if wrapped else restored.count('[')
         num_matches = num_restored
         num_unmatched = num_wildcards - num_restored
-        total_restored += num_restored
-        total_matches += num_matches
-        total_unmatched += max(0, num_unmatched)
         with open(out_path, 'w', encoding='utf-8') as f:
           f.write(restored)
+        self._index_output(fname, in_path, out_path, mode, spans, restored)
         summary.append((fname, num_restored, num_matches, max(0, num_unmatched)))
         # Optionally, list unmatched wildcards (if any)
         if num_unmatched > 0:
           unmatched_tokens_per_file[fname] = [w for i, w in enumerate(wildcards) if i >= num_restored]
       except Exception as e:
         summary.append((fname, 'ERROR', 'ERROR', str(e)))
-    return summary, total_restored, total_matches, total_unmatched, unmatched_tokens_per_file
 
-  def print_summary(self, summary, total_restored, total_matches, total_unmatched, unmatched_tokens_per_file=None):
+  # ----- incremental updates -----
+  def close(self):
+    # Stop tracking vocabulary changes (when this restorer is replaced)
+    unsubscribe = getattr(self.text_processor.trie, 'unsubscribe', None)
+    if unsubscribe is not None:
+      unsubscribe(self._on_vocabulary_change)
+
+  def _on_vocabulary_change(self, event, word):
+    if event == 'clear':
+      self._changed_words = None
+    elif self._changed_words is not None:
+      self._changed_words.add(word)
+
+  def _index_output(self, fname, in_path, out_path, mode, spans, restored):
+    # Remember where each wildcard's rendering sits in the output file, and a
+    # digest to notice outputs edited since
+    self._outputs[fname] = {'input': in_path, 'path': out_path, 'mode': mode, 'spans': spans,
+                            'digest': _digest(restored)}
+    for i, (_, _, token, _) in enumerate(spans):
+      self.pattern_index.setdefault(token.lower(), {}).setdefault(fname, []).append(i)
+
+  def affected_patterns(self, words=None):
+    # Indexed patterns whose restoration may depend on the changed words
+    # (default: the changes seen since the last run or refresh)
+    if words is None:
+      words = self._changed_words
+    if words is None:
+      return set(self.pattern_index)
+    words = {w.lower() for w in words}
+    affected = set()
+    for pattern, files in self.pattern_index.items():
+      modes = {self._outputs[f]['mode'] for f in files}
+      if any(self.text_processor.may_restore_to(pattern, w, m) for m in modes for w in words):
+        affected.add(pattern)
+    return affected
+
+  def refresh_outputs(self, words=None):
+    """
+    Bring the outputs of the last restore_folder run up to date after
+    vocabulary changes: re-restore only the indexed patterns the changed
+    words could match and splice the new renderings into their spans.
+    Returns {file: spans rewritten}. An output edited since it was written
+    is restored again in full.
+    """
+    patterns = self.affected_patterns(words)
+    per_file = {}
+    for pattern in patterns:
+      for fname, indexes in self.pattern_index[pattern].items():
+        per_file.setdefault(fname, []).extend(indexes)
+    rewritten = {}
+    previous = self._apply_run_settings()
+    try:
+      for fname, indexes in per_file.items():
+        rewritten[fname] = self._refresh_file(fname, sorted(indexes))
+    finally:
+      self._restore_run_settings(previous)
+    self._changed_words = set()
+    return rewritten
+
+  def _refresh_file(self, fname, indexes):
+    entry = self._outputs[fname]
+    try:
+      with open(entry['path'], 'r', encoding='utf-8') as f:
+        text = f.read()
+    except OSError:
+      return self._restore_again(fname)
+    if _digest(text) != entry['digest']:
+      return self._restore_again(fname)
+    targets = set(indexes)
+    renderings = {}
+    pieces = []
+    spans = []
+    last = 0
+    shift = 0
+    for i, (start, end, token, position) in enumerate(entry['spans']):
+      if i not in targets:
+        spans.append((start + shift, end + shift, token, position))
+        continue
+      # Only 'best' tie-breaks depend on the token position
+      key = (token, position if entry['mode'] == 'best' else None)
+      if key not in renderings:
+        renderings[key] = self.text_processor.render_word(token, entry['mode'], position)
+      new = renderings[key]
+      pieces.append(text[last:start])
+      pieces.append(new)
+      last = end
+      spans.append((start + shift, start + shift + len(new), token, position))
+      shift += len(new) - (end - start)
+    pieces.append(text[last:])
+    text = ''.join(pieces)
+    with open(entry['path'], 'w', encoding='utf-8') as f:
+      f.write(text)
+    entry['spans'] = spans
+    entry['digest'] = _digest(text)
+    return len(targets)
+
+  def _restore_again(self, fname):
+    # Full restore of one file whose output no longer matches the index
+    entry = self._outputs[fname]
+    for pattern in {token.lower() for _, _, token, _ in entry['spans']}:
+      files = self.pattern_index[pattern]
+      files.pop(fname, None)
+      if not files:
+        del self.pattern_index[pattern]
+    with open(entry['input'], 'r', encoding='utf-8') as f:
+      content = f.read()
+    spans = []
+    restored = self.text_processor.restore_text(content, entry['mode'], spans=spans)
+    with open(entry['path'], 'w', encoding='utf-8') as f:
+      f.write(restored)
+    self._index_output(fname, entry['input'], entry['path'], entry['mode'], spans, restored)
+    return len(spans)
+
+  def print_summary(self, summary, total_restored, total_matches, total_unmatched, unmatched_tokens_per_file=None,
+                    limited_queries_per_file=None):
     print("\n📄 Batch Restore Summary")
     print("=" * 92)
     header = f"{'File Name':30} | {'Restored':8} | {'Matches':7} | {'Unmatched':9} | {'% Match':9} | {'% Unmatched':14}"
@@ -93,3 +284,8 @@ class BatchRestorer:
       print("\nUnmatched wildcards per file:")
       for fname, tokens in unmatched_tokens_per_file.items():
         print(f"  {fname}: {tokens}")
+    if limited_queries_per_file:
+      # too_broad: skipped on its cost estimate; node_budget/deadline: partial matches
+      print("\nWildcards cut short by query limits:")
+      for fname, queries in limited_queries_per_file.items():
+        print(f"  {fname}: " + ", ".join(f"{tok} ({reason})" for tok, reason in queries))
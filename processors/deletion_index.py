@@ -0,0 +1,223 @@
+import sys
+import threading
+from processors.fuzzy_search import ConfusionModel
+
+def confusable_fold(model):
+  """
+  Map each character to a canonical representative of its zero-cost
+  confusable group, so folded words compare equal wherever the model would
+  match them for free. Groups are merged transitively, which can only add
+  candidates (they are verified afterwards), never lose them.
+  """
+  parent = {}
+
+  def find(c):
+    while parent.get(c, c) != c:
+      c = parent[c]
+    return c
+
+  for (a, b), cost in model.single.items():
+    if cost != 0:
+      continue
+    ra, rb = find(a.lower()), find(b.lower())
+    if ra != rb:
+      parent[max(ra, rb)] = min(ra, rb)
+  return {c: find(c) for c in parent}
+
+class DeletionIndex:
+  """
+  SymSpell-style deletion-neighbourhood index over the words of a trie.
+  Every variant of a (confusable-folded) word with up to max_dist characters
+  deleted maps to the words it came from, so a misspelling's candidates are
+  found with hash lookups and then confirmed with an exact distance check.
+  Multi-character OCR edits ('rn' -> 'm') are handled by also looking up the
+  query with those edits applied.
+
+  The index follows the trie through TrieProcessor.subscribe, can be built
+  in a background thread, and gives up (leaving searches to the trie walk)
+  if its estimated size passes max_bytes.
+  """
+  # Give up on a query (trie walk instead) past this many rewritten variants
+  MAX_REWRITES = 64
+
+  def __init__(self, trie_processor, max_dist=2, confusables=None, max_bytes=256 * 1024 * 1024, model=None):
+    self.trie_proc = trie_processor
+    self.max_dist = max_dist
+    self.model = model if model is not None else ConfusionModel(confusables)
+    self.max_bytes = max_bytes
+    self._fold = confusable_fold(self.model)
+    # Deleting up to d characters only covers distance d if every paid
+    # single-character edit costs at least 1
+    self.supported = all(c == 0 or c >= 1 for c in self.model.single.values())
+    self._variants = {}
+    self._bytes = 0
+    self._lock = threading.Lock()
+    self._pending = None   # mutations seen while a background build runs
+    self._thread = None
+    self.ready = False
+    self.over_budget = False
+    trie_processor.subscribe(self._on_change)
+
+  def close(self):
+    # Stop following the trie and drop the index
+    self.trie_proc.unsubscribe(self._on_change)
+    with self._lock:
+      self._variants = {}
+      self.ready = False
+
+  # ----- building -----
+  def build(self, background=False):
+    """Build the index now, or in a daemon thread when background=True."""
+    if self._thread is not None and self._thread.is_alive():
+      return
+    # Snapshot in the caller's thread; later changes are replayed after the build
+    words = [w for w, _ in self.trie_proc.get_all_words()]
+    with self._lock:
+      self.ready = False
+      self._pending = []
+    if background:
+      self._thread = threading.Thread(target=self._build_from, args=(words,), daemon=True)
+      self._thread.start()
+    else:
+      self._build_from(words)
+
+  def _build_from(self, words):
+    variants = {}
+    size = 0
+    over_budget = False
+    for word in words:
+      size += self._insert_into(variants, word)
+      if self.max_bytes and size > self.max_bytes:
+        over_budget = True
+        variants = {}
+        break
+    with self._lock:
+      self._variants = variants
+      self._bytes = size
+      self.over_budget = over_budget
+      pending, self._pending = self._pending, None
+      if not over_budget:
+        for event, word in pending:
+          self._apply(event, word)
+        self.ready = not self.over_budget
+
+  def wait(self, timeout=None):
+    # Block until a background build has finished
+    if self._thread is not None:
+      self._thread.join(timeout)
+    return self.ready
+
+  def fold(self, word):
+    return ''.join(self._fold.get(c, c) for c in word)
+
+  def _deletes(self, word, max_dist):
+    # All variants of word with up to max_dist characters deleted
+    seen = {word}
+    frontier = [word]
+    for _ in range(max_dist):
+      next_frontier = []
+      for w in frontier:
+        for i in range(len(w)):
+          v = w[:i] + w[i+1:]
+          if v not in seen:
+            seen.add(v)
+            next_frontier.append(v)
+      frontier = next_frontier
+    return seen
+
+  def _insert_into(self, variants, word):
+    # Add word under each deletion variant; returns the estimated bytes added
+    added = 0
+    for v in self._deletes(self.fold(word), self.max_dist):
+      bucket = variants.get(v)
+      if bucket is None:
+        variants[v] = {word}
+        added += sys.getsizeof(v) + 300  # key, dict slot and a small set
+      elif word not in bucket:
+        bucket.add(word)
+        added += 60
+    return added
+
+  # ----- keeping up with the trie -----
+  def _on_change(self, event, word):
+    with self._lock:
+      if self._pending is not None:
+        self._pending.append((event, word))
+      elif self.ready:
+        self._apply(event, word)
+
+  def _apply(self, event, word):
+    # Caller holds the lock
+    if event == 'add':
+      self._bytes += self._insert_into(self._variants, word)
+      if self.max_bytes and self._bytes > self.max_bytes:
+        self._variants = {}
+        self.over_budget = True
+        self.ready = False
+    elif event == 'delete':
+      for v in self._deletes(self.fold(word), self.max_dist):
+        bucket = self._variants.get(v)
+        if bucket is not None:
+          bucket.discard(word)
+          if not bucket:
+            del self._variants[v]
+    elif event == 'clear':
+      self._variants = {}
+      self._bytes = 0
+
+  # ----- lookup -----
+  def _rewrites(self, word):
+    # The word with every non-overlapping subset of multi-character edits applied
+    occurrences = []
+    for trie_str, ocr_str, _ in self.model.multi:
+      start = word.find(ocr_str)
+      while start != -1:
+        occurrences.append((start, start + len(ocr_str), trie_str))
+        start = word.find(ocr_str, start + 1)
+    occurrences.sort()
+    variants = []
+
+    def expand(k, pos, parts):
+      if len(variants) > self.MAX_REWRITES:
+        return
+      if k == len(occurrences):
+        variants.append(''.join(parts) + word[pos:])
+        return
+      expand(k + 1, pos, parts)
+      start, end, trie_str = occurrences[k]
+      if start >= pos:
+        expand(k + 1, end, parts + [word[pos:start], trie_str])
+
+    expand(0, 0, [])
+    return set(variants) if len(variants) <= self.MAX_REWRITES else None
+
+  def search_word(self, word, max_dist=1):
+    """
+    Return list of (candidate, distance) like TrieFuzzySearcher.search_word,
+    or None when the index is not ready, built for a smaller max_dist, or
+    cannot answer this query exactly.
+    """
+    if not self.ready or not self.supported or max_dist > self.max_dist:
+      return None
+    word = word.lower()
+    rewrites = self._rewrites(word)
+    if rewrites is None:
+      return None
+    candidates = set()
+    with self._lock:
+      for variant in rewrites:
+        for v in self._deletes(self.fold(variant), max_dist):
+          bucket = self._variants.get(v)
+          if bucket:
+            candidates.update(bucket)
+    results = []
+    for cand in candidates:
+      d = self.model.distance(cand, word, max_dist)
+      if d is not None:
+        results.append((cand, d))
+    results.sort(key=lambda x: (x[1], x[0]))
+    return results
+
+  def stats(self):
+    return {'ready': self.ready, 'over_budget': self.over_budget,
+            'variants': len(self._variants), 'estimated_bytes': self._bytes}
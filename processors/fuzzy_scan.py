@@ -0,0 +1,168 @@
+import csv
+import json
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from processors.fuzzy_search import TrieFuzzySearcher
+from processors.trie_processor import TrieProcessor
+
+# Same token pattern as TrieFuzzySearcher.suggest_for_text
+TOKEN_RE = re.compile(r"[A-Za-z0-9']+|\n|[^\w\s]")
+WORD_RE = re.compile(r"[A-Za-z0-9']+$")
+
+# Per-process searcher, built once by _init_worker
+_worker_searcher = None
+
+def _init_worker(words, confusables, weights):
+  # Rebuild the vocabulary in each worker process instead of pickling the trie
+  global _worker_searcher
+  trie_proc = TrieProcessor()
+  for word, freq in words:
+    trie_proc.add_word(word, freq)
+  _worker_searcher = TrieFuzzySearcher(trie_proc, confusables=confusables, weights=weights)
+
+def _search_tokens(tokens, k, max_dist):
+  return [(t, _worker_searcher.search_top_k(t, k=k, max_dist=max_dist)) for t in tokens]
+
+class FolderFuzzyScanner:
+  @staticmethod
+  def prompt_run_fuzzy_scan(scanner, max_dist=1):
+    path = input("Enter folder or .zip archive to scan: ").strip()
+    output = input("Enter output report file (.jsonl or .csv): ").strip()
+    workers = input("Worker processes [default: 1]: ").strip()
+    try:
+      stats = scanner.scan(path, output, max_dist=max_dist, workers=int(workers) if workers else 1)
+      scanner.print_summary(stats)
+    except Exception as e:
+      print(f"Fuzzy scan failed: {e}")
+
+  def __init__(self, trie_processor, confusables=None, weights=None, cache=None):
+    self.trie_proc = trie_processor
+    self.searcher = TrieFuzzySearcher(trie_processor, confusables=confusables, weights=weights, cache=cache)
+
+  def iter_documents(self, path):
+    """
+    Yield (name, text) for every .txt file in a folder, or inside a .zip
+    archive (named 'archive.zip!member.txt'). Folders may contain archives.
+    """
+    if os.path.isdir(path):
+      for fname in sorted(os.listdir(path)):
+        full = os.path.join(path, fname)
+        if fname.lower().endswith('.txt'):
+          with open(full, 'r', encoding='utf-8') as f:
+            yield fname, f.read()
+        elif fname.lower().endswith('.zip'):
+          for name, text in self.iter_documents(full):
+            yield f"{fname}!{name.split('!', 1)[1]}", text
+    elif zipfile.is_zipfile(path):
+      with zipfile.ZipFile(path) as archive:
+        for member in sorted(archive.namelist()):
+          if member.lower().endswith('.txt'):
+            yield f"{os.path.basename(path)}!{member}", archive.read(member).decode('utf-8')
+    elif os.path.isfile(path):
+      with open(path, 'r', encoding='utf-8') as f:
+        yield os.path.basename(path), f.read()
+    else:
+      raise ValueError("Invalid folder or archive path.")
+
+  def _unknown_tokens(self, text):
+    # (offset, length, line, column, token) for each out-of-vocabulary word
+    found = []
+    line, line_start = 1, 0
+    for m in TOKEN_RE.finditer(text):
+      tok = m.group()
+      if tok == '\n':
+        line, line_start = line + 1, m.end()
+        continue
+      if not WORD_RE.match(tok) or self.trie_proc.find_word(tok.lower()):
+        continue
+      found.append((m.start(), len(tok), line, m.start() - line_start + 1, tok))
+    return found
+
+  def scan(self, path, output, max_dist=1, k=5, workers=1, chunk_size=256):
+    """
+    Fuzzy-scan every document under path. Unknown tokens are first collected
+    and deduplicated across all documents; each distinct token is searched
+    once (in a process pool when workers > 1, skipping suggestion-cache hits)
+    and the results are fanned back out to every occurrence. Writes one
+    record per occurrence, with character offsets, as JSON Lines or CSV.
+    """
+    start = time.perf_counter()
+    documents = []
+    distinct = set()
+    for name, text in self.iter_documents(path):
+      occurrences = self._unknown_tokens(text)
+      documents.append((name, occurrences))
+      distinct.update(tok.lower() for *_, tok in occurrences)
+
+    suggestions = {}
+    cache = self.searcher.cache
+    todo = []
+    for tok in sorted(distinct):
+      cached = cache.lookup(self.trie_proc, self.searcher.model, ('top_k', tok, max_dist, k)) if cache else None
+      if cached is not None:
+        suggestions[tok] = cached
+      else:
+        todo.append(tok)
+
+    if workers > 1 and len(todo) > chunk_size:
+      chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+      init_args = (self.trie_proc.get_all_words(), self.searcher.conf, self.searcher.weights)
+      with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+        for batch in pool.map(_search_tokens, chunks, [k] * len(chunks), [max_dist] * len(chunks)):
+          suggestions.update(batch)
+    else:
+      for tok in todo:
+        # Cache lookups were done above, so search directly
+        suggestions[tok] = self.searcher._search_top_k(tok, k, max_dist)
+    if cache is not None:
+      for tok in todo:
+        cache.store(self.trie_proc, self.searcher.model, ('top_k', tok, max_dist, k), suggestions[tok])
+      cache.flush()
+
+    records = self._write_report(output, documents, suggestions)
+    return {
+      'documents': len(documents),
+      'occurrences': sum(len(occ) for _, occ in documents),
+      'distinct': len(distinct),
+      'searched': len(todo),
+      'records': records,
+      'seconds': time.perf_counter() - start,
+      'output': output,
+    }
+
+  def _write_report(self, output, documents, suggestions):
+    # One row per occurrence that has suggestions, in document order
+    as_csv = output.lower().endswith('.csv')
+    records = 0
+    with open(output, 'w', encoding='utf-8', newline='') as f:
+      writer = csv.writer(f) if as_csv else None
+      if as_csv:
+        writer.writerow(['file', 'offset', 'length', 'line', 'column', 'token', 'suggestions'])
+      for name, occurrences in documents:
+        for offset, length, line, column, tok in occurrences:
+          words = [w for w, _ in suggestions.get(tok.lower(), [])]
+          if not words:
+            continue
+          records += 1
+          if as_csv:
+            writer.writerow([name, offset, length, line, column, tok, '|'.join(words)])
+          else:
+            f.write(json.dumps({'file': name, 'offset': offset, 'length': length, 'line': line,
+                                'column': column, 'token': tok, 'suggestions': words}) + '\n')
+    return records
+
+  def print_summary(self, stats):
+    print("\nFuzzy Scan Summary")
+    print("=" * 48)
+    print(f"{'Documents':28} | {stats['documents']:>15}")
+    print(f"{'Unknown token occurrences':28} | {stats['occurrences']:>15}")
+    print(f"{'Distinct unknown tokens':28} | {stats['distinct']:>15}")
+    print(f"{'Searched (not cached)':28} | {stats['searched']:>15}")
+    print(f"{'Records written':28} | {stats['records']:>15}")
+    print(f"{'Elapsed (s)':28} | {stats['seconds']:>15.3f}")
+    print("=" * 48)
+    print(f"Report: {stats['output']}")
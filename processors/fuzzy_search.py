@@ -1,5 +1,9 @@
+import heapq
 import re
 
+from helpers.metrics import METRICS
+from helpers.trie import SearchBudget, LimitedMatches
+
 def default_confusables():
   # Basic OCR confusables map (symmetric pairs expanded)
   base = {
@@ -11,6 +15,10 @@ def default_confusables():
     'I': ['1', 'l'],
     'rn': ['m'],
     'm': ['rn'],
+    'cl': ['d'],
+    'd': ['cl'],
+    'ii': ['u'],
+    'u': ['ii'],
   }
   return base
 
@@ -24,40 +32,430 @@ def is_confusable(a, b, conf):
     return True
   return False
 
+class ConfusionModel:
+  """
+  Compiled, weighted OCR confusion table.
+
+  A confusables map pairs a trie-side string with the OCR-side strings it may
+  appear as. Single-character pairs cost 0 by default (as is_confusable
+  treats them); multi-character pairs such as 'm' -> 'rn' become merge/split
+  edits costing multi_cost. weights overrides the cost of any
+  (trie_side, ocr_side) pair. Insertions, deletions and other substitutions
+  cost 1.
+  """
+  def __init__(self, confusables=None, weights=None, multi_cost=1):
+    conf = confusables if confusables is not None else default_confusables()
+    weights = weights or {}
+    self.single = {}   # (trie_ch, ocr_ch) -> cost
+    self.multi = []    # (trie_str, ocr_str, cost)
+    for a, targets in conf.items():
+      for b in targets:
+        if len(a) == 1 and len(b) == 1:
+          self.single[(a, b)] = weights.get((a, b), 0)
+        else:
+          self.multi.append((a.lower(), b.lower(), weights.get((a, b), multi_cost)))
+    self.max_trie_span = max([len(t) for t, _, _ in self.multi], default=1)
+    self._fingerprint = None
+
+  def fingerprint(self):
+    # Stable hash of the compiled rules and costs (for cache keys)
+    if self._fingerprint is None:
+      import hashlib
+      rules = sorted(f"{a}\t{b}\t{c}" for (a, b), c in self.single.items())
+      rules += sorted(f"{t}\t{o}\t{c}" for t, o, c in self.multi)
+      self._fingerprint = hashlib.blake2b('\n'.join(rules).encode('utf-8'), digest_size=16).hexdigest()
+    return self._fingerprint
+
+  @property
+  def unit_cost(self):
+    # True when plain (single-character, 0/1 cost) edit distance applies
+    return not self.multi and all(c == 0 for c in self.single.values())
+
+  @property
+  def bitparallel_ok(self):
+    # The bit-parallel engine scores zero-cost substitutions 0 and every other
+    # single-character edit 1; that never overestimates unless a weight is
+    # fractional, so its hits (plus merge_variants) cover every true match
+    return all(c == 0 or c >= 1 for c in self.single.values()) and all(c >= 0 for _, _, c in self.multi)
+
+  def merge_variants(self, word, max_dist):
+    """
+    (variant, cost) for word with each affordable set of non-overlapping
+    multi-character OCR strings read back as their trie-side strings (e.g.
+    'rnarket' -> 'market' at cost 1). word itself comes first at cost 0.
+    A plain edit search of each variant with max_dist - cost finds every
+    candidate within max_dist of word under this model.
+    """
+    variants = []
+    def expand(i, pieces, cost):
+      # Next position at or after i where some OCR string starts
+      starts = [(word.find(ocr_str, i), trie_str, ocr_str, c) for trie_str, ocr_str, c in self.multi]
+      starts = [x for x in starts if x[0] != -1]
+      if not starts:
+        variants.append((''.join(pieces) + word[i:], cost))
+        return
+      pos = min(x[0] for x in starts)
+      # Either leave word[pos] as is...
+      expand(pos + 1, pieces + [word[i:pos + 1]], cost)
+      # ...or read an OCR string starting there as its trie-side string
+      for start, trie_str, ocr_str, c in starts:
+        if start == pos and cost + c <= max_dist:
+          expand(pos + len(ocr_str), pieces + [word[i:pos], trie_str], cost + c)
+    expand(0, [], 0)
+    return variants
+
+  def max_length_change(self, max_dist):
+    # Largest length difference between two words within max_dist, or None
+    # when a free multi-character edit makes it unbounded
+    per_unit = 1
+    for trie_str, ocr_str, cost in self.multi:
+      change = abs(len(trie_str) - len(ocr_str))
+      if change and cost <= 0:
+        return None
+      if change:
+        per_unit = max(per_unit, change / cost)
+    return int(max_dist * per_unit)
+
+  def sub_cost(self, trie_ch, ocr_ch):
+    if trie_ch == ocr_ch or trie_ch.lower() == ocr_ch.lower():
+      return 0
+    return self.single.get((trie_ch, ocr_ch), 1)
+
+  def query(self, word, wildcard=None):
+    # Per-query lookup tables for the trie DP; a wildcard character in word
+    # matches any trie character at zero cost
+    return _QueryTable(self, word, wildcard)
+
+  def distance(self, candidate, word, max_dist, wildcard=None):
+    """Weighted distance from trie word candidate to OCR word, or None if above max_dist."""
+    return self.table_distance(self.query(word, wildcard), candidate, max_dist)
+
+  def table_distance(self, table, candidate, max_dist):
+    # distance() against a prebuilt query table, for many candidates per word
+    rows = (table.init_row,)
+    for j in range(1, len(candidate) + 1):
+      row = table.next_row(candidate[:j], rows)
+      rows = (row,) + rows[:self.max_trie_span - 1]
+      if min(min(r) for r in rows) > max_dist:
+        return None
+    return rows[0][-1] if rows[0][-1] <= max_dist else None
+
+class _QueryTable(dict):
+  # Lazily filled per-trie-character cost rows for one OCR word, plus the
+  # multi-character edits that end at each word position
+  def __init__(self, model, word, wildcard=None):
+    super().__init__()
+    self.model = model
+    self.word = word
+    self.wildcard = wildcard
+    self.init_row = list(range(len(word) + 1))
+    self.multi_at = [[] for _ in range(len(word) + 1)]
+    for trie_str, ocr_str, cost in model.multi:
+      start = word.find(ocr_str)
+      while start != -1:
+        self.multi_at[start + len(ocr_str)].append((len(ocr_str), trie_str, cost))
+        start = word.find(ocr_str, start + 1)
+
+  def __missing__(self, ch):
+    costs = [0 if w == self.wildcard else self.model.sub_cost(ch, w) for w in self.word]
+    self[ch] = costs
+    return costs
+
+  def next_row(self, trie_prefix, rows):
+    # DP row for trie_prefix given the previous rows (most recent first)
+    costs = self[trie_prefix[-1]]
+    prev_row = rows[0]
+    curr_row = [prev_row[0] + 1]  # deletion cost
+    multi_at = self.multi_at
+    for i in range(1, len(self.word) + 1):
+      best = min(curr_row[i-1] + 1, prev_row[i] + 1, prev_row[i-1] + costs[i-1])
+      for span, trie_str, cost in multi_at[i]:
+        # OCR word[i-span:i] stands for the last len(trie_str) trie characters
+        back = len(trie_str)
+        if back <= len(rows) and trie_prefix.endswith(trie_str):
+          best = min(best, rows[back - 1][i - span] + cost)
+      curr_row.append(best)
+    return curr_row
+
+class _MatchMasks(dict):
+  # Per-character match masks for the bit-parallel engine: bit i is set when a
+  # trie character may stand for word[i] at zero cost. Filled lazily.
+  def __init__(self, word, model):
+    super().__init__()
+    self.word = word
+    self.model = model
+
+  def __missing__(self, ch):
+    bits = 0
+    for i, w in enumerate(self.word):
+      if self.model.sub_cost(ch, w) == 0:
+        bits |= 1 << i
+    self[ch] = bits
+    return bits
+
 class TrieFuzzySearcher:
-  def __init__(self, trie_processor, confusables=None):
+  def __init__(self, trie_processor, confusables=None, engine='auto', index=None, weights=None, cache=None):
     # Keep reference to the trie processor
     self.trie_proc = trie_processor
-    self.conf = confusables or default_confusables()
+    self.conf = confusables if confusables is not None else default_confusables()
+    # Compiled cost table used by every engine
+    self.weights = weights
+    self.model = ConfusionModel(self.conf, weights)
+    # 'dp' (DP rows), 'bitparallel' (Myers/Hyyro bit-vectors), 'index' or 'auto'
+    self.engine = engine
+    # Optional DeletionIndex built over the same trie and confusables
+    self.index = index
+    # Optional SuggestionCache shared across searchers, runs and documents
+    self.cache = cache
+
+  def enable_index(self, max_dist=2, max_bytes=256 * 1024 * 1024, background=True):
+    """Attach a deletion-neighbourhood index; the trie walk is used until it is ready."""
+    from processors.deletion_index import DeletionIndex
+    self.index = DeletionIndex(self.trie_proc, max_dist=max_dist, model=self.model, max_bytes=max_bytes)
+    self.index.build(background=background)
+    return self.index
 
-  def search_word(self, word, max_dist=1):
+  @METRICS.timed('fuzzy_search', candidates=len, kind='word')
+  def search_word(self, word, max_dist=1, max_nodes=None, timeout=None):
     """
     Return list of (candidate, distance) whose edit distance <= max_dist.
-    Based on DP rows carried along the trie (Ukkonen-style pruning).
+    All engines return the same results. A ready deletion index answers
+    first (unless engine='dp'/'bitparallel'); otherwise the bit-parallel
+    engine is used for max_dist 1 and 2 unless engine='dp' or the confusion
+    model has fractional weights; multi-character confusables go through
+    _search_word_merged.
+    With max_nodes or timeout, trie walks stop at the budget and a
+    LimitedMatches is returned (truncated when a limit was hit).
     """
-    word = word.lower()
+    budget = SearchBudget(max_nodes, timeout) if max_nodes is not None or timeout is not None else None
+    if self.index is not None and self.engine in ('auto', 'index'):
+      results = self.index.search_word(word, max_dist)
+      if results is not None:
+        return results if budget is None else LimitedMatches(results)
+    if self._use_bitparallel(word, max_dist):
+      results = self._search_word_merged(word, max_dist, budget)
+    else:
+      results = self._search_word_dp(word, max_dist, budget)
+    if budget is None:
+      return results
+    if METRICS.enabled and budget.reason:
+      METRICS.inc('fuzzy_search_limited_total', reason=budget.reason)
+    return LimitedMatches(results, budget.reason, budget.visited)
+
+  def _use_bitparallel(self, word, max_dist):
+    # Engine selection shared by search_word and search_top_k
+    if self.engine == 'bitparallel' and not self.model.bitparallel_ok:
+      raise ValueError("engine='bitparallel' cannot score this confusion model (fractional edit weights); use 'dp'")
+    return bool(word) and (self.engine == 'bitparallel' or
+                           (self.engine != 'dp' and max_dist in (1, 2) and self.model.bitparallel_ok))
+
+  def _search_word_dp(self, word, max_dist=1, budget=None):
+    """
+    Return list of (candidate, distance) whose weighted edit distance <= max_dist.
+    Based on DP rows carried along the trie (Ukkonen-style pruning); per-cell
+    costs come from the compiled ConfusionModel, and the last few rows are
+    kept so multi-character edits such as 'rn' -> 'm' cost a single edit.
+    """
+    return self._dp_search(self.model.query(word.lower()), max_dist, budget)
+
+  def _dp_search(self, table, max_dist, budget=None):
+    # Full trie walk for a compiled query table; sorted by (distance, word).
+    # An exhausted SearchBudget stops the walk, keeping the results so far
     root = self.trie_proc.trie.root
     results = []
-    init_row = list(range(len(word) + 1))
+    span = self.model.max_trie_span
 
-    def recurse(node, prefix, prev_row):
+    def recurse(node, prefix, rows):
+      if budget is not None and not budget.spend():
+        return
       for ch, child in node.children.items():
-        curr_row = [prev_row[0] + 1]  # deletion cost
-        for i in range(1, len(word) + 1):
-          cost_sub = 0 if is_confusable(ch, word[i-1], self.conf) else 1
-          insert_cost = curr_row[i-1] + 1
-          delete_cost = prev_row[i] + 1
-          sub_cost = prev_row[i-1] + cost_sub
-          curr_row.append(min(insert_cost, delete_cost, sub_cost))
+        new_prefix = prefix + ch
+        curr_row = table.next_row(new_prefix, rows)
         if curr_row[-1] <= max_dist and child.is_end:
-          results.append((prefix + ch, curr_row[-1]))
-        if min(curr_row) <= max_dist:
-          recurse(child, prefix + ch, curr_row)
+          results.append((new_prefix, curr_row[-1]))
+        new_rows = (curr_row,) + rows[:span - 1]
+        # Older rows can still feed multi-character edits further down
+        if min(min(r) for r in new_rows) <= max_dist:
+          recurse(child, new_prefix, new_rows)
 
-    recurse(root, '', init_row)
+    recurse(root, '', (table.init_row,))
     results.sort(key=lambda x: (x[1], x[0]))
     return results
 
+  def _search_word_merged(self, word, max_dist, budget=None):
+    """
+    Bit-parallel search under the full confusion model: each merge/split
+    variant of word (see ConfusionModel.merge_variants) is searched with
+    plain edits, then the candidates are rescored with the weighted model.
+    Without multi-character strings in word and with 0/1 costs, this is a
+    single _search_word_bitparallel call.
+    """
+    word = word.lower()
+    variants = self.model.merge_variants(word, max_dist)
+    if len(variants) == 1 and all(c in (0, 1) for c in self.model.single.values()):
+      return self._search_word_bitparallel(word, max_dist, budget)
+    found = set()
+    for variant, cost in variants:
+      found.update(c for c, _ in self._search_word_bitparallel(variant, max_dist - cost, budget))
+    results = []
+    for candidate in found:
+      dist = self.model.distance(candidate, word, max_dist)
+      if dist is not None:
+        results.append((candidate, dist))
+    results.sort(key=lambda x: (x[1], x[0]))
+    return results
+
+  def _search_word_bitparallel(self, word, max_dist, budget=None):
+    """
+    Same results as _search_word_dp, but each trie node carries the DP column
+    as Myers/Hyyro vertical delta bit-vectors (VP, VN) plus the last-row
+    score instead of a Python list. Pruning only inspects the diagonal band
+    |i - depth| <= max_dist, the only cells that can stay within max_dist.
+    """
+    word = word.lower()
+    m = len(word)
+    full = (1 << m) - 1
+    high = 1 << (m - 1)
+    peq = _MatchMasks(word, self.model)
+    results = []
+
+    # Column 0 is D[i][0] = i: every vertical delta is +1
+    stack = [(self.trie_proc.trie.root, '', full, 0, m, 0)]
+    while stack:
+      if budget is not None and not budget.spend():
+        break
+      node, prefix, vp, vn, score, depth = stack.pop()
+      depth += 1
+      for ch, child in node.children.items():
+        eq = peq[ch]
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        ph = (vn | ~(xh | vp)) & full
+        mh = vp & xh
+        new_score = score
+        if ph & high:
+          new_score += 1
+        elif mh & high:
+          new_score -= 1
+        # Row 0 grows by one per trie character (global alignment)
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        new_vp = (mh | ~(xv | ph)) & full
+        new_vn = ph & xv
+
+        if new_score <= max_dist and child.is_end:
+          results.append((prefix + ch, new_score))
+        if not child.children:
+          continue
+        # D[i][depth] = depth + popcount(VP below i) - popcount(VN below i)
+        lo = max(0, depth - max_dist)
+        hi = min(m, depth + max_dist)
+        for i in range(lo, hi + 1):
+          below = (1 << i) - 1
+          if depth + (new_vp & below).bit_count() - (new_vn & below).bit_count() <= max_dist:
+            stack.append((child, prefix + ch, new_vp, new_vn, new_score, depth))
+            break
+
+    results.sort(key=lambda x: (x[1], x[0]))
+    return results
+
+  @METRICS.timed('fuzzy_search', candidates=len, kind='top_k')
+  def search_top_k(self, word, k=5, max_dist=1):
+    """
+    Return up to k (candidate, distance) pairs within max_dist, ranked by
+    (distance, -frequency, candidate). Engines are chosen as in
+    search_word; when the bit-parallel engine applies, its matches are
+    ranked directly. Otherwise explores the trie best-first: a
+    subtree is keyed by the smallest DP value in its carried rows (a lower
+    bound on any distance below it) and its prefix_count (an upper bound on
+    any frequency below it), so words pop in final rank order and the search
+    stops after k. Once k words are known, the cutoff drops to the k-th best
+    distance found so far.
+    """
+    if k <= 0:
+      return []
+    if self.cache is not None:
+      return self._cached('top_k', word, max_dist, k, lambda: self._search_top_k(word, k, max_dist))
+    return self._search_top_k(word, k, max_dist)
+
+  def _cached(self, kind, word, max_dist, k, compute):
+    # Look a result up in the suggestion cache, computing and storing it on a miss
+    key = (kind, word.lower(), max_dist, k)
+    results = self.cache.lookup(self.trie_proc, self.model, key)
+    if results is None:
+      results = compute()
+      self.cache.store(self.trie_proc, self.model, key, results)
+    return results
+
+  def _search_top_k(self, word, k, max_dist):
+    if self.index is not None and self.engine in ('auto', 'index'):
+      results = self.index.search_word(word, max_dist)
+      if results is not None:
+        return self._rank(results)[:k]
+    if self._use_bitparallel(word, max_dist):
+      return self._rank(self._search_word_merged(word, max_dist))[:k]
+    return self._top_k_search(self.model.query(word.lower()), k, max_dist)
+
+  def _rank(self, results):
+    return sorted(results, key=lambda x: (x[1], -self.trie_proc.get_frequency(x[0]), x[0]))
+
+  def _top_k_search(self, table, k, max_dist):
+    # Best-first trie walk for a compiled query table (see search_top_k)
+    span = self.model.max_trie_span
+    root = self.trie_proc.trie.root
+    # Heap entries: (distance bound, -frequency bound, kind, tiebreak, payload)
+    # kind 0 = subtree to expand, 1 = finished word; subtrees go first on ties
+    heap = [(0, 0, 0, 0, (root, '', (table.init_row,)))]
+    found = []   # max-heap (negated) of the k best distances pushed so far
+    cutoff = max_dist
+    counter = 1
+    results = []
+    while heap and len(results) < k:
+      dist, _, kind, _, payload = heapq.heappop(heap)
+      if dist > cutoff:
+        break
+      if kind == 1:
+        results.append((payload, dist))
+        continue
+      node, prefix, rows = payload
+      for ch, child in node.children.items():
+        new_prefix = prefix + ch
+        curr_row = table.next_row(new_prefix, rows)
+        if child.is_end and curr_row[-1] <= cutoff:
+          d = curr_row[-1]
+          heapq.heappush(heap, (d, -child.frequency, 1, new_prefix, new_prefix))
+          heapq.heappush(found, -d)
+          if len(found) > k:
+            heapq.heappop(found)
+          if len(found) == k:
+            cutoff = min(cutoff, -found[0])
+        if child.children:
+          new_rows = (curr_row,) + rows[:span - 1]
+          bound = min(min(r) for r in new_rows)
+          if bound <= cutoff:
+            heapq.heappush(heap, (bound, -child.prefix_count, 0, counter, (child, new_prefix, new_rows)))
+            counter += 1
+    return results
+
+  @METRICS.timed('fuzzy_search', candidates=len, kind='pattern')
+  def search_pattern(self, pattern, max_dist=1, k=None):
+    """
+    Match a damaged token that mixes '*' wildcards with OCR errors, e.g.
+    'sunshet*'. Each '*' matches any one trie character at no cost and up to
+    max_dist weighted edits (confusables included) are allowed on the rest.
+    Returns (candidate, distance) ranked by (distance, -frequency, candidate),
+    the top k only when k is given.
+    """
+    if self.cache is not None:
+      return self._cached('pattern', pattern, max_dist, k, lambda: self._search_pattern(pattern, max_dist, k))
+    return self._search_pattern(pattern, max_dist, k)
+
+  def _search_pattern(self, pattern, max_dist, k):
+    table = self.model.query(pattern.lower(), wildcard='*')
+    if k is not None:
+      return self._top_k_search(table, k, max_dist)
+    return self._rank(self._dp_search(table, max_dist))
+
   def suggest_for_text(self, text, max_dist=1):
     """
     For each word token not found in the trie (and without '*'),
@@ -72,7 +470,7 @@ class TrieFuzzySearcher:
         continue
       if self.trie_proc.find_word(t.lower()):
         continue
-      suggs = self.search_word(t, max_dist=max_dist)
+      suggs = self.search_top_k(t, k=5, max_dist=max_dist)
       if suggs:
-        suggestions.append((t, [w for w, d in suggs[:5]]))
+        suggestions.append((t, [w for w, d in suggs]))
     return suggestions
\ No newline at end of file
@@ -0,0 +1,76 @@
+import gc
+import os
+from helpers.layered_trie import LayeredTrie
+from helpers.trie import PrefixTrie
+from processors.trie_processor import TrieProcessor, is_snapshot_file
+
+# Base tries loaded by shared_base, one per path per process
+_BASES = {}
+
+def shared_base(path):
+  """
+  Load a base vocabulary (snapshot or keyword file) once per process and
+  return its PrefixTrie. The trie is moved to the GC's permanent generation,
+  so worker processes forked afterwards keep sharing its memory pages instead
+  of copying them when the collector walks the nodes.
+  """
+  key = os.path.abspath(path)
+  base = _BASES.get(key)
+  if base is None:
+    loader = TrieProcessor()
+    if is_snapshot_file(path):
+      loader.load_snapshot(path)
+    else:
+      from helpers.file_io import FileIO
+      message = FileIO.load_keywords(path, loader)
+      if message.startswith('Error'):
+        raise ValueError(message)
+    base = _BASES[key] = loader.trie
+    if hasattr(gc, 'freeze'):
+      gc.collect()
+      gc.freeze()
+  return base
+
+class OverlayTrieProcessor(TrieProcessor):
+  """
+  TrieProcessor for one title: a small mutable trie layered over a shared,
+  read-only base vocabulary. Adds, deletions and frequency changes only touch
+  the title's layer (deleting a base word masks it), while lookups, fuzzy
+  search, completion and export see the merged vocabulary. clear_trie and
+  load_keywords reset the title's layer and keep the base.
+  """
+  def __init__(self, base):
+    # base: a PrefixTrie, a TrieProcessor, or a path passed to shared_base
+    if isinstance(base, str):
+      base = shared_base(base)
+    elif isinstance(base, TrieProcessor):
+      base = base.trie
+    if not isinstance(base, PrefixTrie):
+      raise TypeError(f"Cannot use {type(base).__name__} as a base vocabulary")
+    self.base = base
+    super().__init__()
+
+  def _new_trie(self):
+    return LayeredTrie(self.base)
+
+  def clear_trie(self):
+    super().clear_trie()
+    return "Title vocabulary cleared (base vocabulary kept)"
+
+  def load_snapshot(self, path):
+    # A snapshot holds a whole PrefixTrie and would replace the layered one
+    raise ValueError("Cannot load a snapshot into a title overlay; pass it as the base "
+                     "(OverlayTrieProcessor(path)) and load the title layer from a keyword list")
+
+  def overlay_words(self):
+    # Words whose merged frequency differs from the base: (word, frequency),
+    # frequency 0 for masked base words
+    changed = []
+    stack = [(self.trie.delta, '')]
+    while stack:
+      node, prefix = stack.pop()
+      if node.frequency and prefix:
+        changed.append((prefix, self.get_frequency(prefix)))
+      for char, child in node.children.items():
+        stack.append((child, prefix + char))
+    return sorted(changed)
@@ -0,0 +1,388 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from helpers.trie import LimitedMatches
+from processors.batch_restorer import DEFAULT_QUERY_LIMITS
+from processors.text_processor import TextProcessor
+from processors.trie_processor import TrieProcessor, is_snapshot_file
+
+# Same token pattern as TextProcessor.restore_text
+TOKEN_RE = re.compile(r"[a-zA-Z0-9*']+|[^\w\s]|\n")
+
+_REQUIRED = object()
+
+def _field(body, name, kind, default=_REQUIRED):
+  # body[name] checked against kind (ints accepted for floats); KeyError when
+  # a required field is missing, ValueError when it has the wrong type
+  if name not in body:
+    if default is _REQUIRED:
+      raise KeyError(name)
+    return default
+  value = body[name]
+  if kind is float and isinstance(value, int) and not isinstance(value, bool):
+    return float(value)
+  if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+    raise ValueError(f"field '{name}' must be {'a string' if kind is str else 'a number'}")
+  return value
+
+def _strings(body, plural, singular):
+  # A list of strings from body[plural], or the single string body[singular]
+  if plural in body:
+    values = body[plural]
+    if not isinstance(values, list) or not values or not all(isinstance(v, str) for v in values):
+      raise ValueError(f"field '{plural}' must be a non-empty list of strings")
+    return values
+  return [_field(body, singular, str)]
+
+class _Vocabulary:
+  # One loaded vocabulary and language model; replaced as a whole on reload
+  def __init__(self, trie_processor, lm=None, source=None, query_limits=None):
+    self.trie_proc = trie_processor
+    self.lm = lm
+    self.source = source
+    self.loaded_at = time.time()
+    # Fuzzy searches share one searcher (and its caches) per vocabulary
+    self.text_processor = TextProcessor(trie_processor)
+    self.text_processor.set_query_limits(**(query_limits or {}))
+    self.fuzzy_lock = threading.Lock()
+    self._searcher = None
+
+  def searcher(self):
+    from processors.fuzzy_search import TrieFuzzySearcher
+    if self._searcher is None:
+      self._searcher = TrieFuzzySearcher(self.trie_proc)
+    return self._searcher
+
+class _PrefetchedMatches:
+  """
+  Stands in for a TrieProcessor inside a per-request TextProcessor: answers
+  find_matches from results the batcher already computed and delegates
+  everything else to the real processor.
+  """
+  def __init__(self, trie_processor, matches):
+    self._trie_proc = trie_processor
+    self._matches = matches
+
+  def find_matches(self, pattern, **limits):
+    # The batcher ran every pattern under the service's query limits, the
+    # same ones the per-request TextProcessor passes here
+    found = self._matches.get(pattern.lower())
+    if found is None:
+      return self._trie_proc.find_matches(pattern, **limits)
+    # Strategies may reorder the list they get; hand out a copy
+    if isinstance(found, LimitedMatches):
+      return LimitedMatches(found, found.reason, found.visited, found.estimate)
+    return list(found)
+
+  def __getattr__(self, name):
+    return getattr(self._trie_proc, name)
+
+class MatchBatcher:
+  """
+  Collects find_matches requests that arrive within window seconds of each
+  other, runs each distinct (vocabulary, pattern) once, and resolves every
+  caller's future from the shared result. Lookups run under limits (see
+  TrieProcessor.find_matches), so one broad pattern cannot hold up the
+  thread every request waits on; cut-short results are LimitedMatches.
+  """
+  def __init__(self, window=0.005, max_batch=1024, limits=None):
+    self.window = window
+    self.max_batch = max_batch
+    self.limits = dict(limits or {})
+    self._queue = []
+    self._cond = threading.Condition()
+    self._closed = False
+    self.batches = 0
+    self.requested = 0
+    self.computed = 0
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+
+  def submit(self, vocab, patterns):
+    # Returns {pattern: future} for the lowercased distinct patterns
+    futures = {}
+    with self._cond:
+      for pattern in set(p.lower() for p in patterns):
+        future = Future()
+        self._queue.append((vocab, pattern, future))
+        futures[pattern] = future
+      self._cond.notify()
+    return futures
+
+  def match_all(self, vocab, patterns, timeout=None):
+    futures = self.submit(vocab, patterns)
+    return {p: f.result(timeout) for p, f in futures.items()}
+
+  def close(self):
+    with self._cond:
+      self._closed = True
+      self._cond.notify()
+    self._thread.join()
+
+  def _run(self):
+    while True:
+      with self._cond:
+        while not self._queue and not self._closed:
+          self._cond.wait()
+        if self._closed and not self._queue:
+          return
+      # Let requests that arrive close together join this batch
+      time.sleep(self.window)
+      with self._cond:
+        batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+      self._process(batch)
+
+  def _process(self, batch):
+    groups = {}
+    for vocab, pattern, future in batch:
+      groups.setdefault((id(vocab), pattern), (vocab, []))[1].append(future)
+    self.batches += 1
+    self.requested += len(batch)
+    self.computed += len(groups)
+    for (_, pattern), (vocab, futures) in groups.items():
+      try:
+        result = vocab.trie_proc.find_matches(pattern, **self.limits)
+      except Exception as e:
+        for future in futures:
+          future.set_exception(e)
+        continue
+      for future in futures:
+        future.set_result(result)
+
+  def stats(self):
+    return {'batches': self.batches, 'requested': self.requested, 'computed': self.computed}
+
+class RestoreService:
+  """
+  Long-running restore backend: keeps a warm trie (and optional language
+  model) and serves restore, match, complete, fuzzy and context-restore
+  requests, plus GET /metrics for Prometheus. Wildcard lookups from
+  concurrent requests go through a shared MatchBatcher. Reloads build the
+  new vocabulary on the side and swap it in with a single assignment, so
+  requests in flight finish on the old one. Wildcard lookups run under
+  query_limits; responses list the patterns cut short in 'truncated'.
+  """
+  def __init__(self, trie_processor=None, lm=None, window=0.005, query_limits=DEFAULT_QUERY_LIMITS):
+    self.query_limits = {k: v for k, v in (query_limits or {}).items() if v is not None}
+    self._vocab = _Vocabulary(trie_processor or TrieProcessor(), lm, query_limits=self.query_limits)
+    self._reload_lock = threading.Lock()
+    self.batcher = MatchBatcher(window, limits=self.query_limits)
+    self.started_at = time.time()
+
+  @property
+  def vocab(self):
+    return self._vocab
+
+  # ----- loading -----
+  @staticmethod
+  def load_trie(path, base=None):
+    # With base (a shared PrefixTrie), path becomes a title layer over it
+    if base is not None:
+      from processors.overlay_processor import OverlayTrieProcessor
+      trie_processor = OverlayTrieProcessor(base)
+    else:
+      trie_processor = TrieProcessor()
+    if is_snapshot_file(path):
+      trie_processor.load_snapshot(path)
+    else:
+      from helpers.file_io import FileIO
+      message = FileIO.load_keywords(path, trie_processor)
+      if message.startswith('Error'):
+        raise ValueError(message)
+    return trie_processor
+
+  @staticmethod
+  def load_lm(path, order=2):
+    from models.language_model import NGramLanguageModel, BackoffNGramModel, is_model_file, load_model_file
+    if is_model_file(path):
+      return load_model_file(path)
+    if order > 2:
+      lm = BackoffNGramModel(order=order)
+      lm.fit_from_file(path)
+      return lm
+    lm = NGramLanguageModel(k=1.0)
+    lm.fit_from_file(path)
+    return lm.compile()
+
+  def reload_keywords(self, path):
+    # Build off to the side, then swap; requests in flight keep the old vocabulary.
+    # Snapshots are pickles, so clients may only point at keyword lists
+    if is_snapshot_file(path):
+      raise ValueError("trie snapshots cannot be loaded over HTTP; reload from a keyword list "
+                       "or restart the service with the snapshot")
+    with self._reload_lock:
+      # An overlay vocabulary keeps its shared base; only the title layer is replaced
+      trie_processor = self.load_trie(path, getattr(self._vocab.trie_proc, 'base', None))
+      self._vocab = _Vocabulary(trie_processor, self._vocab.lm, source=path, query_limits=self.query_limits)
+    return {'words': len(trie_processor.get_all_words()), 'source': path}
+
+  def reload_lm(self, path, order=2):
+    with self._reload_lock:
+      lm = self.load_lm(path, order)
+      current = self._vocab
+      self._vocab = _Vocabulary(current.trie_proc, lm, source=current.source, query_limits=self.query_limits)
+    return {'lm': type(lm).__name__, 'source': path}
+
+  # ----- operations -----
+  def _prefetched_processor(self, vocab, text):
+    # TextProcessor whose wildcard lookups were answered in one batch
+    patterns = [t for t in TOKEN_RE.findall(text) if '*' in t]
+    matches = self.batcher.match_all(vocab, patterns) if patterns else {}
+    processor = TextProcessor(_PrefetchedMatches(vocab.trie_proc, matches))
+    processor.set_query_limits(**self.query_limits)
+    return processor
+
+  @staticmethod
+  def _truncated(processor):
+    # Wildcards of the last restore whose lookup hit a query limit
+    return [{'pattern': token, 'reason': matches.reason} for token, matches in processor.limited_queries]
+
+  def restore(self, text, mode='best'):
+    # (restored text, truncated lookups)
+    vocab = self._vocab
+    if mode == 'fuzzy':
+      with vocab.fuzzy_lock:
+        restored = vocab.text_processor.restore_text(text, mode)
+        return restored, self._truncated(vocab.text_processor)
+    processor = self._prefetched_processor(vocab, text)
+    return processor.restore_text(text, mode), self._truncated(processor)
+
+  def match(self, patterns):
+    return self.batcher.match_all(self._vocab, patterns)
+
+  def complete(self, prefix, limit=10):
+    return self._vocab.trie_proc.complete(prefix, limit)
+
+  def fuzzy(self, words, max_dist=1, k=5):
+    vocab = self._vocab
+    with vocab.fuzzy_lock:
+      searcher = vocab.searcher()
+      return {w: searcher.search_top_k(w, k=k, max_dist=max_dist) for w in words}
+
+  def context_restore(self, text, threshold=0.6, decoder='independent', beam_width=8):
+    vocab = self._vocab
+    if vocab.lm is None:
+      raise ValueError("No language model loaded; POST /reload/lm first")
+    processor = self._prefetched_processor(vocab, text)
+    restored, rows = processor.restore_text_with_context(
+      text, vocab.lm, threshold=threshold, decoder=decoder, beam_width=beam_width
+    )
+    review = [dict(zip(('original', 'choice', 'confidence', 'left', 'right', 'candidates'), row)) for row in rows]
+    return restored, review, self._truncated(processor)
+
+  def health(self):
+    vocab = self._vocab
+    return {
+      'status': 'ok',
+      'uptime_s': round(time.time() - self.started_at, 3),
+      'trie_version': vocab.trie_proc.version,
+      'trie_source': vocab.source,
+      'lm_loaded': vocab.lm is not None,
+      'batcher': self.batcher.stats(),
+    }
+
+  # ----- HTTP -----
+  def handle(self, path, body):
+    """Dispatch one JSON request; returns (status code, response dict)."""
+    try:
+      if not isinstance(body, dict):
+        raise ValueError("request body must be a JSON object")
+      if path == '/health':
+        return 200, self.health()
+      if path == '/restore':
+        mode = _field(body, 'mode', str, 'best')
+        if mode not in ('best', 'all', 'fuzzy'):
+          raise ValueError(f"unknown mode {mode!r}")
+        restored, truncated = self.restore(_field(body, 'text', str), mode)
+        return 200, {'restored': restored, 'truncated': truncated}
+      if path == '/match':
+        patterns = _strings(body, 'patterns', 'pattern')
+        results = self.match(patterns)
+        truncated = [{'pattern': p, 'reason': results[p.lower()].reason} for p in patterns
+                     if getattr(results[p.lower()], 'truncated', False)]
+        return 200, {'matches': {p: results[p.lower()] for p in patterns}, 'truncated': truncated}
+      if path == '/complete':
+        return 200, {'completions': self.complete(_field(body, 'prefix', str), _field(body, 'limit', int, 10))}
+      if path == '/fuzzy':
+        words = _strings(body, 'words', 'word')
+        results = self.fuzzy(words, _field(body, 'max_dist', int, 1), _field(body, 'k', int, 5))
+        return 200, {'suggestions': results}
+      if path == '/context-restore':
+        decoder = _field(body, 'decoder', str, 'independent')
+        if decoder not in ('independent', 'beam'):
+          raise ValueError(f"unknown decoder {decoder!r}")
+        restored, review, truncated = self.context_restore(
+          _field(body, 'text', str), _field(body, 'threshold', float, 0.6),
+          decoder, _field(body, 'beam_width', int, 8)
+        )
+        return 200, {'restored': restored, 'review': review, 'truncated': truncated}
+      if path == '/reload/keywords':
+        return 200, self.reload_keywords(_field(body, 'path', str))
+      if path == '/reload/lm':
+        return 200, self.reload_lm(_field(body, 'path', str), _field(body, 'order', int, 2))
+      return 404, {'error': f"unknown endpoint {path}"}
+    except KeyError as e:
+      return 400, {'error': f"missing field {e}"}
+    except (ValueError, OSError) as e:
+      return 400, {'error': str(e)}
+    except Exception as e:
+      # Never let a request kill its connection without a reply
+      return 500, {'error': f"internal error: {type(e).__name__}: {e}"}
+
+  def make_server(self, host='127.0.0.1', port=8765):
+    service = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def _reply(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+      def do_GET(self):
+        if self.path == '/metrics':
+          # Prometheus scrape endpoint (text format, not JSON)
+          from helpers.metrics import METRICS
+          data = METRICS.to_prometheus().encode('utf-8')
+          self.send_response(200)
+          self.send_header('Content-Type', 'text/plain; version=0.0.4')
+          self.send_header('Content-Length', str(len(data)))
+          self.end_headers()
+          self.wfile.write(data)
+          return
+        self._reply(*service.handle(self.path, {}))
+
+      def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+          body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+          self._reply(400, {'error': 'request body is not valid JSON'})
+          return
+        self._reply(*service.handle(self.path, body))
+
+      def log_message(self, format, *args):
+        pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+  def serve_forever(self, host='127.0.0.1', port=8765):
+    server = self.make_server(host, port)
+    print(f"Restore service listening on http://{host}:{server.server_address[1]}")
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      server.server_close()
+      self.batcher.close()
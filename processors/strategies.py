@@ -1,5 +1,33 @@
 from abc import ABC, abstractmethod
-import random
+import hashlib
+
+def _lower_context(context):
+  # Lowercase a context word, or each word of a multi-word context
+  if isinstance(context, str):
+    return context.lower()
+  return tuple(w.lower() for w in context)
+
+def _find_matches(pattern, trie_processor, kwargs):
+  # find_matches under the caller's query limits (kwargs 'limits'), reporting
+  # queries cut short to the kwargs 'on_limited' callback
+  limits = kwargs.get('limits')
+  if not limits:
+    return trie_processor.find_matches(pattern)
+  matches = trie_processor.find_matches(pattern, **limits)
+  on_limited = kwargs.get('on_limited')
+  if matches.truncated and on_limited is not None:
+    on_limited(pattern, matches)
+  return matches
+
+def tie_break(candidates, pattern, position=None, seed=0):
+  # Pick one of several equally ranked candidates by hashing (seed, pattern,
+  # position): stable across runs and processes, yet repeated occurrences of
+  # a pattern in a document need not all get the same word
+  if len(candidates) == 1:
+    return candidates[0]
+  key = f"{seed}\t{pattern.lower()}\t{position}".encode('utf-8')
+  h = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+  return sorted(candidates)[h % len(candidates)]
 
 class RestoreStrategy(ABC):
   @abstractmethod
@@ -7,47 +35,107 @@ class RestoreStrategy(ABC):
     # Restore a single wildcard word using the provided trie processor
     pass
 
+  def may_match(self, pattern, word):
+    # Could word be among pattern's matches? Vocabulary changes to words that
+    # cannot leave pattern's restoration unchanged
+    pattern = pattern.lower()
+    return len(pattern) == len(word) and all(p == '*' or p == c for p, c in zip(pattern, word))
+
 class BestMatchStrategy(RestoreStrategy):
   def restore(self, pattern, trie_processor, **kwargs):
-    # Return the best match (random among highest frequency)
-    matches = trie_processor.find_matches(pattern)
+    """
+    Return the best match; ties on the highest frequency go to tie_break.
+    kwargs:
+      position: token index of pattern in its document
+      seed: tie-break seed (default 0)
+    """
+    matches = _find_matches(pattern, trie_processor, kwargs)
     if not matches:
       return pattern
     max_freq = matches[0][1]
     top = [w for w, f in matches if f == max_freq]
-    return random.choice(top)
+    return tie_break(top, pattern, kwargs.get('position'), kwargs.get('seed', 0))
 
 class AllMatchesStrategy(RestoreStrategy):
   def restore(self, pattern, trie_processor, **kwargs):
     # Return all matches as ['opt1','opt2',...] format
-    matches = trie_processor.find_matches(pattern)
+    matches = _find_matches(pattern, trie_processor, kwargs)
     if not matches:
       return pattern
     items = [f"'{w}'" for w, _ in matches]
     return f"[{','.join(items)}]"
 
+class FuzzyWildcardStrategy(RestoreStrategy):
+  def __init__(self, max_dist=1, confusables=None, cache=None):
+    # Edit budget for the non-wildcard characters, the OCR confusables map
+    # and an optional SuggestionCache shared with other searches
+    self.max_dist = max_dist
+    self.confusables = confusables
+    self.cache = cache
+    self._searcher = None
+    self._model = None
+    self._tables = {}
+
+  def set_cache(self, cache):
+    # Use another SuggestionCache; the searcher is rebuilt on next use
+    self.cache = cache
+    self._searcher = None
+
+  def may_match(self, pattern, word, max_dist=None):
+    from processors.fuzzy_search import ConfusionModel
+    if self._model is None:
+      self._model = ConfusionModel(self.confusables)
+    max_dist = self.max_dist if max_dist is None else max_dist
+    spread = self._model.max_length_change(max_dist)
+    if spread is not None and abs(len(pattern) - len(word)) > spread:
+      return False
+    # One query table per pattern, reused across the changed words
+    table = self._tables.get(pattern)
+    if table is None:
+      if len(self._tables) >= 4096:
+        self._tables.clear()
+      table = self._tables[pattern] = self._model.query(pattern.lower(), wildcard='*')
+    return self._model.table_distance(table, word, max_dist) is not None
+
+  def restore(self, pattern, trie_processor, **kwargs):
+    """
+    Resolve a token with wildcards and OCR typos (e.g. 'sunshet*') in one
+    trie traversal: '*' matches any character, other characters may differ
+    by up to max_dist edits. Returns the closest, most frequent candidate.
+    kwargs:
+      max_dist: int (overrides the strategy default)
+    """
+    from processors.fuzzy_search import TrieFuzzySearcher
+    if self._searcher is None or self._searcher.trie_proc is not trie_processor:
+      self._searcher = TrieFuzzySearcher(trie_processor, confusables=self.confusables, cache=self.cache)
+    matches = self._searcher.search_pattern(pattern, max_dist=kwargs.get('max_dist', self.max_dist), k=1)
+    if not matches:
+      return pattern
+    return matches[0][0]
+
 class ContextBestStrategy(RestoreStrategy):
   def restore(self, pattern, trie_processor, **kwargs):
     """
-    Context-aware best choice using a bigram LM.
+    Context-aware best choice using an n-gram LM.
     kwargs:
-      lm: NGramLanguageModel (required)
-      left_word: str or '<s>'
-      right_word: str or None
+      lm: NGramLanguageModel or BackoffNGramModel (required)
+      left_word: str or '<s>' (or a tuple of words, oldest first, for order > 2)
+      right_word: str or None (or a tuple of words, nearest first, for order > 2)
+      limits, on_limited: query limits for find_matches (see TextProcessor.set_query_limits)
     """
     lm = kwargs.get('lm')
-    left_word = (kwargs.get('left_word') or '<s>').lower()
+    left_word = _lower_context(kwargs.get('left_word') or '<s>')
     right_word = kwargs.get('right_word')
     if right_word is not None:
-      right_word = right_word.lower()
+      right_word = _lower_context(right_word)
 
     if lm is None:
       # Fallback to plain best if LM not provided
-      return BestMatchStrategy().restore(pattern, trie_processor)
+      return BestMatchStrategy().restore(pattern, trie_processor, **kwargs)
 
-    matches = trie_processor.find_matches(pattern)
+    matches = _find_matches(pattern, trie_processor, kwargs)
     if not matches:
-      return pattern
+      return pattern, 0.0
 
     candidates = [w for w, _ in matches]
     best, confidence, _ = lm.choose_best(candidates, left_word, right_word)
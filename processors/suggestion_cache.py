@@ -0,0 +1,90 @@
+import json
+import sqlite3
+
+class SuggestionCache:
+  """
+  Memo of fuzzy search results shared across searchers, documents and
+  BatchRestorer runs. Entries are keyed by (kind, token, max_dist, k) together
+  with the confusion-model hash; the in-memory layer is dropped whenever the
+  trie's version changes. With a path, results are also kept in an SQLite
+  file keyed by the vocabulary fingerprint, so they survive across sessions
+  and stay valid only for the exact same vocabulary.
+  """
+  def __init__(self, path=None):
+    self.path = path
+    self._memory = {}
+    self._trie_state = None   # (trie processor id, version) the memory belongs to
+    self.hits = 0
+    self.misses = 0
+    self._db = None
+    if path:
+      self._db = sqlite3.connect(path)
+      self._db.execute(
+        "CREATE TABLE IF NOT EXISTS suggestions ("
+        " vocab TEXT, confusion TEXT, kind TEXT, token TEXT, max_dist REAL, k INTEGER,"
+        " results TEXT, PRIMARY KEY (vocab, confusion, kind, token, max_dist, k))"
+      )
+
+  def _sync(self, trie_processor):
+    # Forget in-memory results computed against an older vocabulary
+    state = (id(trie_processor), trie_processor.version)
+    if state != self._trie_state:
+      self._memory = {}
+      self._trie_state = state
+
+  def lookup(self, trie_processor, model, key):
+    """Return cached results for key, or None on a miss."""
+    self._sync(trie_processor)
+    full_key = (model.fingerprint(),) + key
+    results = self._memory.get(full_key)
+    if results is None and self._db is not None:
+      kind, token, max_dist, k = key
+      row = self._db.execute(
+        "SELECT results FROM suggestions WHERE vocab=? AND confusion=? AND kind=? AND token=?"
+        " AND max_dist=? AND k IS ?",
+        (trie_processor.fingerprint(), full_key[0], kind, token, max_dist, k)
+      ).fetchone()
+      if row is not None:
+        results = [tuple(r) for r in json.loads(row[0])]
+        self._memory[full_key] = results
+    if results is None:
+      self.misses += 1
+    else:
+      self.hits += 1
+    return results
+
+  def store(self, trie_processor, model, key, results):
+    self._sync(trie_processor)
+    full_key = (model.fingerprint(),) + key
+    self._memory[full_key] = results
+    if self._db is not None:
+      kind, token, max_dist, k = key
+      self._db.execute(
+        "INSERT OR REPLACE INTO suggestions VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (trie_processor.fingerprint(), full_key[0], kind, token, max_dist, k, json.dumps(results))
+      )
+
+  def flush(self):
+    # Commit pending on-disk entries
+    if self._db is not None:
+      self._db.commit()
+
+  def close(self):
+    if self._db is not None:
+      self._db.commit()
+      self._db.close()
+      self._db = None
+
+  @property
+  def hit_rate(self):
+    lookups = self.hits + self.misses
+    return self.hits / lookups if lookups else 0.0
+
+  def reset_stats(self):
+    self.hits = 0
+    self.misses = 0
+
+  def report(self):
+    # One-line summary printed with fuzzy output
+    lookups = self.hits + self.misses
+    return f"Suggestion cache: {self.hits}/{lookups} hits ({self.hit_rate * 100:.1f}%)"
@@ -1,45 +1,100 @@
+import math
 import re
-from processors.strategies import BestMatchStrategy, AllMatchesStrategy, ContextBestStrategy
+from processors.strategies import BestMatchStrategy, AllMatchesStrategy, ContextBestStrategy, FuzzyWildcardStrategy
 from processors.base_processor import BaseProcessor
+from helpers.metrics import METRICS
 
 class TextProcessor(BaseProcessor):
-  def __init__(self, trie_processor):
+  def __init__(self, trie_processor, suggestion_cache=None, seed=0):
     # Store the trie processor instance for word restoration
     super().__init__()
     self.trie = trie_processor
+    # Optional SuggestionCache for fuzzy restores, shared with batch runs
+    self.suggestion_cache = suggestion_cache
     # Register strategies for polymorphic restore behavior
     self._strategies = {
       'best': BestMatchStrategy(),
-      'all': AllMatchesStrategy()
+      'all': AllMatchesStrategy(),
+      'fuzzy': FuzzyWildcardStrategy(cache=suggestion_cache)
     }
+    # Optional find_matches limits (max_nodes, timeout, max_cost) and the
+    # (token, LimitedMatches) pairs cut short during the last restore
+    self.query_limits = None
+    self.limited_queries = []
+    # Seed for breaking frequency ties in 'best' mode; the pick also depends on
+    # the pattern and its token position, so equal inputs give equal outputs
+    self.seed = seed
+    # Token count of the last restore_text input
+    self.tokens_seen = 0
 
-  def restore_word(self, word, mode='best'):
+  def set_suggestion_cache(self, suggestion_cache):
+    # Switch the SuggestionCache used by fuzzy restores
+    self.suggestion_cache = suggestion_cache
+    self._strategies['fuzzy'].set_cache(suggestion_cache)
+
+  def set_query_limits(self, max_nodes=None, timeout=None, max_cost=None):
+    """
+    Bound every wildcard lookup: stop after max_nodes trie nodes or timeout
+    seconds (keeping partial matches), and skip patterns whose estimated
+    cost is above max_cost. Call with no arguments to remove the limits.
+    """
+    limits = {'max_nodes': max_nodes, 'timeout': timeout, 'max_cost': max_cost}
+    limits = {k: v for k, v in limits.items() if v is not None}
+    self.query_limits = limits or None
+
+  def _on_limited(self, token, matches):
+    self.limited_queries.append((token, matches))
+
+  def _find_matches(self, token):
+    # Wildcard lookup under the current query limits
+    if not self.query_limits:
+      return self.trie.find_matches(token)
+    matches = self.trie.find_matches(token, **self.query_limits)
+    if matches.truncated:
+      self._on_limited(token, matches)
+    return matches
+
+  def _limit_kwargs(self):
+    return {'limits': self.query_limits, 'on_limited': self._on_limited} if self.query_limits else {}
+
+  def restore_word(self, word, mode='best', position=None):
     # If the word does not contain a wildcard, return as is
     if '*' not in word:
       return word
 
-    # Pick strategy and restore word
+    # Pick strategy and restore word (position: token index, for tie-breaks)
     strat = self._strategies.get(mode, self._strategies['best'])
-    result = strat.restore(word, self.trie)
+    result = strat.restore(word, self.trie, position=position, seed=self.seed, **self._limit_kwargs())
     # Record restoration event
     self.record((word, result))
     return result
 
-  def restore_text(self, text, mode='best'):
+  def may_restore_to(self, token, word, mode='best'):
+    # Could word be a candidate for token under mode? (see RestoreStrategy.may_match)
+    strat = self._strategies.get(mode, self._strategies['best'])
+    return strat.may_match(token, word)
+
+  def render_word(self, token, mode='best', position=None):
+    # Output form of one wildcard token: <best> for 'best'/'fuzzy', the
+    # ['opt1','opt2'] list for 'all'
+    restored = self.restore_word(token, mode, position)
+    return f"<{restored}>" if mode in ('best', 'fuzzy') else restored
+
+  @METRICS.timed('text_restore', label_args=('mode',))
+  def restore_text(self, text, mode='best', spans=None, first_position=0):
+    # spans, if given, receives (start, end, token, position) for each
+    # wildcard token's rendering in the returned text; first_position is the
+    # token index of text within a longer document (see restore_chunks)
     # Tokenize words including wildcards, apostrophes, digits, punctuation, and newlines
     tokens = re.findall(r"[a-zA-Z0-9*']+|[^\w\s]|\n", text)
     restored_tokens = []
+    self.limited_queries = []
+    self.tokens_seen = len(tokens)
 
-    for token in tokens:
+    for position, token in enumerate(tokens, first_position):
       if '*' in token:
-        # Restore words with wildcards
-        restored = self.restore_word(token, mode)
-        if mode == 'best':
-          # Wrap the best match with < >
-          restored_tokens.append(f"<{restored}>")
-        else:
-          # Keep the ['opt1','opt2'] output
-          restored_tokens.append(restored)
+        # Restore words with wildcards: <best> (or best fuzzy) match, or the ['opt1','opt2'] list
+        restored_tokens.append(self.render_word(token, mode, position))
       else:
         # Keep tokens without wildcards unchanged
         restored_tokens.append(token)
@@ -49,20 +104,47 @@ class TextProcessor(BaseProcessor):
     for i, token in enumerate(restored_tokens):
       if token == '\n':
         restored_text += token
-      elif i > 0 and restored_tokens[i - 1] != '\n' and not re.match(r"[.,!?;:\)\]\}]", token):
-        restored_text += " " + token
-      else:
-        restored_text += token
+        continue
+      if i > 0 and restored_tokens[i - 1] != '\n' and not re.match(r"[.,!?;:\)\]\}]", token):
+        restored_text += " "
+      if spans is not None and '*' in tokens[i]:
+        spans.append((len(restored_text), len(restored_text) + len(token), tokens[i], first_position + i))
+      restored_text += token
     return restored_text
   
-  def restore_text_with_context(self, text, lm, threshold=0.6):
+  def restore_chunks(self, chunks, mode='best'):
+    """
+    Restore a document given as line-aligned pieces (see
+    FileIO.iter_text_chunks), yielding the restored pieces. Token positions
+    carry over between pieces, so the joined output equals restore_text on
+    the whole document.
+    """
+    position = 0
+    for chunk in chunks:
+      yield self.restore_text(chunk, mode, first_position=position)
+      position += self.tokens_seen
+
+  def restore_chunks_with_context(self, chunks, lm, **kwargs):
+    # restore_text_with_context piece by piece: yields (restored, review rows);
+    # wildcard context never crosses a newline, so line-aligned pieces decode
+    # exactly as the whole document would
+    for chunk in chunks:
+      yield self.restore_text_with_context(chunk, lm, **kwargs)
+
+  @METRICS.timed('text_restore_context', label_args=('decoder',))
+  def restore_text_with_context(self, text, lm, threshold=0.6, decoder='independent', beam_width=8, max_candidates=20):
     """
     Restore a text using the ContextBestStrategy with a language model.
+    decoder='beam' decodes all wildcards of a line jointly (see _decode_line_beam).
     Produces:
       - restored text (best choices wrapped in <...>)
       - a list of review rows for CSV: [(original, choice, confidence, left, right, candidates_csv), ...]
     """
     tokens = re.findall(r"[a-zA-Z0-9*']+|[^\w\s]|\n", text)
+    self.limited_queries = []
+    if decoder == 'beam':
+      restored_tokens, review_rows = self._restore_tokens_beam(tokens, lm, threshold, beam_width, max_candidates)
+      return self._join_tokens(restored_tokens), review_rows
     restored_tokens = []
     review_rows = []
     ctx_strategy = ContextBestStrategy()
@@ -87,12 +169,37 @@ class TextProcessor(BaseProcessor):
         j += 1
       return None
 
+    def context_words(idx, step, n):
+      # Up to n words on one side (nearest first), stopping at a line boundary
+      words = []
+      j = idx + step
+      while 0 <= j < len(tokens) and len(words) < n:
+        if re.match(r"[A-Za-z0-9']+$", tokens[j]):
+          words.append(tokens[j].lower())
+        elif tokens[j] == '\n':
+          words.append('<s>' if step < 0 else '</s>')
+          return words
+        j += step
+      if j < 0 and len(words) < n:
+        words.append('<s>')
+      return words
+
+    order = getattr(lm, 'order', 2)
+
     for i, token in enumerate(tokens):
       if '*' in token:
         # Score candidates using the language model and surrounding context
         left = prev_word(i)
         right = next_word(i)
-        choice, conf = ctx_strategy.restore(token, self.trie, lm=lm, left_word=left, right_word=right)
+        if order > 2:
+          # Higher-order models take several words of context on each side
+          left_ctx = tuple(reversed(context_words(i, -1, order - 1)))
+          right_ctx = tuple(context_words(i, 1, order - 1))
+          choice, conf = ctx_strategy.restore(token, self.trie, lm=lm, left_word=left_ctx, right_word=right_ctx,
+                                              **self._limit_kwargs())
+        else:
+          choice, conf = ctx_strategy.restore(token, self.trie, lm=lm, left_word=left, right_word=right,
+                                              **self._limit_kwargs())
 
         # Apply threshold: only replace if confidence >= threshold; otherwise keep original token
         if conf >= threshold:
@@ -101,13 +208,16 @@ class TextProcessor(BaseProcessor):
           restored_tokens.append(token)
 
         # Collect review information for CSV (always recorded, even if not replaced)
-        matches = self.trie.find_matches(token)
+        matches = self.trie.find_matches(token, **(self.query_limits or {}))
         alts = [w for w, _ in matches]
         review_rows.append((token, choice, f"{conf:.3f}", left, (right or ''), ",".join(alts)))
       else:
         # Keep tokens without wildcards unchanged
         restored_tokens.append(token)
 
+    return self._join_tokens(restored_tokens), review_rows
+
+  def _join_tokens(self, restored_tokens):
     # Reconstruct the text, preserving spacing/newlines and handling punctuation
     out = ''
     for i, tok in enumerate(restored_tokens):
@@ -117,5 +227,83 @@ class TextProcessor(BaseProcessor):
         out += ' ' + tok
       else:
         out += tok
+    return out
+
+  def _restore_tokens_beam(self, tokens, lm, threshold, beam_width, max_candidates):
+    # Jointly decode each line, then emit tokens and review rows in text order
+    restored_tokens = list(tokens)
+    review_rows = []
+    start = 0
+    for end in [i for i, t in enumerate(tokens) if t == '\n'] + [len(tokens)]:
+      positions = [i for i in range(start, end) if re.match(r"[A-Za-z0-9*']+$", tokens[i])]
+      for i, choice, conf, left, right, alts in self._decode_line_beam(tokens, positions, lm, beam_width, max_candidates):
+        restored_tokens[i] = f"<{choice}>" if conf >= threshold else tokens[i]
+        review_rows.append((tokens[i], choice, f"{conf:.3f}", left, right, ",".join(alts)))
+      start = end + 1
+    return restored_tokens, review_rows
 
-    return out, review_rows
\ No newline at end of file
+  def _decode_line_beam(self, tokens, positions, lm, beam_width, max_candidates):
+    """
+    Treat one line as a lattice: known words have a single candidate, each
+    wildcard has its top max_candidates trie matches. A beam search over the
+    LM scores (paths sharing the same LM state are recombined Viterbi-style,
+    then the beam is cut to beam_width) picks the jointly best sequence.
+    Yields (token index, choice, confidence, left, right, all matches) per wildcard,
+    where confidence is the LM posterior of the choice with its decoded
+    neighbours held fixed.
+    """
+    order = getattr(lm, 'order', 2)
+
+    def transition(path, word):
+      if order > 2:
+        return lm.logprob_context(tuple(path[-(order - 1):]), word)
+      return lm.logprob_context(path[-1], word)
+
+    lattice = []
+    all_matches = {}
+    for i in positions:
+      token = tokens[i]
+      if '*' in token:
+        matches = [w for w, _ in self._find_matches(token)]
+        all_matches[i] = matches
+        # Unmatched wildcards stay in the lattice as an unknown word
+        lattice.append(matches[:max_candidates] or [token.lower()])
+      else:
+        lattice.append([token.lower()])
+
+    # beams: LM state (last order-1 words) -> (score, path)
+    beams = {('<s>',): (0.0, ('<s>',))}
+    for cands in lattice:
+      expanded = {}
+      for score, path in beams.values():
+        for c in cands:
+          new_path = path + (c,)
+          new_score = score + transition(path, c)
+          key = new_path[-(order - 1):]
+          if key not in expanded or new_score > expanded[key][0]:
+            expanded[key] = (new_score, new_path)
+      ranked = sorted(expanded.items(), key=lambda kv: -kv[1][0])[:beam_width]
+      beams = dict(ranked)
+    best_path = max(((score + transition(path, '</s>'), path) for score, path in beams.values()),
+                    key=lambda sp: sp[0])[1]
+    best_path = best_path + ('</s>',)
+
+    for j, i in enumerate(positions):
+      if i not in all_matches:
+        continue
+      matches = all_matches[i]
+      # best_path[0] is '<s>', so word j of the line sits at best_path[j + 1]
+      left_ctx = best_path[:j + 1]
+      right_ctx = best_path[j + 2:]
+      if not matches:
+        yield i, tokens[i], 0.0, left_ctx[-1], right_ctx[0], matches
+        continue
+      choice = best_path[j + 1]
+      if order > 2:
+        _, _, scores = lm.choose_best(lattice[j], left_ctx[-(order - 1):], right_ctx[:order - 1])
+      else:
+        _, _, scores = lm.choose_best(lattice[j], left_ctx[-1], right_ctx[0])
+      max_score = max(scores.values())
+      Z = sum(math.exp(sc - max_score) for sc in scores.values())
+      conf = math.exp(scores[choice] - max_score) / Z
+      yield i, choice, conf, left_ctx[-1], right_ctx[0], matches
@@ -1,6 +1,22 @@
+import gc
+import pickle
 from helpers.trie import PrefixTrie
 from processors.base_processor import BaseProcessor
 
+# Prebuilt trie snapshots: magic bytes followed by a pickled PrefixTrie. The
+# version digit changes whenever PrefixTrie's pickled state does (2: per-depth
+# level statistics)
+SNAPSHOT_MAGIC = b'TRIESNAP2\n'
+_SNAPSHOT_PREFIX = b'TRIESNAP'
+
+def is_snapshot_file(path):
+  # True when the file starts with trie snapshot magic bytes (any version)
+  try:
+    with open(path, 'rb') as f:
+      return f.read(len(_SNAPSHOT_PREFIX)) == _SNAPSHOT_PREFIX
+  except OSError:
+    return False
+
 class TrieProcessor(BaseProcessor):
 
   def get_random_word(self):
@@ -14,30 +30,141 @@ class TrieProcessor(BaseProcessor):
   def __init__(self):
     # Initialize a new PrefixTrie instance and set current_trie_file to None
     super().__init__()
-    self.__trie = PrefixTrie()
+    self.__trie = self._new_trie()
     self.current_trie_file = None
+    # Callbacks notified as callback(event, word) on 'add', 'delete' and 'clear'
+    self._listeners = []
+    # Bumped on every vocabulary change so caches can tell when they are stale
+    self.version = 0
+    self._fingerprint = (None, None)
+
+  def _new_trie(self):
+    # Empty trie used at construction and by clear_trie; subclasses may layer it
+    return PrefixTrie()
 
   @property
   def trie(self):
     # Read-only access to the underlying trie (encapsulation)
     return self.__trie
 
+  def subscribe(self, callback):
+    # Register a callback(event, word) for vocabulary changes
+    self._listeners.append(callback)
+
+  def unsubscribe(self, callback):
+    if callback in self._listeners:
+      self._listeners.remove(callback)
+
+  def _notify(self, event, word=None):
+    self.version += 1
+    for callback in list(self._listeners):
+      callback(event, word)
+
   def add_word(self, word, count=1):
     # Insert a word (converted to lowercase) into the trie
     self.__trie.insert(word.lower(), count)
+    self._notify('add', word.lower())
     return f"Added '{word}' to trie"
 
   def delete_word(self, word):
     # Delete a word (converted to lowercase) from the trie
     # Return a message indicating success or failure
     if self.__trie.delete(word.lower()):
+      self._notify('delete', word.lower())
       return f"Deleted '{word}' from trie"
     return f"'{word}' is not a keyword in the trie"
 
+  def set_frequency(self, word, frequency):
+    # Set the frequency of a word (converted to lowercase); 0 deletes it
+    word = word.lower()
+    existed = self.__trie.search(word)
+    self.__trie.set_frequency(word, frequency)
+    if frequency > 0:
+      self._notify('add', word)
+    elif existed:
+      self._notify('delete', word)
+    return f"Set '{word}' frequency to {frequency}"
+
   def find_word(self, word):
     # Search for a word (converted to lowercase) in the trie
     return self.__trie.search(word.lower())
 
+  def fingerprint(self):
+    # Content hash of the vocabulary (words and frequencies), cached per version
+    version, digest = self._fingerprint
+    if version != self.version:
+      import hashlib
+      h = hashlib.blake2b(digest_size=16)
+      for word, freq in sorted(self.get_all_words()):
+        h.update(f"{word},{freq}\n".encode('utf-8'))
+      digest = h.hexdigest()
+      self._fingerprint = (self.version, digest)
+    return digest
+
+  def get_frequency(self, word):
+    # Frequency of a word (converted to lowercase), or 0 if it is not a keyword
+    node = self.__trie._get_node(word.lower())
+    return node.frequency if node and node.is_end else 0
+
+  def save_snapshot(self, path):
+    # Write the whole trie in a form that loads much faster than re-inserting words
+    with open(path, 'wb') as f:
+      f.write(SNAPSHOT_MAGIC)
+      pickle.dump(self.__trie, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return f"Trie snapshot saved to {path}"
+
+  def load_snapshot(self, path):
+    # Replace the trie with a snapshot written by save_snapshot
+    with open(path, 'rb') as f:
+      magic = f.read(len(SNAPSHOT_MAGIC))
+      if magic != SNAPSHOT_MAGIC:
+        if magic.startswith(_SNAPSHOT_PREFIX):
+          raise ValueError(f"{path} is a trie snapshot from an older version; rebuild the snapshot "
+                           f"from its keyword list (cli.py build KEYWORDS -o {path})")
+        raise ValueError(f"{path} is not a trie snapshot")
+      # Unpickling creates one object per node; pausing the cyclic GC
+      # avoids repeated full collections over the growing tree
+      gc_was_enabled = gc.isenabled()
+      gc.disable()
+      try:
+        trie = pickle.load(f)
+      finally:
+        if gc_was_enabled:
+          gc.enable()
+    self.__trie = trie
+    self.current_trie_file = path
+    self._notify('clear')
+    if self._listeners:
+      for word, _ in trie.iter_words():
+        self._notify('add', word)
+    return f"Loaded trie snapshot from {path} ({trie.total_words} total frequency)"
+
+  def stats(self):
+    # Node/word counts, shape histograms and memory estimates (see PrefixTrie.stats)
+    return self.__trie.stats()
+
+  def display_stats(self):
+    # Print the stats() report in a compact table
+    s = self.stats()
+    print("\nTrie Statistics")
+    print("=" * 48)
+    for label, value in (('Nodes', s['nodes']), ('Words', s['words']),
+                         ('Total frequency', s['total_frequency']), ('Max depth', s['max_depth']),
+                         ('Mean branching', f"{s['mean_branching']:.2f}"),
+                         ('Single-child chain nodes', s['chain_nodes'])):
+      print(f"{label:28} | {value:>17}")
+    print("-" * 48)
+    for name, size in s['bytes'].items():
+      print(f"{'Bytes: ' + name:28} | {size:>17,}")
+    print(f"{'Bytes per word':28} | {s['bytes_per_word']:>17.1f}")
+    if 'traced_bytes' in s:
+      print(f"{'Bytes traced (tracemalloc)':28} | {s['traced_bytes']:>17,}")
+    print("-" * 48)
+    print(f"Nodes per depth:     {s['depth_histogram']}")
+    print(f"Children per node:   {s['branching_histogram']}")
+    print(f"Chain lengths:       {s['chain_histogram']}")
+    print("=" * 48)
+
   def display_trie(self):
     # Display a visual representation of the trie, or [] if empty
     if self.__trie.total_words == 0:
@@ -49,11 +176,25 @@ class TrieProcessor(BaseProcessor):
     # Retrieve all words stored in the trie
     return self.__trie.get_all_words()
 
-  def find_matches(self, pattern):
-    # Find all words in the trie that match the given pattern (converted to lowercase)
-    return self.__trie.find_matches(pattern.lower())
+  def iter_words(self, sort=False):
+    # Stream (word, frequency) pairs without building the full list
+    return self.__trie.iter_words(sort)
+
+  def find_matches(self, pattern, max_nodes=None, timeout=None, max_cost=None):
+    # Find all words in the trie that match the given pattern (converted to lowercase);
+    # the optional limits bound the walk (see PrefixTrie.find_matches)
+    return self.__trie.find_matches(pattern.lower(), max_nodes, timeout, max_cost)
+
+  def estimate_cost(self, pattern):
+    # Expected trie nodes visited by find_matches(pattern)
+    return self.__trie.estimate_cost(pattern.lower())
+
+  def complete(self, prefix, limit=10):
+    # Top completions (word, frequency) for a prefix (converted to lowercase)
+    return self.__trie.complete(prefix.lower(), limit)
 
   def clear_trie(self):
     # Clear the trie and reset it to empty state
-    self.__trie = PrefixTrie()
+    self.__trie = self._new_trie()
+    self._notify('clear')
     return "Trie cleared successfully"
\ No newline at end of file
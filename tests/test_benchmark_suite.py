@@ -0,0 +1,20 @@
+import io
+from contextlib import redirect_stdout
+
+from benchmarks import suite
+
+def _run():
+  with redirect_stdout(io.StringIO()):
+    return suite.run((1000,), n_docs=1, n_patterns=200, repeat=3, warmup=1)
+
+def test_unchanged_tree_passes_compare():
+  baseline = _run()
+  rows = suite.compare(_run(), baseline)
+  assert rows
+  assert [row[0] for row in rows if row[5]] == []
+
+def test_compare_flags_real_slowdowns():
+  baseline = {'metrics': {'find_matches@1000': 0.1, 'search_word@1000': 0.001}}
+  results = {'metrics': {'find_matches@1000': 0.2, 'search_word@1000': 0.002}}
+  regressed = {row[0]: row[5] for row in suite.compare(results, baseline)}
+  assert regressed == {'find_matches@1000': True, 'search_word@1000': False}
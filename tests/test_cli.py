@@ -0,0 +1,49 @@
+import cli
+
+def _fuzzy_report(tmp_path, *flags):
+  keywords = tmp_path / 'keywords.txt'
+  keywords.write_text('market,10\nmarker,2\n', encoding='utf-8')
+  text = tmp_path / 'input.txt'
+  text.write_text('the rnarket opened\n', encoding='utf-8')
+  report = tmp_path / 'report.txt'
+  code = cli.main(['fuzzy', str(text), '-o', str(report), '--trie', str(keywords), '--max-dist', '1', *flags])
+  assert code == cli.EXIT_OK
+  return report.read_text(encoding='utf-8')
+
+def test_fuzzy_uses_confusables_by_default(tmp_path):
+  assert "rnarket -> ['market']" in _fuzzy_report(tmp_path)
+
+def test_fuzzy_no_confusables_flag(tmp_path):
+  assert 'rnarket' not in _fuzzy_report(tmp_path, '--no-confusables')
+
+def test_restore_in_place(tmp_path):
+  keywords = tmp_path / 'keywords.txt'
+  keywords.write_text('market,10\nmarker,2\n', encoding='utf-8')
+  text = tmp_path / 'input.txt'
+  text.write_text('the mark*t opened\n', encoding='utf-8')
+  reference = tmp_path / 'reference.txt'
+  assert cli.main(['restore', str(text), '-o', str(reference), '--trie', str(keywords)]) == cli.EXIT_OK
+  assert cli.main(['restore', str(text), '-o', str(text), '--trie', str(keywords)]) == cli.EXIT_OK
+  assert text.read_text(encoding='utf-8') == reference.read_text(encoding='utf-8')
+  assert 'market' in reference.read_text(encoding='utf-8')
+  assert sorted(p.name for p in tmp_path.iterdir()) == ['input.txt', 'keywords.txt', 'reference.txt']
+
+def test_restore_missing_input_leaves_no_output(tmp_path):
+  keywords = tmp_path / 'keywords.txt'
+  keywords.write_text('market,10\n', encoding='utf-8')
+  output = tmp_path / 'out.txt'
+  code = cli.main(['restore', str(tmp_path / 'missing.txt'), '-o', str(output), '--trie', str(keywords)])
+  assert code == cli.EXIT_FAILURE
+  assert not output.exists()
+
+def test_build_keyword_layout_options(tmp_path):
+  keywords = tmp_path / 'keywords.txt'
+  keywords.write_text('10;market\n', encoding='utf-8')
+  snapshot = tmp_path / 'vocab.snap'
+  code = cli.main(['--delimiter', ';', '--word-column', '1', '--freq-column', '0',
+                   'build', str(keywords), '-o', str(snapshot)])
+  assert code == cli.EXIT_OK
+  from processors.trie_processor import TrieProcessor
+  trie_processor = TrieProcessor()
+  trie_processor.load_snapshot(str(snapshot))
+  assert trie_processor.get_all_words() == [('market', 10)]
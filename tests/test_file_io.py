@@ -0,0 +1,18 @@
+from helpers.file_io import FileIO
+from processors.trie_processor import TrieProcessor
+
+def test_txt_keywords_skip_malformed_rows(tmp_path):
+  keywords = tmp_path / 'keywords.txt'
+  keywords.write_text('market,10\nword,abc\nplain\n', encoding='utf-8')
+  trie_processor = TrieProcessor()
+  message = FileIO.load_keywords(str(keywords), trie_processor)
+  assert 'Skipped 1 malformed rows at lines: 2' in message
+  assert sorted(trie_processor.get_all_words()) == [('market', 10), ('plain', 1)]
+  assert not trie_processor.find_word('word,abc')
+
+def test_txt_keywords_custom_layout(tmp_path):
+  keywords = tmp_path / 'keywords.txt'
+  keywords.write_text('10;market\n2;marker\n', encoding='utf-8')
+  trie_processor = TrieProcessor()
+  FileIO.load_keywords(str(keywords), trie_processor, delimiter=';', word_column=1, freq_column=0)
+  assert sorted(trie_processor.get_all_words()) == [('marker', 2), ('market', 10)]
@@ -0,0 +1,49 @@
+import pytest
+
+from processors.fuzzy_search import TrieFuzzySearcher
+from processors.trie_processor import TrieProcessor
+
+WORDS = ['market', 'damage', 'union', 'mermaid', 'marker', 'clamp', 'sunset', 'sunshine']
+
+@pytest.fixture
+def trie_processor():
+  trie_processor = TrieProcessor()
+  for word in WORDS:
+    trie_processor.add_word(word)
+  return trie_processor
+
+def test_default_searches_use_bitparallel_engine(trie_processor, monkeypatch):
+  searcher = TrieFuzzySearcher(trie_processor)
+  calls = []
+  original = searcher._search_word_bitparallel
+  monkeypatch.setattr(searcher, '_search_word_bitparallel', lambda *a: calls.append(a) or original(*a))
+  monkeypatch.setattr(searcher, '_search_word_dp', lambda *a: pytest.fail("fell back to the DP engine"))
+  assert searcher.search_word('rnarket', 1) == [('market', 1)]
+  assert searcher.search_word('sunshet', 2)
+  assert calls
+
+@pytest.mark.parametrize('word', ['rnarket', 'clarnage', 'iinion', 'rnerrnaid', 'sunshet', 'rnarkre'])
+@pytest.mark.parametrize('max_dist', [1, 2])
+def test_bitparallel_matches_dp_with_default_confusables(trie_processor, word, max_dist):
+  fast = TrieFuzzySearcher(trie_processor, engine='bitparallel')
+  dp = TrieFuzzySearcher(trie_processor, engine='dp')
+  assert fast.search_word(word, max_dist) == dp.search_word(word, max_dist)
+
+def test_bitparallel_rejects_fractional_weights(trie_processor):
+  searcher = TrieFuzzySearcher(trie_processor, confusables={'e': ['c']}, engine='bitparallel',
+                               weights={('e', 'c'): 0.5})
+  with pytest.raises(ValueError):
+    searcher.search_word('rnarkct', 1)
+
+def test_top_k_uses_bitparallel_engine(trie_processor, monkeypatch):
+  searcher = TrieFuzzySearcher(trie_processor)
+  monkeypatch.setattr(searcher, '_top_k_search', lambda *a: pytest.fail("fell back to the DP engine"))
+  assert searcher.suggest_for_text('the rnarket opened') == [('rnarket', ['market'])]
+
+@pytest.mark.parametrize('word', ['rnarket', 'clarnage', 'sunshet', 'rnarkre'])
+@pytest.mark.parametrize('max_dist', [1, 2])
+def test_top_k_engines_agree(trie_processor, word, max_dist):
+  trie_processor.add_word('marker', 5)
+  fast = TrieFuzzySearcher(trie_processor, engine='bitparallel')
+  dp = TrieFuzzySearcher(trie_processor, engine='dp')
+  assert fast.search_top_k(word, 3, max_dist) == dp.search_top_k(word, 3, max_dist)
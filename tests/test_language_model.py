@@ -0,0 +1,45 @@
+import struct
+
+import pytest
+
+from models.language_model import BackoffNGramModel, NGramLanguageModel, _BACKOFF_HEADER
+
+CORPUS = "the cat sat on the mat\nthe dog sat on the log\n"
+
+def test_freeze_drops_raw_counts():
+  lm = BackoffNGramModel(order=3)
+  lm.update(CORPUS)
+  lm.freeze()
+  assert lm._ngrams is None and lm._ctx_totals is None
+  with pytest.raises(ValueError):
+    lm.update("the cat ran")
+
+def test_keep_counts_allows_update_after_freeze():
+  lm = BackoffNGramModel(order=3, keep_counts=True)
+  lm.update(CORPUS)
+  before = lm.logprob_context(['on', 'the'], 'mat')
+  lm.update("on the mat\n")
+  assert lm.logprob_context(['on', 'the'], 'mat') > before
+
+def test_saved_arrays_are_8_byte_aligned(tmp_path):
+  lm = BackoffNGramModel(order=3)
+  lm.update(CORPUS)
+  path = tmp_path / 'model.bin'
+  lm.save(str(path))
+  data = path.read_bytes()
+  vocab_len = _BACKOFF_HEADER.unpack_from(data, 0)[-1]
+  start = _BACKOFF_HEADER.size + vocab_len
+  start += -start % 8
+  assert struct.unpack_from('<q', data, start)[0] == lm.V
+  loaded = BackoffNGramModel.load(str(path))
+  assert loaded.logprob_context(['on', 'the'], 'mat') == lm.logprob_context(['on', 'the'], 'mat')
+
+def test_bigram_updates_match_one_update():
+  whole = NGramLanguageModel()
+  whole.update(CORPUS)
+  pieces = NGramLanguageModel()
+  for line in CORPUS.splitlines(keepends=True):
+    pieces.update(line)
+  assert pieces.bigrams == whole.bigrams
+  assert pieces.context_totals == whole.context_totals
+  assert pieces.unigrams == whole.unigrams
@@ -0,0 +1,32 @@
+import pytest
+
+from processors.restore_service import RestoreService
+from processors.trie_processor import TrieProcessor
+
+@pytest.fixture
+def service():
+  trie_processor = TrieProcessor()
+  for i in range(200):
+    trie_processor.add_word(f"word{i}")
+  trie_processor.add_word('cat', 5)
+  service = RestoreService(trie_processor, window=0, query_limits={'max_nodes': 50})
+  yield service
+  service.batcher.close()
+
+def test_batched_lookups_respect_query_limits(service):
+  status, response = service.handle('/match', {'patterns': ['w*****', 'c*t']})
+  assert status == 200
+  assert response['truncated'] == [{'pattern': 'w*****', 'reason': 'node_budget'}]
+  assert response['matches']['c*t'] == [('cat', 5)]
+
+def test_restore_reports_truncated_wildcards(service):
+  status, response = service.handle('/restore', {'text': 'the c*t and w*****'})
+  assert status == 200
+  assert response['restored'].startswith('the <cat>')
+  assert response['truncated'] == [{'pattern': 'w*****', 'reason': 'node_budget'}]
+
+def test_unknown_decoder_is_rejected(service):
+  service._vocab.lm = object()
+  status, response = service.handle('/context-restore', {'text': 'c*t', 'decoder': 'greedy'})
+  assert status == 400
+  assert 'decoder' in response['error']